@@ -0,0 +1,453 @@
+import os
+import socket
+import struct
+import subprocess
+import threading
+import time
+
+import config
+from metrics import ADB_COMMAND_SECONDS, ADB_COMMANDS, ADB_COALESCED
+
+
+# Maximum DATA chunk accepted by adbd in the sync protocol.
+SYNC_CHUNK_SIZE = 64 * 1024
+# Device states the ADB server reports in `adb devices`.
+DEVICE_STATES = ('device', 'offline', 'unauthorized', 'authorizing', 'connecting', 'bootloader',
+                 'recovery', 'sideload', 'rescue', 'host', 'unknown')
+# Host services that only read state; their results may be briefly cached.
+READ_ONLY_SERVICES = ('host:devices', 'host:devices-l', 'host:mdns:services')
+
+
+class AdbError(Exception):
+    """Raised when the ADB server (or the adb binary) reports a failure."""
+    pass
+
+
+def command_label(service):
+    """Metric label for a service: 'host:connect:1.2.3.4:5555' -> 'host:connect'."""
+    return ':'.join(service.split(':', 2)[:2])
+
+
+def _record(command, transport, start, outcome):
+    labels = {'command': command, 'transport': transport, 'outcome': outcome}
+    ADB_COMMAND_SECONDS.observe(time.perf_counter() - start, **labels)
+    ADB_COMMANDS.inc(**labels)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that have the same key.
+
+    The first caller runs the function; callers arriving while it is in
+    flight wait and receive the same result (or exception). With a `ttl`,
+    a successful result is also reused for that many seconds. invalidate()
+    drops cached results, and results of calls that were in flight at the
+    time are not cached.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._results = {}
+        self._generation = 0
+
+    def do(self, key, fn, ttl=0, label=None):
+        with self._lock:
+            cached = self._results.get(key)
+            if cached and cached[0] > time.monotonic():
+                ADB_COALESCED.inc(command=label or key, source='cached')
+                return cached[1]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                generation = self._generation
+
+        if not leader:
+            ADB_COALESCED.inc(command=label or key, source='shared')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if ttl and call.error is None and generation == self._generation:
+                    self._results[key] = (time.monotonic() + ttl, call.value)
+            call.done.set()
+
+    def invalidate(self):
+        with self._lock:
+            self._results.clear()
+            self._generation += 1
+
+
+class AdbClient:
+    """
+    Minimal client for the ADB server's host protocol.
+
+    Requests are sent straight to the ADB server socket (port 5037 by default)
+    instead of forking an `adb` client for every call. Each request is framed as
+    a 4-digit hex length followed by the service name, and the server answers
+    with OKAY/FAIL plus a length-prefixed payload.
+
+    The server closes host-service sockets after every reply, so connections are
+    single-use; the pool bounds how many of them can be open at the same time.
+    If the server cannot be reached, the client falls back to running the `adb`
+    binary, which also starts the server as a side effect.
+
+    Identical host requests made at the same time (thirty dashboards polling
+    the device list, repeated clicks on connect) share one call, so the load
+    on the server and the number of `adb` processes stay bounded however many
+    clients there are. Read-only results are reused for `query_cache_ttl`
+    seconds; any other host request clears them.
+    """
+
+    def __init__(self, host=None, port=None, timeout=None, pool_size=None, use_subprocess=None,
+                 query_cache_ttl=None):
+        self.host = host or config.ADB_SERVER_HOST
+        self.port = port or config.ADB_SERVER_PORT
+        self.timeout = timeout or config.ADB_SOCKET_TIMEOUT
+        self.use_subprocess = config.ADB_USE_SUBPROCESS if use_subprocess is None else use_subprocess
+        self.query_cache_ttl = config.ADB_QUERY_CACHE_TTL if query_cache_ttl is None else query_cache_ttl
+        self._pool = threading.BoundedSemaphore(pool_size or config.ADB_POOL_SIZE)
+        self._flights = SingleFlight()
+
+    # ------------------------------------------------------------------
+    # Wire protocol
+    # ------------------------------------------------------------------
+    def _connect(self, timeout=None):
+        return socket.create_connection((self.host, self.port), timeout=timeout or self.timeout)
+
+    @staticmethod
+    def _recv_exact(sock, size):
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise AdbError("ADB server closed the connection unexpectedly")
+            data += chunk
+        return data
+
+    @classmethod
+    def _send_request(cls, sock, service):
+        payload = service.encode('utf-8')
+        sock.sendall(b'%04x' % len(payload) + payload)
+        status = cls._recv_exact(sock, 4)
+        if status == b'OKAY':
+            return
+        if status == b'FAIL':
+            raise AdbError(cls._read_block(sock))
+        raise AdbError(f"Unexpected ADB server response: {status!r}")
+
+    @classmethod
+    def _read_block(cls, sock):
+        length = int(cls._recv_exact(sock, 4), 16)
+        return cls._recv_exact(sock, length).decode('utf-8', errors='replace')
+
+    def _host_query(self, service, timeout=None):
+        """Run a single host service and return its length-prefixed payload."""
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            with self._pool:
+                with self._connect(timeout) as sock:
+                    self._send_request(sock, service)
+                    payload = self._read_block(sock)
+            outcome = 'ok'
+            return payload
+        except AdbError:
+            outcome = 'fail'
+            raise
+        finally:
+            _record(command_label(service), 'socket', start, outcome)
+
+    @staticmethod
+    def _read_all(sock, deadline=None):
+        chunks = []
+        while True:
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout("timed out")
+                sock.settimeout(remaining)
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b''.join(chunks).decode('utf-8', errors='replace')
+            chunks.append(chunk)
+
+    def _device_query(self, serial, service, timeout=None):
+        """
+        Switch the connection to one device and run a device service (e.g. 'shell:...') until EOF.
+
+        `timeout` bounds the whole exchange, not just each read.
+        """
+        start = time.perf_counter()
+        deadline = time.monotonic() + (timeout or self.timeout)
+        outcome = 'error'
+        try:
+            with self._pool:
+                with self._connect(timeout) as sock:
+                    self._send_request(sock, f'host:transport:{serial}')
+                    self._send_request(sock, service)
+                    output = self._read_all(sock, deadline)
+            outcome = 'ok'
+            return output
+        except AdbError:
+            outcome = 'fail'
+            raise
+        finally:
+            _record(service.split(':', 1)[0], 'socket', start, outcome)
+
+    def _sync_send(self, serial, local_path, remote_path, mode=0o644, timeout=None, progress=None):
+        """
+        Upload a file with the sync protocol: SEND <path>,<mode>, DATA chunks, DONE <mtime>.
+
+        Returns the number of bytes sent. `progress(sent, total)` is called
+        after every chunk.
+        """
+        start = time.perf_counter()
+        outcome = 'error'
+        total = os.path.getsize(local_path)
+        sent = 0
+        try:
+            with self._pool:
+                with self._connect(timeout) as sock:
+                    self._send_request(sock, f'host:transport:{serial}')
+                    self._send_request(sock, 'sync:')
+                    spec = f"{remote_path},{0o100000 | mode}".encode('utf-8')
+                    sock.sendall(b'SEND' + struct.pack('<I', len(spec)) + spec)
+                    with open(local_path, 'rb') as f:
+                        while True:
+                            chunk = f.read(SYNC_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            sock.sendall(b'DATA' + struct.pack('<I', len(chunk)) + chunk)
+                            sent += len(chunk)
+                            if progress:
+                                progress(sent, total)
+                    sock.sendall(b'DONE' + struct.pack('<I', int(time.time())))
+                    status, length = struct.unpack('<4sI', self._recv_exact(sock, 8))
+                    if status == b'FAIL':
+                        raise AdbError(self._recv_exact(sock, length).decode('utf-8', errors='replace'))
+                    if status != b'OKAY':
+                        raise AdbError(f"Unexpected sync response: {status!r}")
+                    sock.sendall(b'QUIT' + struct.pack('<I', 0))
+            outcome = 'ok'
+            return sent
+        except AdbError:
+            outcome = 'fail'
+            raise
+        finally:
+            _record('sync:send', 'socket', start, outcome)
+
+    def _run_cli(self, args, timeout=None, command=None):
+        """Fallback path: run the adb binary against the same server."""
+        start = time.perf_counter()
+        command = command or f"cli:{args[0]}"
+        try:
+            result = subprocess.run(
+                ['adb', '-H', self.host, '-P', str(self.port)] + args,
+                capture_output=True,
+                text=True,
+                check=True,
+                timeout=timeout or self.timeout * 6
+            )
+        except subprocess.CalledProcessError as e:
+            _record(command, 'cli', start, 'fail')
+            raise AdbError((e.stderr or e.stdout or '').strip() or f"adb exited with code {e.returncode}")
+        except (OSError, subprocess.TimeoutExpired) as e:
+            _record(command, 'cli', start, 'error')
+            raise AdbError(str(e))
+        _record(command, 'cli', start, 'ok')
+        return result.stdout
+
+    def host_command(self, service, cli_args, timeout=None):
+        """
+        Run a host service over the socket, falling back to the adb binary.
+
+        Concurrent calls for the same service share one request (see SingleFlight).
+
+        Args:
+            service (str): Host service name, e.g. 'host:devices-l'.
+            cli_args (list): Equivalent `adb` arguments for the fallback path.
+            timeout (float): Optional per-call timeout in seconds.
+
+        Returns:
+            str: The payload returned by the server.
+        """
+        read_only = service in READ_ONLY_SERVICES
+        try:
+            return self._flights.do(
+                service,
+                lambda: self._host_command(service, cli_args, timeout),
+                self.query_cache_ttl if read_only else 0,
+                command_label(service)
+            )
+        finally:
+            if not read_only:
+                # connect/disconnect change what the cached listings would say.
+                self._flights.invalidate()
+
+    def _host_command(self, service, cli_args, timeout):
+        if not self.use_subprocess:
+            try:
+                return self._host_query(service, timeout)
+            except ConnectionRefusedError as e:
+                print(f"ADB server socket unavailable ({e}), falling back to adb binary")
+            except (OSError, socket.timeout) as e:
+                raise AdbError(f"ADB server request '{service}' failed: {e}")
+        return self._run_cli(cli_args, timeout, command_label(service))
+
+    # ------------------------------------------------------------------
+    # Host services
+    # ------------------------------------------------------------------
+    def devices(self):
+        """
+        Return the devices known to the ADB server.
+
+        Returns:
+            list: One dict per device with 'serial', 'state' and any
+                  'key:value' attributes reported by `devices -l`.
+        """
+        output = self.host_command('host:devices-l', ['devices', '-l'])
+        return parse_devices_output(output)
+
+    def devices_output(self):
+        """Return the device list in the same text format as `adb devices`."""
+        return format_devices_output(self.devices())
+
+    def connect(self, address, timeout=None):
+        return self.host_command(f'host:connect:{address}', ['connect', address], timeout).strip()
+
+    def disconnect(self, address='', timeout=None):
+        args = ['disconnect', address] if address else ['disconnect']
+        return self.host_command(f'host:disconnect:{address}', args, timeout).strip()
+
+    def mdns_services(self):
+        return self.host_command('host:mdns:services', ['mdns', 'services'])
+
+    # ------------------------------------------------------------------
+    # Device services
+    # ------------------------------------------------------------------
+    def shell(self, serial, command, timeout=None):
+        """
+        Run a shell command on one device and return its output.
+
+        Args:
+            serial (str): Device serial or ip:port.
+            command (str): Command line passed to the device shell.
+            timeout (float): Optional limit in seconds for the whole command.
+        """
+        if not self.use_subprocess:
+            try:
+                return self._device_query(serial, f'shell:{command}', timeout)
+            except ConnectionRefusedError as e:
+                print(f"ADB server socket unavailable ({e}), falling back to adb binary")
+            except (OSError, socket.timeout) as e:
+                raise AdbError(f"Shell on {serial} failed: {e}")
+        return self._run_cli(['-s', serial, 'shell', command], timeout, 'shell')
+
+    def tcpip(self, serial, port, timeout=None):
+        """Restart a device's adbd listening on TCP `port` (like `adb -s <serial> tcpip <port>`)."""
+        if not self.use_subprocess:
+            try:
+                return self._device_query(serial, f'tcpip:{int(port)}', timeout).strip()
+            except ConnectionRefusedError as e:
+                print(f"ADB server socket unavailable ({e}), falling back to adb binary")
+            except (OSError, socket.timeout) as e:
+                raise AdbError(f"tcpip on {serial} failed: {e}")
+        return self._run_cli(['-s', serial, 'tcpip', str(int(port))], timeout, 'tcpip').strip()
+
+    def push(self, serial, local_path, remote_path, mode=0o644, timeout=None, progress=None):
+        """
+        Copy a local file to a device.
+
+        Args:
+            timeout (float): Limit for connecting and for each chunk written.
+            progress (callable): Called as progress(bytes_sent, total_bytes).
+
+        Returns:
+            int: Bytes transferred.
+        """
+        if not self.use_subprocess:
+            try:
+                return self._sync_send(serial, local_path, remote_path, mode, timeout, progress)
+            except ConnectionRefusedError as e:
+                print(f"ADB server socket unavailable ({e}), falling back to adb binary")
+            except (OSError, socket.timeout) as e:
+                raise AdbError(f"Push to {serial} failed: {e}")
+        total = os.path.getsize(local_path)
+        # The binary reports no progress; allow roughly 1 MB/s before giving up.
+        self._run_cli(['-s', serial, 'push', local_path, remote_path],
+                      max(timeout or self.timeout, total / 1_000_000), 'sync:send')
+        if progress:
+            progress(total, total)
+        return total
+
+    def track_devices(self):
+        """
+        Subscribe to the server's device tracker.
+
+        Yields the full device list (as parsed dicts) once immediately and again
+        every time the server reports a change. The generator ends when the
+        server closes the connection; callers are expected to reconnect.
+        """
+        sock = self._connect()
+        try:
+            try:
+                self._send_request(sock, 'host:track-devices-l')
+            except AdbError:
+                # Older servers only know the short form.
+                sock.close()
+                sock = self._connect()
+                self._send_request(sock, 'host:track-devices')
+            # The tracker is long-lived; only the initial handshake is time-bounded.
+            sock.settimeout(None)
+            while True:
+                yield parse_devices_output(self._read_block(sock))
+        finally:
+            sock.close()
+
+
+def parse_devices_output(output):
+    """Parse `adb devices -l` / `host:devices-l` text into device dicts."""
+    devices = []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line or line.startswith('List of devices') or line.startswith('*'):
+            continue
+        parts = line.split()
+        if len(parts) < 2:
+            continue
+        device = {'serial': parts[0], 'state': parts[1]}
+        for attr in parts[2:]:
+            if ':' in attr:
+                key, value = attr.split(':', 1)
+                device[key] = value
+        devices.append(device)
+    return devices
+
+
+def format_devices_output(devices):
+    """Render device dicts back into the classic `adb devices` text."""
+    lines = [f"{d['serial']}\t{d['state']}" for d in devices]
+    return "List of devices attached\n" + "\n".join(lines)
+
+
+# Shared client used by the Flask routes.
+adb = AdbClient()
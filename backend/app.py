@@ -2,17 +2,35 @@ import os
 import subprocess
 import json
 import threading
+import queue
+import itertools
 import time
-import re
-import requests
 import socket
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, stream_with_context, g
 from flask_cors import CORS
 
 # This should be the very first import to ensure environment variables are loaded.
 import config
 
 from process_manager import ProcessManager
+from adb_client import adb, AdbError, format_devices_output, DEVICE_STATES
+from device_registry import device_registry
+from device_properties import property_cache
+from device_scheduler import device_scheduler, INTERACTIVE, BULK
+from ip_ranges import get_matcher, RangeMatcher, extract_ip
+from scanner import iter_scan
+from device_ops import (run_bulk, iter_bulk, connect_one, disconnect_one, shell_operation, tcpip_operation,
+                        is_usb_device, format_results)
+from mdns import mdns_cache, ADB_SERVICE
+from reconciler import reconciler
+from health_monitor import health_monitor
+from federation import federation
+from deploy import store_artifact, get_artifact, list_artifacts, deploy_operation, deploy_cache
+from jobs import job_manager, run_command
+from scrcpy_cluster import ScrcpyCluster
+from state_store import state_store
+from versioned_listing import VersionedListing
+from metrics import registry as metrics_registry, HTTP_REQUEST_SECONDS, SCRIPT_SECONDS
 
 app = Flask(__name__)
 
@@ -24,8 +42,84 @@ WS_SCRCPY_PATH = os.path.join(os.getcwd(), "ws-scrcpy")
 
 CORS(app, origins=cors_origins, supports_credentials=True)
 
-# Initialize process manager
-process_manager = ProcessManager()
+# Initialize process manager (registrations are shared with the other workers)
+process_manager = ProcessManager(store=state_store)
+
+# ws-scrcpy instances (one by default) and their device routing
+scrcpy_cluster = ScrcpyCluster(process_manager, WS_SCRCPY_PATH)
+
+# mDNS services are discovered in the background; requests read the cache
+mdns_cache.start()
+
+# Reconnect known devices on startup and keep connections in line with DEVICES_RANGE
+if config.RECONCILE_INTERVAL > 0:
+    reconciler.start()
+
+# Probe TCP/IP devices continuously and reconnect them when adbd is reachable
+if config.HEALTH_MONITOR_ENABLED:
+    health_monitor.start()
+
+
+# Metrics
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            # The rule ('/jobs/<job_id>'), not the path, keeps label cardinality bounded.
+            route=request.url_rule.rule if request.url_rule else 'unmatched',
+            status=response.status_code
+        )
+    return response
+
+
+def device_state_counts():
+    counts = {}
+    for device in device_registry.snapshot()[1]:
+        counts[device['state']] = counts.get(device['state'], 0) + 1
+    return [({'state': state}, count) for state, count in counts.items()]
+
+
+def device_health_counts():
+    counts = {}
+    for entry in device_registry.get_health().values():
+        counts[entry['status']] = counts.get(entry['status'], 0) + 1
+    return [({'status': status}, count) for status, count in counts.items()]
+
+
+def process_metric(field):
+    def collect():
+        return [
+            ({'process': name}, info.get(field))
+            for name, info in process_manager.get_all_processes().items()
+            if info
+        ]
+    return collect
+
+
+metrics_registry.gauge('magdroid_devices', 'Devices known to the ADB server, by state.', ('state',),
+                       callback=device_state_counts)
+metrics_registry.gauge('magdroid_device_health', 'TCP/IP devices by health monitor status.', ('status',),
+                       callback=device_health_counts)
+metrics_registry.gauge('magdroid_process_running', 'Whether a managed process is running.', ('process',),
+                       callback=lambda: [(labels, int(bool(v))) for labels, v in process_metric('running')()])
+metrics_registry.gauge('magdroid_process_uptime_seconds', 'Uptime of managed processes.', ('process',),
+                       callback=process_metric('uptime'))
+metrics_registry.gauge('magdroid_process_restarts', 'Supervisor restarts of managed processes.', ('process',),
+                       callback=process_metric('restarts'))
+metrics_registry.gauge('magdroid_scheduler_running', 'adb operations running, by priority class.', ('priority',),
+                       callback=lambda: [({'priority': p}, n) for p, n in device_scheduler.status()['running'].items()])
+metrics_registry.gauge('magdroid_scheduler_queued', 'adb operations waiting, by priority class.', ('priority',),
+                       callback=lambda: [({'priority': p}, n) for p, n in device_scheduler.status()['queued'].items()])
+metrics_registry.gauge('magdroid_jobs_active', 'Background jobs queued or running.',
+                       callback=lambda: [({}, sum(1 for job in job_manager.jobs.values() if not job.done))])
 
 
 
@@ -45,23 +139,192 @@ def index():
 def health_check():
     return jsonify({"status": "healthy"}), 200
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# Versioned listings
+listings = {}
+
+
+def get_listing(name):
+    if name not in listings:
+        listings[name] = VersionedListing(name)
+    return listings[name]
+
+
+def listing_response(listing, items, full_payload):
+    """
+    Conditional, versioned JSON response for a keyed listing.
+
+    The ETag identifies the listing version (and the ?since cursor), so a
+    client sending it back in If-None-Match gets a bodiless 304 while nothing
+    changed. With ?since=<version> only the items changed after that version
+    (plus removed keys) are returned; otherwise `full_payload(version)` builds
+    the regular response.
+    """
+    version, content = listing.update(items)
+    since = request.args.get('since', type=int)
+    tag = f"{listing.name}-{version}-{content[:16]}" + (f"-since-{since}" if since is not None else "")
+
+    if request.if_none_match.contains(tag):
+        response = Response(status=304)
+    elif since is not None:
+        response = jsonify({"status": "success", **listing.changes(since)})
+    else:
+        response = jsonify({**full_payload(version), "version": version})
+    response.set_etag(tag)
+    # Clients may cache but must revalidate every time.
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Job Endpoints
+def wants_async():
+    return request.args.get('async', 'false').lower() in ('1', 'true', 'yes')
+
+
+def run_job(kind, fn, key=None, params=None):
+    """
+    Run `fn` as a background job.
+
+    With '?async=1' the job id is returned immediately (202) and the client can
+    poll /jobs/<id> or stream /jobs/<id>/stream. Otherwise the request waits for
+    the job and returns its result, so existing clients keep working. Identical
+    requests (same key) share a single run either way.
+    """
+    job, created = job_manager.submit(kind, fn, key=key, params=params)
+    if wants_async():
+        return jsonify({
+            "status": "accepted",
+            "output": f"Job {job.id} {'started' if created else 'is already running'}.",
+            "details": f"Poll /jobs/{job.id} or stream /jobs/{job.id}/stream for progress.",
+            "job_id": job.id,
+            "job": job.to_dict()
+        }), 202
+    job.wait()
+    payload, code = job.result
+    return jsonify(payload), code
+
+
+def script_job(script):
+    """Build a job function that runs one of the scripts in ./scripts."""
+    def run(job):
+        with SCRIPT_SECONDS.time(script=os.path.basename(script), outcome='error') as labels:
+            returncode, output = run_command(
+                job,
+                [script],
+                cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            labels['outcome'] = 'ok' if returncode == 0 else 'fail'
+        return {
+            "status": "success",
+            "output": output,
+            "details": f"Script exited with code {returncode}"
+        }, 200
+    return run
+
+
+@app.route('/jobs')
+def list_jobs():
+    return jsonify({
+        "status": "success",
+        "jobs": job_manager.list()
+    })
+
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Job status plus the output lines after '?since=<offset>'."""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "output": f"Job {job_id} not found."}), 404
+    return jsonify({
+        "status": "success",
+        "job": job.to_dict(since=request.args.get('since', 0, type=int))
+    })
+
+
+@app.route('/jobs/<job_id>/stream')
+def stream_job(job_id):
+    """Streams a job's output as NDJSON lines, ending with its final status."""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "output": f"Job {job_id} not found."}), 404
+    offset = request.args.get('since', 0, type=int)
+
+    def generate():
+        nonlocal offset
+        while True:
+            job.wait_for_output(offset, timeout=15)
+            lines, offset = job.lines_since(offset)
+            for line in lines:
+                yield json.dumps({"type": "output", "line": line}) + "\n"
+            if job.done and offset >= len(job.lines):
+                break
+        yield json.dumps({"type": "done", "job": job.to_dict()}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 # ADB Endpoints
+def assign_tcpip_job(job, port, max_workers=None):
+    """
+    Enable TCP/IP on USB devices and connect them over Wi-Fi, in parallel.
+
+    Never restarts the ADB server and only touches USB devices, so existing
+    TCP sessions and scrcpy streams are not interrupted.
+    """
+    devices_range_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
+    devices = device_registry.get_devices()
+    candidates = [d['serial'] for d in devices if d['state'] == 'device' and is_usb_device(d)]
+    connected = [d['serial'] for d in devices if d['state'] == 'device' and not is_usb_device(d)]
+
+    job.log(f"Using IP Range: {devices_range_str}")
+    job.log(f"{len(candidates)} USB device(s) found, {len(connected)} already on TCP/IP.")
+    if not candidates:
+        return {
+            "status": "success",
+            "output": "No USB devices to switch to TCP/IP.",
+            "details": "Nothing to do",
+            "results": []
+        }, 200
+
+    start = time.monotonic()
+    results = []
+    operation = tcpip_operation(port, devices_range_str, connected)
+    for result in iter_bulk(operation, candidates, max_workers=max_workers):
+        results.append(result)
+        mark = "✔" if result["ok"] else "✖"
+        job.log(f"{mark} {result['device']} ({result['latency_ms']} ms) {result['output']}")
+
+    succeeded = sum(1 for r in results if r["ok"])
+    return {
+        "status": "success" if succeeded == len(results) else "partial",
+        "output": format_results("Assign TCP/IP", results),
+        "details": f"{succeeded}/{len(results)} device(s) on TCP/IP in {round((time.monotonic() - start) * 1000, 1)} ms",
+        "results": results
+    }, 200
+
+
 @app.route('/assign_tcpip')
 def assign_tcpip():
+    """
+    Switch USB devices to TCP/IP and connect them.
+
+    Query params:
+        port (int): TCP port for adbd (default ADB_TCP_PORT).
+        max_workers (int): Devices handled at once.
+    """
     try:
-        # Execute the assign_tcpip.sh script
-        result = subprocess.run(
-            ['./scripts/assign_tcpip.sh'],
-            capture_output=True,
-            text=True,
-            cwd=os.path.dirname(os.path.abspath(__file__))
+        device_registry.start()
+        port = request.args.get('port', config.ADB_TCP_PORT, type=int)
+        max_workers = request.args.get('max_workers', type=int)
+        return run_job(
+            'assign_tcpip',
+            lambda job: assign_tcpip_job(job, port, max_workers),
+            key=f'assign_tcpip:{port}'
         )
-        
-        return jsonify({
-            "status": "success",
-            "output": result.stdout,
-            "details": f"Script exited with code {result.returncode}"
-        })
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -72,63 +335,102 @@ def assign_tcpip():
 @app.route('/get_adb_devices')
 def get_adb_devices():
     """
-    Executes 'adb devices' and filters the output based on the DEVICES_RANGE environment variable.
+    Lists devices from the live device registry and filters them based on the DEVICES_RANGE environment variable.
     This ensures that only devices within the specified IP range(s) are returned to the frontend.
     """
     try:
-        # Execute adb devices command
-        result = subprocess.run(
-            ['adb', 'devices'],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
+        device_registry.start()
+
         # Get the allowed IP range from environment variables, with a default.
         devices_range_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
-        
-        # Parse the raw output from 'adb devices'.
-        raw_output = result.stdout.strip()
-        lines = raw_output.split('\n')
-        
-        # The first line is always "List of devices attached", so we skip it.
-        device_lines = lines[1:]
-        
-        # Filter devices based on the IP range.
-        filtered_devices = []
-        for line in device_lines:
-            if not line.strip():
-                continue
-                
-            # Device ID is the first part of the line.
-            device_id = line.split('\t')[0]
-            
-            # Extract the IP address from the device ID (e.g., '192.168.1.10:5555').
-            # This regex ensures we only match IP-based devices, not USB ones.
-            match = re.match(r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})', device_id)
-            
-            if match:
-                ip = match.group(1)
-                # If the IP is in one of the allowed ranges, keep the device.
-                if is_ip_in_range(ip, devices_range_str):
-                    filtered_devices.append(line)
-            else:
-                # Keep non-IP devices (e.g., USB devices) as they are not subject to IP filtering.
-                filtered_devices.append(line)
 
-        # Reconstruct the output string with only the authorized devices.
-        filtered_output = "List of devices attached\n" + "\n".join(filtered_devices)
-        
+        devices = filter_devices_in_range(device_registry.get_devices(), devices_range_str)
+
+        return listing_response(
+            get_listing('adb_devices'),
+            {device['serial']: device for device in devices},
+            lambda version: {
+                "status": "success",
+                "output": format_devices_output(devices),
+                "details": f"Found {len(devices)} authorized device(s)"
+            }
+        )
+    except AdbError as e:
         return jsonify({
-            "status": "success",
-            "output": filtered_output,
-            "details": f"Command exited with code {result.returncode}"
-        })
-    except subprocess.CalledProcessError as e:
+            "status": "error",
+            "output": str(e),
+            "details": "ADB command failed"
+        }), 500
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "output": "An unexpected error occurred.",
+            "details": str(e)
+        }), 500
+
+
+@app.route('/devices')
+def list_devices():
+    """
+    Structured device list: `adb devices -l` attributes plus cached system properties.
+
+    Properties (model, Android version, battery, Wi-Fi IP, ...) come from a
+    TTL cache filled by one batched shell call per device, so a large fleet
+    loads in a single response.
+
+    Query params:
+        refresh (bool): Re-fetch properties for every listed device.
+        wait (float): Seconds to wait for devices with nothing cached yet.
+        state (str): Only return devices in this state (e.g. 'device').
+    """
+    try:
+        device_registry.start()
+        property_cache.start(device_registry)
+
+        devices_range_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
+        state = request.args.get('state')
+        # Each state gets its own stored listing, so only real adb states are accepted.
+        if state and state not in DEVICE_STATES:
+            return jsonify({
+                "status": "error",
+                "output": f"Unknown device state '{state}'.",
+                "details": f"Use one of: {', '.join(DEVICE_STATES)}."
+            }), 400
+        devices = filter_devices_in_range(device_registry.get_devices(), devices_range_str)
+        if state:
+            devices = [d for d in devices if d['state'] == state]
+
+        entries = property_cache.get_many(
+            [d['serial'] for d in devices if d['state'] == 'device'],
+            wait=request.args.get('wait', type=float),
+            force=request.args.get('refresh', 'false').lower() in ('1', 'true', 'yes')
+        )
+        result = []
+        for device in devices:
+            entry = entries.get(device['serial'])
+            result.append({
+                **device,
+                "ip": extract_ip(device['serial']),
+                "properties": entry['properties'] if entry else None,
+                "properties_error": entry['error'] if entry else None
+            })
+
+        # Each state filter is its own listing so filtered and unfiltered pollers don't churn versions.
+        return listing_response(
+            get_listing(f"devices:{state}" if state else 'devices'),
+            {device['serial']: device for device in result},
+            lambda version: {
+                "status": "success",
+                "devices": result,
+                "count": len(result),
+                "details": f"Found {len(result)} authorized device(s)"
+            }
+        )
+    except AdbError as e:
         return jsonify({
             "status": "error",
-            "output": e.stderr,
-            "details": f"ADB command failed with exit code {e.returncode}"
+            "output": str(e),
+            "details": "ADB command failed"
         }), 500
     except Exception as e:
         return jsonify({
@@ -138,6 +440,98 @@ def get_adb_devices():
         }), 500
 
 
+@app.route('/devices/health')
+def get_device_health():
+    """
+    Health monitor view of the TCP/IP devices in DEVICES_RANGE.
+
+    Query params:
+        status (str): Only devices with this status ('healthy', 'degraded' or 'down').
+    """
+    try:
+        devices_range_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
+        wanted = request.args.get('status')
+        health = {
+            serial: entry for serial, entry in device_registry.get_health().items()
+            if is_ip_in_range(extract_ip(serial) or '', devices_range_str) and (not wanted or entry['status'] == wanted)
+        }
+        counts = {}
+        for entry in health.values():
+            counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        return jsonify({
+            "status": "success",
+            "output": health,
+            "details": ", ".join(f"{count} {status}" for status, count in sorted(counts.items())) or "No devices monitored",
+            "counts": counts
+        })
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "output": "An unexpected error occurred.",
+            "details": str(e)
+        }), 500
+
+
+@app.route('/devices/stream')
+def stream_devices():
+    """
+    Server-Sent Events stream of device changes.
+
+    Sends one 'snapshot' event with the current authorized devices, followed by
+    'connected', 'disconnected' and 'state' events as the ADB server reports them,
+    and 'health' events when the health monitor sees a device's status change.
+    """
+    device_registry.start()
+    devices_range_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
+    subscriber = device_registry.subscribe()
+
+    def generate():
+        try:
+            version, devices = device_registry.snapshot()
+            snapshot = {
+                "type": "snapshot",
+                "version": version,
+                "devices": filter_devices_in_range(devices, devices_range_str)
+            }
+            yield f"event: snapshot\ndata: {json.dumps(snapshot)}\n\n"
+
+            while True:
+                try:
+                    event = subscriber.get(timeout=15)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream.
+                    yield ": keep-alive\n\n"
+                    continue
+
+                ip = extract_ip(event['serial'])
+                if ip and not is_ip_in_range(ip, devices_range_str):
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            device_registry.unsubscribe(subscriber)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def filter_devices_in_range(devices, ranges_str):
+    """
+    Keep the devices that this instance is allowed to see.
+
+    IP-based devices are kept only if their IP is within one of the ranges.
+    Non-IP devices (e.g., USB devices) are not subject to IP filtering.
+    """
+    filtered_devices = []
+    for device in devices:
+        ip = extract_ip(device['serial'])
+        if ip is None or is_ip_in_range(ip, ranges_str):
+            filtered_devices.append(device)
+    return filtered_devices
+
+
 def is_ip_in_range(ip, ranges_str):
     """
     Checks if a given IP address is within any of the specified ranges.
@@ -149,42 +543,9 @@ def is_ip_in_range(ip, ranges_str):
     Returns:
         bool: True if the IP is in any range, False otherwise.
     """
-    import ipaddress
-
-    try:
-        ip_addr = ipaddress.ip_address(ip)
-    except ValueError:
-        # If the IP is invalid, it can't be in any valid range.
-        return False
-
-    for r in ranges_str.split(','):
-        r = r.strip()
-        if not r:
-            continue
-            
-        try:
-            # Handle CIDR format (e.g., "192.168.1.0/24")
-            if '/' in r:
-                net = ipaddress.ip_network(r, strict=False)
-                if ip_addr in net:
-                    return True
-            
-            # Handle range format (e.g., "192.168.1.40-192.168.1.45")
-            elif '-' in r:
-                start_ip, end_ip = r.split('-')
-                if ipaddress.ip_address(start_ip) <= ip_addr <= ipaddress.ip_address(end_ip):
-                    return True
-            
-            # Handle single IP format
-            else:
-                if ip_addr == ipaddress.ip_address(r):
-                    return True
-        except ValueError:
-            # Silently ignore malformed ranges in the config.
-            # You might want to log this in a real application.
-            continue
-            
-    return False
+    # The ranges string is compiled once into a sorted interval index and
+    # only rebuilt when its value changes.
+    return get_matcher(ranges_str).contains(ip)
 
 def is_port_available(port):
     """Check if a port is available."""
@@ -195,6 +556,17 @@ def is_port_available(port):
         except OSError:
             return False
 
+def wait_for_port_free(port, timeout=5):
+    """Wait until a port can be bound again, probing with exponential backoff."""
+    deadline = time.time() + timeout
+    delay = 0.01
+    while not is_port_available(port):
+        if time.time() >= deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+    return True
+
 def kill_process_on_port(port):
     """Find and kill the process using the specified port."""
     try:
@@ -222,49 +594,51 @@ def kill_process_on_port(port):
 
 @app.route('/get_mdns_services')
 def get_mdns_services():
-    try:
-        # Execute adb mdns services command
-        result = subprocess.run(
-            ['adb', 'mdns', 'services'],
-            capture_output=True,
-            text=True,
-            check=True
-        )
+    """
+    ADB services advertised over mDNS inside DEVICES_RANGE, from the mDNS cache.
 
+    Query params:
+        all (bool): Include every service type, not only '_adb._tcp'.
+    """
+    try:
         devices_range_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
-        
-        # Parse and filter the output
-        raw_output = result.stdout.strip()
-        lines = raw_output.split('\n')
-        
-        filtered_lines = []
-        for line in lines:
-            if not line.strip() or "_adb._tcp." not in line:
-                continue
-
-            # The IP address is the third field in the output
-            parts = line.split()
-            if len(parts) >= 3:
-                # The IP can be in the format '192.168.1.10:5555'
-                ip_part = parts[2]
-                ip_match = re.match(r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})', ip_part)
-                if ip_match:
-                    ip = ip_match.group(1)
-                    if is_ip_in_range(ip, devices_range_str):
-                        filtered_lines.append(line)
-
-        filtered_output = "\n".join(filtered_lines).strip()
-
-        return jsonify({
-            "status": "success",
-            "output": filtered_output if filtered_output else "No Serives Found In Mdns",
-            "details": f"Command exited with code {result.returncode}"
-        })
-    except subprocess.CalledProcessError as e:
+        all_types = request.args.get('all', 'false').lower() in ('1', 'true', 'yes')
+        entries = [
+            entry for entry in mdns_cache.services(service=None if all_types else ADB_SERVICE)
+            if is_ip_in_range(entry['ip'], devices_range_str)
+        ]
+
+        services = {}
+        lines = []
+        for entry in entries:
+            line = f"{entry['name']}\t{entry['service']}.\t{entry['address']}"
+            lines.append(line)
+            # Only the stable fields, so refreshes alone do not bump the listing version.
+            services[f"{entry['name']} {entry['service']}"] = {
+                "name": entry['name'],
+                "service": entry['service'],
+                "ip": entry['ip'],
+                "port": entry['port'],
+                "address": entry['address'],
+                "line": line
+            }
+
+        return listing_response(
+            get_listing('mdns_services_all' if all_types else 'mdns_services'),
+            services,
+            lambda version: {
+                "status": "success",
+                "output": "\n".join(lines) if lines else "No Serives Found In Mdns",
+                "details": f"Found {len(lines)} authorized service(s)",
+                "services": entries,
+                "refreshed_at": mdns_cache.refreshed_at
+            }
+        )
+    except AdbError as e:
         return jsonify({
             "status": "error",
-            "output": e.stderr,
-            "details": f"ADB command failed with exit code {e.returncode}"
+            "output": str(e),
+            "details": "ADB command failed"
         }), 500
     except Exception as e:
         return jsonify({
@@ -273,22 +647,104 @@ def get_mdns_services():
             "details": str(e)
         }), 500
 
+@app.route('/scan')
+def scan_network():
+    """
+    Sweeps DEVICES_RANGE for open ADB ports and streams the results as NDJSON.
+
+    Query params:
+        port (int): TCP port to probe (default ADB_TCP_PORT).
+        timeout (float): Per-host connect timeout in seconds.
+        concurrency (int): Maximum number of connects in flight.
+        connect (bool): Also run 'adb connect' for every device found.
+    """
+    try:
+        port = request.args.get('port', type=int)
+        timeout = request.args.get('timeout', type=float)
+        concurrency = request.args.get('concurrency', type=int)
+        auto_connect = request.args.get('connect', 'false').lower() in ('1', 'true', 'yes')
+        devices_range_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
+
+        if wants_async():
+            def run(job):
+                found = []
+                summary = {}
+                for result in iter_scan(devices_range_str, port=port, concurrency=concurrency, timeout=timeout):
+                    if result['type'] == 'found':
+                        if auto_connect:
+                            try:
+                                result['connect'] = connect_found(result['address'])
+                            except AdbError as e:
+                                result['connect'] = str(e)
+                        found.append(result)
+                    elif result['type'] == 'summary':
+                        summary = result
+                    job.log(json.dumps(result))
+                return {
+                    "status": "success",
+                    "output": "\n".join(r['address'] for r in found) or "No ADB devices found in scan.",
+                    "details": f"Scanned {summary.get('scanned', 0)} hosts in {summary.get('elapsed', 0)}s",
+                    "results": found,
+                    "summary": summary
+                }, 200
+
+            return run_job('scan', run, key=f"scan:{devices_range_str}:{port}:{auto_connect}", params=dict(request.args))
+
+        results = iter_scan(devices_range_str, port=port, concurrency=concurrency, timeout=timeout)
+        # Surface range/limit errors as a normal JSON error before streaming starts.
+        first = next(results)
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "output": str(e),
+            "details": "Scan was not started."
+        }), 400
+
+    def generate():
+        for result in itertools.chain([first], results):
+            if result['type'] == 'found' and auto_connect:
+                try:
+                    result['connect'] = connect_found(result['address'])
+                except AdbError as e:
+                    result['connect'] = str(e)
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def connect_found(address):
+    """`adb connect` a device found by a LAN scan, behind any interactive work."""
+    return device_scheduler.run(address, lambda: adb.connect(address), BULK)
+
+
+def reconcile_job(job, full_scan):
+    summary = reconciler.reconcile(full_scan=full_scan, log=job.log)
+    return {
+        "status": "success" if not summary['failed'] else "partial",
+        "output": "\n".join(job.lines_since(0)[0]),
+        "details": (f"{summary['online']} device(s) online; {len(summary['connected'])} connected, "
+                    f"{len(summary['disconnected'])} disconnected, {len(summary['failed'])} unreachable"),
+        "summary": summary
+    }, 200
+
+
 @app.route('/connect_ip_devices')
 def connect_ip_devices():
+    """
+    Reconcile TCP/IP connections now: reconnect known devices, connect new
+    ones found over mDNS or a LAN sweep, and drop out-of-range ones.
+
+    Query params:
+        full_scan (bool): Sweep the LAN even if every known device reconnected (default true).
+    """
     try:
-        # Execute the connect_ip_devices.sh script
-        result = subprocess.run(
-            ['./scripts/connect_ip_devices.sh'],
-            capture_output=True,
-            text=True,
-            cwd=os.path.dirname(os.path.abspath(__file__))
+        full_scan = request.args.get('full_scan', 'true').lower() in ('1', 'true', 'yes')
+        device_registry.start()
+        return run_job(
+            'connect_ip_devices',
+            lambda job: reconcile_job(job, full_scan),
+            key='connect_ip_devices'
         )
-        
-        return jsonify({
-            "status": "success",
-            "output": result.stdout,
-            "details": f"Script exited with code {result.returncode}"
-        })
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -297,19 +753,28 @@ def connect_ip_devices():
         }), 500
 
 
+@app.route('/reconciler')
+def reconciler_status():
+    """Last reconcile pass and the known-device cache."""
+    return jsonify({
+        "status": "success",
+        **reconciler.status(),
+        "devices": reconciler.known.all()
+    })
+
+
 @app.route('/connect_device/<device_id>')
 def connect_device(device_id):
     try:
         # Extract IP from device_id, which might be in 'ip:port' format
-        ip_match = re.match(r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})', device_id)
-        if not ip_match:
+        ip_address = extract_ip(device_id)
+        if not ip_address:
             return jsonify({
                 "status": "error",
                 "output": "Invalid device ID format. Expected IP address.",
                 "details": "Device ID does not appear to be a valid IP address."
             }), 400
 
-        ip_address = ip_match.group(1)
         devices_range_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
 
         # Validate the IP address against the allowed range
@@ -320,46 +785,15 @@ def connect_device(device_id):
                 "details": "The device IP is outside the configured DEVICES_RANGE."
             }), 403
 
-        # Execute adb connect command
-        connect_result = subprocess.run(
-            ['adb', 'connect', device_id],
-            capture_output=True,
-            text=True
-        )
-
-        # Get updated device list and filter it
-        devices_result = subprocess.run(
-            ['adb', 'devices'],
-            capture_output=True,
-            text=True
-        )
-        
-        # This part is now handled by get_adb_devices, but for direct feedback we can filter here too
-        raw_output = devices_result.stdout.strip()
-        lines = raw_output.split('\n')
-        device_lines = lines[1:]
-        
-        filtered_devices = []
-        for line in device_lines:
-            if not line.strip():
-                continue
-            
-            # This logic is duplicated from get_adb_devices. Consider refactoring to a shared utility.
-            current_device_id = line.split('\t')[0]
-            match = re.match(r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})', current_device_id)
-            if match:
-                ip = match.group(1)
-                if is_ip_in_range(ip, devices_range_str):
-                    filtered_devices.append(line)
-            else:
-                filtered_devices.append(line)
+        connect_result = device_scheduler.run(device_id, lambda: adb.connect(device_id), INTERACTIVE)
 
-        filtered_output = "List of devices attached\n" + "\n".join(filtered_devices)
+        # Get updated device list and filter it for direct feedback
+        filtered_output = format_devices_output(filter_devices_in_range(adb.devices(), devices_range_str))
 
         return jsonify({
             "status": "success",
-            "output": f"Connect result:\n{connect_result.stdout}\n\nDevices list:\n{filtered_output}",
-            "details": f"Commands exited with codes {connect_result.returncode} and {devices_result.returncode}"
+            "output": f"Connect result:\n{connect_result}\n\nDevices list:\n{filtered_output}",
+            "details": "Connect command sent to the ADB server"
         })
     except Exception as e:
         return jsonify({
@@ -373,75 +807,64 @@ def connect_device(device_id):
 @app.route('/disconnect_all_devices')
 def disconnect_all_devices():
     try:
-        # Get the list of currently connected devices
-        devices_result = subprocess.run(
-            ['adb', 'devices'],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-
-        raw_output = devices_result.stdout.strip()
-        lines = raw_output.split('\n')
-        device_lines = lines[1:]
-
         devices_range_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
         
         disconnected_devices = []
         skipped_devices = []
 
         # Iterate over each device and decide whether to disconnect
-        for line in device_lines:
-            if not line.strip():
-                continue
-            
-            device_id = line.split('\t')[0]
-            ip_match = re.match(r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})', device_id)
+        targets = []
+        for device in adb.devices():
+            device_id = device['serial']
+            ip = extract_ip(device_id)
             
             # We only disconnect devices that are within the allowed range.
             # This prevents this instance from interfering with devices managed by other instances.
-            if ip_match:
-                ip = ip_match.group(1)
+            if ip:
                 if is_ip_in_range(ip, devices_range_str):
-                    subprocess.run(['adb', 'disconnect', device_id], capture_output=True, text=True)
-                    disconnected_devices.append(device_id)
+                    targets.append(device_id)
                 else:
                     skipped_devices.append(device_id)
             else:
                 # Assuming USB devices should not be disconnected by this logic.
                 skipped_devices.append(f"{device_id} (USB device)")
 
+        # Disconnects run concurrently on a bounded worker pool; a click on the dashboard
+        # is interactive, so it does not wait behind a running install.
+        results, _ = run_bulk(disconnect_one, targets, priority=INTERACTIVE)
+        for r in results:
+            if r['ok']:
+                disconnected_devices.append(r['device'])
+            else:
+                skipped_devices.append(f"{r['device']} (failed: {r['output']})")
+
 
         # Get final device list
-        final_devices_result = subprocess.run(
-            ['adb', 'devices'],
-            capture_output=True,
-            text=True
-        )
+        final_devices_output = adb.devices_output()
+
         output_message = ""
         if disconnected_devices:
             output_message += "Disconnected Devices:"
             for x in disconnected_devices: output_message += f"\n- {x}"
         else: output_message += "No Devices To Disconnect..."
 
-        skipped_devices = ""
         if skipped_devices:
             output_message += "\n\nSkipped Devices:"
             for x in skipped_devices: output_message += f"\n-{x}"
         else: output_message += "\n\nNo Devices Skipped..."
 
-        output_message += "\n\n" + final_devices_result.stdout.strip()
+        output_message += "\n\n" + final_devices_output
 
         return jsonify({
             "status": "success",
             "output": output_message,
             "details": "Disconnect command executed for devices within the allowed range."
         })
-    except subprocess.CalledProcessError as e:
+    except AdbError as e:
         return jsonify({
             "status": "error",
-            "output": e.stderr,
-            "details": f"ADB command failed with exit code {e.returncode}"
+            "output": str(e),
+            "details": "ADB command failed"
         }), 500
     except Exception as e:
         return jsonify({
@@ -451,60 +874,459 @@ def disconnect_all_devices():
         }), 500
 
 
+def resolve_bulk_targets(data, action):
+    """
+    Turn a bulk request body into a list of device addresses.
+
+    The body may contain a 'devices' list and/or a 'range' selector (same syntax
+    as DEVICES_RANGE). For 'connect', a range expands to every address in it on
+    'port'; for 'disconnect', it selects the currently connected devices in it.
+    A disconnect request with no selector targets every in-range IP device.
+
+    Returns:
+        tuple: (targets, rejected) where rejected devices are outside DEVICES_RANGE.
+    """
+    devices_range_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
+    devices = data.get('devices') or []
+    range_str = data.get('range')
+    port = int(data.get('port') or config.ADB_TCP_PORT)
+
+    if not isinstance(devices, list):
+        raise ValueError("'devices' must be a list of device addresses.")
+
+    candidates = [str(d).strip() for d in devices if str(d).strip()]
+    if range_str:
+        selector = RangeMatcher(range_str)
+        if action == 'connect':
+            if selector.size(4) > config.BULK_MAX_TARGETS:
+                raise ValueError(f"Range selects more than BULK_MAX_TARGETS ({config.BULK_MAX_TARGETS}) addresses.")
+            candidates += [f"{ip}:{port}" for ip in selector.addresses(4)]
+        else:
+            for device in adb.devices():
+                ip = extract_ip(device['serial'])
+                if ip and selector.contains(ip):
+                    candidates.append(device['serial'])
+    elif action == 'disconnect' and not candidates:
+        candidates = [d['serial'] for d in adb.devices() if extract_ip(d['serial'])]
+
+    if len(candidates) > config.BULK_MAX_TARGETS:
+        raise ValueError(f"Request selects more than BULK_MAX_TARGETS ({config.BULK_MAX_TARGETS}) devices.")
+
+    targets, rejected = [], []
+    for device_id in dict.fromkeys(candidates):
+        ip = extract_ip(device_id)
+        if ip and is_ip_in_range(ip, devices_range_str):
+            targets.append(device_id)
+        else:
+            rejected.append(device_id)
+    return targets, rejected
+
+
+def bulk_device_operation(action):
+    data = request.get_json(silent=True) or {}
+    try:
+        targets, rejected = resolve_bulk_targets(data, action)
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "output": str(e),
+            "details": "Invalid device selector."
+        }), 400
+
+    operation = connect_one if action == 'connect' else disconnect_one
+    results, summary = run_bulk(
+        operation,
+        targets,
+        max_workers=data.get('max_workers'),
+        timeout=data.get('timeout')
+    )
+    for device_id in rejected:
+        results.append({
+            "device": device_id,
+            "ok": False,
+            "output": "Not allowed: outside the configured DEVICES_RANGE.",
+            "latency_ms": 0.0
+        })
+    summary["rejected"] = len(rejected)
+
+    return jsonify({
+        "status": "success" if summary["failed"] == 0 and not rejected else "partial",
+        "output": format_results(action.capitalize(), results),
+        "details": f"{summary['succeeded']}/{summary['total']} succeeded in {summary['elapsed_ms']} ms",
+        "results": results,
+        "summary": summary
+    })
+
+
+@app.route('/devices/connect', methods=['POST'])
+def bulk_connect_devices():
+    """Connect many devices concurrently. See resolve_bulk_targets for the body format."""
+    try:
+        return bulk_device_operation('connect')
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "output": "",
+            "details": str(e)
+        }), 500
+
+
+@app.route('/devices/disconnect', methods=['POST'])
+def bulk_disconnect_devices():
+    """Disconnect many devices concurrently. See resolve_bulk_targets for the body format."""
+    try:
+        return bulk_device_operation('disconnect')
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "output": "",
+            "details": str(e)
+        }), 500
+
+
+def property_matches(properties, match):
+    """True if every key in `match` equals the property (a list value means any of)."""
+    if not properties:
+        return False
+    for key, expected in match.items():
+        value = properties.get(key)
+        options = expected if isinstance(expected, list) else [expected]
+        if str(value) not in [str(o) for o in options]:
+            return False
+    return True
+
+
+def resolve_selected_devices(data):
+    """
+    Select the devices a fan-out command or deployment runs on.
+
+    Starts from the attached devices allowed by DEVICES_RANGE that are in
+    'state' (default 'device'), then narrows by any of:
+        devices (list): Explicit serials.
+        range (str): IP selector, same syntax as DEVICES_RANGE.
+        match (dict): Property match against the property cache,
+                      e.g. {"model": "Pixel 7", "android_version": ["13", "14"]}.
+
+    Returns:
+        tuple: (targets, rejected) where rejected are requested serials that are
+               not attached, not in the wanted state or outside DEVICES_RANGE.
+    """
+    devices_range_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
+    state = data.get('state') or 'device'
+    attached = [
+        d['serial'] for d in filter_devices_in_range(device_registry.get_devices(), devices_range_str)
+        if d['state'] == state
+    ]
+
+    targets, rejected = attached, []
+    requested = data.get('devices')
+    if requested is not None:
+        if not isinstance(requested, list):
+            raise ValueError("'devices' must be a list of device serials.")
+        available = set(attached)
+        requested = list(dict.fromkeys(str(d).strip() for d in requested if str(d).strip()))
+        targets = [d for d in requested if d in available]
+        rejected = [d for d in requested if d not in available]
+
+    if data.get('range'):
+        selector = RangeMatcher(data['range'])
+        targets = [d for d in targets if extract_ip(d) and selector.contains(extract_ip(d))]
+
+    match = data.get('match')
+    if match:
+        if not isinstance(match, dict):
+            raise ValueError("'match' must be an object of property names to values.")
+        entries = property_cache.get_many(targets, wait=config.PROPERTY_FETCH_TIMEOUT)
+        targets = [d for d in targets if d in entries and property_matches(entries[d]['properties'], match)]
+
+    if len(targets) > config.BULK_MAX_TARGETS:
+        raise ValueError(f"Request selects more than BULK_MAX_TARGETS ({config.BULK_MAX_TARGETS}) devices.")
+    return targets, rejected
+
+
+@app.route('/devices/shell', methods=['POST'])
+def fan_out_shell():
+    """
+    Run one shell command on many devices concurrently.
+
+    Body: {"command": "...", plus the selector fields of resolve_selected_devices,
+    "max_workers": int, "timeout": per-device seconds}.
+
+    Results are streamed as NDJSON, one line per device as soon as it
+    finishes, followed by a summary line. With ?async=1 the run becomes a
+    background job instead.
+    """
+    data = request.get_json(silent=True) or {}
+    command = str(data.get('command') or '').strip()
+    if not command:
+        return jsonify({"status": "error", "output": "'command' is required.", "details": ""}), 400
+    try:
+        targets, rejected = resolve_selected_devices(data)
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "output": str(e),
+            "details": "Invalid device selector."
+        }), 400
+    except AdbError as e:
+        return jsonify({"status": "error", "output": str(e), "details": "ADB command failed"}), 500
+
+    def results():
+        start = time.monotonic()
+        succeeded = failed = 0
+        for device_id in rejected:
+            yield {
+                "type": "result",
+                "device": device_id,
+                "ok": False,
+                "output": "Not attached, not in the requested state, or outside DEVICES_RANGE.",
+                "latency_ms": 0.0
+            }
+        for result in iter_bulk(shell_operation(command), targets,
+                                max_workers=data.get('max_workers'), timeout=data.get('timeout')):
+            if result['ok']:
+                succeeded += 1
+            else:
+                failed += 1
+            yield {"type": "result", **result}
+        yield {
+            "type": "summary",
+            "total": len(targets),
+            "succeeded": succeeded,
+            "failed": failed,
+            "rejected": len(rejected),
+            "elapsed_ms": round((time.monotonic() - start) * 1000, 1)
+        }
+
+    if wants_async():
+        def run(job):
+            summary = {}
+            for item in results():
+                job.log(json.dumps(item))
+                summary = item
+            return {
+                "status": "success" if summary['failed'] == 0 and not rejected else "partial",
+                "output": f"{summary['succeeded']}/{summary['total']} succeeded",
+                "details": f"Finished in {summary['elapsed_ms']} ms",
+                "summary": summary
+            }, 200
+        return run_job('shell', run, params={"command": command, "targets": len(targets)})
+
+    def generate():
+        for item in results():
+            yield json.dumps(item) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+# Deploy Endpoints
+@app.route('/deploy/artifacts', methods=['POST'])
+def upload_artifact():
+    """Upload an APK or file once (multipart field 'file'); it is stored under its SHA-256."""
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({"status": "error", "output": "Multipart field 'file' is required.", "details": ""}), 400
+    try:
+        artifact = store_artifact(upload.stream, upload.filename)
+    except ValueError as e:
+        return jsonify({"status": "error", "output": str(e), "details": ""}), 413
+    except Exception as e:
+        return jsonify({"status": "error", "output": "", "details": str(e)}), 500
+    return jsonify({
+        "status": "success",
+        "output": f"Stored {artifact['name']} ({artifact['size']} bytes)",
+        "details": f"sha256 {artifact['sha256']}",
+        "artifact": artifact
+    })
+
+
+@app.route('/deploy/artifacts')
+def get_artifacts():
+    return jsonify({"status": "success", "artifacts": list_artifacts()})
+
+
+@app.route('/deploy/devices/<path:serial>')
+def get_device_deployments(serial):
+    """What the deploy cache believes is on a device."""
+    return jsonify({"status": "success", "serial": serial, "deployments": deploy_cache.for_device(serial)})
+
+
+@app.route('/deploy', methods=['POST'])
+def deploy_artifact():
+    """
+    Push or install an uploaded artifact on many devices in parallel.
+
+    Body:
+        artifact (str): SHA-256 returned by POST /deploy/artifacts.
+        action (str): 'install' (APKs, default for .apk) or 'push'.
+        remote_path (str): Destination for 'push'.
+        package (str): Package name of the APK; enables version reporting and verification.
+        force (bool): Deploy even if the cache says the device is up to date.
+        verify (bool): Hash what is on the device instead of trusting the cache.
+        max_workers (int): Devices deployed at once (default DEPLOY_MAX_WORKERS).
+        timeout (float): Per-device timeout for each step.
+        plus the selector fields of resolve_selected_devices.
+
+    Runs as a job: per-device progress lines are logged while it runs
+    (use ?async=1 and /jobs/<id>/stream to follow them).
+    """
+    data = request.get_json(silent=True) or {}
+    artifact = get_artifact(str(data.get('artifact') or ''))
+    if artifact is None:
+        return jsonify({"status": "error", "output": "Unknown artifact; upload it to /deploy/artifacts first.", "details": ""}), 404
+    action = data.get('action') or ('install' if artifact['kind'] == 'apk' else 'push')
+    remote_path = data.get('remote_path')
+    if action not in ('install', 'push'):
+        return jsonify({"status": "error", "output": "action must be 'install' or 'push'.", "details": ""}), 400
+    if action == 'push' and not remote_path:
+        return jsonify({"status": "error", "output": "'remote_path' is required for push.", "details": ""}), 400
+    try:
+        targets, rejected = resolve_selected_devices(data)
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "output": str(e),
+            "details": "Invalid device selector."
+        }), 400
+
+    def run(job):
+        reported = {}
+
+        def on_progress(serial, sent, total):
+            # One line per 10% per device keeps the log readable for large fleets.
+            step = int(sent * 10 / total) if total else 10
+            if reported.get(serial) != step:
+                reported[serial] = step
+                job.log(json.dumps({"type": "progress", "device": serial, "bytes": sent, "total": total}))
+
+        operation = deploy_operation(
+            artifact, action,
+            remote_path=remote_path,
+            package=data.get('package'),
+            force=bool(data.get('force')),
+            verify=bool(data.get('verify')),
+            on_progress=on_progress
+        )
+        start = time.monotonic()
+        results = []
+        for result in iter_bulk(operation, targets,
+                                max_workers=data.get('max_workers') or config.DEPLOY_MAX_WORKERS,
+                                timeout=data.get('timeout')):
+            results.append(result)
+            job.log(json.dumps({"type": "result", **result}))
+        elapsed = time.monotonic() - start
+
+        total_bytes = sum(r.get('bytes', 0) for r in results)
+        succeeded = sum(1 for r in results if r['ok'])
+        summary = {
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "skipped": sum(1 for r in results if r.get('skipped')),
+            "rejected": len(rejected),
+            "bytes": total_bytes,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "throughput_mbps": round(total_bytes * 8 / elapsed / 1e6, 2) if elapsed > 0 else None
+        }
+        for device_id in rejected:
+            results.append({
+                "device": device_id,
+                "ok": False,
+                "output": "Not attached, not in the requested state, or outside DEVICES_RANGE.",
+                "latency_ms": 0.0
+            })
+        return {
+            "status": "success" if summary["failed"] == 0 and not rejected else "partial",
+            "output": format_results(f"{action.capitalize()} {artifact['name']}", results),
+            "details": f"{summary['succeeded']}/{summary['total']} succeeded ({summary['skipped']} already up to date) "
+                       f"in {summary['elapsed_ms']} ms",
+            "results": results,
+            "summary": summary
+        }, 200
+
+    try:
+        return run_job('deploy', run, params={
+            "artifact": artifact['sha256'],
+            "name": artifact['name'],
+            "action": action,
+            "targets": len(targets)
+        })
+    except Exception as e:
+        return jsonify({"status": "error", "output": "", "details": str(e)}), 500
+
+
 # ws-scrcpy Endpoints
+def start_ws_scrcpy_job(job):
+    """Starts every ws-scrcpy instance and waits for them to accept connections. Runs as a background job."""
+    if scrcpy_cluster.all_running():
+        return {
+            "status": "success",
+            "output": "ws-scrcpy is already running.",
+            "details": "Process is already active"
+        }, 200
+
+    pending = []
+    for instance in scrcpy_cluster.instances:
+        if scrcpy_cluster.is_running(instance):
+            continue
+        port = instance['port']
+        # Check if the port is available, if not, kill the process using it
+        if not is_port_available(port):
+            job.log(f"Port {port} is not available, killing process using it...")
+            kill_process_on_port(port)
+            wait_for_port_free(port)
+        scrcpy_cluster.launch(instance, job.log)
+        pending.append(instance)
+
+    # Instances start in parallel; each wait returns as soon as its "Listening on"
+    # line appears or its port accepts connections.
+    timeout = 60
+    deadline = time.time() + timeout
+    ready, failed = [], []
+    for instance in pending:
+        name = instance['name']
+        if process_manager.wait_until_ready(name, timeout=max(0, deadline - time.time()), port=instance['port']):
+            time_to_ready = process_manager.get_process_info(name)['time_to_ready']
+            job.log(f"{name} is ready on port {instance['port']} after {time_to_ready:.2f}s.")
+            ready.append(time_to_ready)
+        else:
+            failed.append(instance)
+
+    if not failed:
+        time_to_ready = max(ready) if ready else 0.0
+        return {
+            "status": "success",
+            "output": "ws-scrcpy is now running and responsive.",
+            "details": f"Service became active after {time_to_ready:.2f} seconds.",
+            "time_to_ready": time_to_ready,
+            "instances": [scrcpy_cluster.describe(inst) for inst in scrcpy_cluster.instances]
+        }, 200
+
+    names = ", ".join(inst['name'] for inst in failed)
+    if any(not scrcpy_cluster.is_running(inst) for inst in failed):
+        return {
+            "status": "error",
+            "output": f"ws-scrcpy exited before becoming ready ({names}).",
+            "details": "Check /processes/<name>/logs for the process output."
+        }, 500
+    return {
+        "status": "error",
+        "output": f"ws-scrcpy process started, but did not become responsive in time ({names}).",
+        "details": f"Health check timed out after {timeout} seconds. The process may be busy building."
+    }, 500
+
+
 @app.route('/run_ws_scrcpy')
 def run_ws_scrcpy():
     try:
-        if process_manager.is_process_running('ws-scrcpy'):
+        if scrcpy_cluster.all_running():
             return jsonify({
                 "status": "success",
                 "output": "ws-scrcpy is already running.",
                 "details": "Process is already active"
             })
 
-        # Check if port 9786 is available, if not, kill the process using it
-        if not is_port_available(9786):
-            print("Port 9786 is not available, killing process using it...")
-            kill_process_on_port(9786)
-            time.sleep(2)  # Wait a bit for the port to be freed
-
-        # Optimization: Check if the 'dist' build already exists
-        dist_path = os.path.join(WS_SCRCPY_PATH, 'dist', 'index.js')
-        if os.path.exists(dist_path):
-            start_command = ['node', 'dist/index.js']
-            startup_message = "Starting ws-scrcpy from existing build..."
-        else:
-            start_command = ['npm', 'start']
-            startup_message = "No build found. Running 'npm start' (this may take a minute)..."
-
-        # print(startup_message) # Log to backend console
-        process_manager.start_process(
-            'ws-scrcpy',
-            start_command,
-            cwd=WS_SCRCPY_PATH
-        )
-
-        # Health check to see if the server is up
-        max_retries = 20
-        retry_delay = 3
-        for i in range(max_retries):
-            try:
-                response = requests.get("http://localhost:9786", timeout=2)
-                if response.status_code == 200:
-                    return jsonify({
-                        "status": "success",
-                        "output": "ws-scrcpy is now running and responsive.",
-                        "details": f"Service became active after approximately {i * retry_delay} seconds."
-                    })
-            except (requests.ConnectionError, requests.Timeout):
-                time.sleep(retry_delay)
-        
-        total_time = max_retries * retry_delay
-        return jsonify({
-            "status": "error",
-            "output": "ws-scrcpy process started, but did not become responsive in time.",
-            "details": f"Health check timed out after {total_time} seconds. The process may be busy building."
-        }), 500
+        return run_job('ws-scrcpy', start_ws_scrcpy_job, key='ws-scrcpy:start')
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -512,11 +1334,49 @@ def run_ws_scrcpy():
             "details": str(e)
         }), 500
 
+
+@app.route('/ws_scrcpy/instances')
+def list_ws_scrcpy_instances():
+    """Lists the ws-scrcpy instances and how many authorized devices each one serves."""
+    devices_range_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
+    devices = filter_devices_in_range(device_registry.get_devices(), devices_range_str)
+    assignments = scrcpy_cluster.assign(d['serial'] for d in devices)
+
+    counts = {}
+    for instance in assignments.values():
+        counts[instance['name']] = counts.get(instance['name'], 0) + 1
+
+    return jsonify({
+        "status": "success",
+        "policy": scrcpy_cluster.policy,
+        "instances": [scrcpy_cluster.describe(inst, counts.get(inst['name'], 0)) for inst in scrcpy_cluster.instances],
+        "assignments": {serial: inst['name'] for serial, inst in assignments.items()}
+    })
+
+
+@app.route('/ws_scrcpy/lookup/<path:serial>')
+def lookup_ws_scrcpy_instance(serial):
+    """Tells the frontend which ws-scrcpy instance serves a device."""
+    ip = extract_ip(serial)
+    if ip and not is_ip_in_range(ip, os.getenv('DEVICES_RANGE', "192.168.1.0/24")):
+        return jsonify({
+            "status": "error",
+            "output": f"Device {serial} is not allowed.",
+            "details": "The device IP is outside the configured DEVICES_RANGE."
+        }), 403
+
+    instance = scrcpy_cluster.instance_for(serial)
+    return jsonify({
+        "status": "success",
+        "serial": serial,
+        "instance": scrcpy_cluster.describe(instance)
+    })
+
 @app.route('/stop_ws_scrcpy')
 def stop_ws_scrcpy():
     try:
-        # Stop ws-scrcpy process
-        stopped = process_manager.stop_process('ws-scrcpy')
+        # Stop all ws-scrcpy instances
+        stopped = scrcpy_cluster.stop_all()
 
         # Also stop any running tunnel that depends on ws-scrcpy
         tunnel_stopped = process_manager.stop_process('cloudflared')
@@ -544,67 +1404,67 @@ def stop_ws_scrcpy():
         }), 500
 
 # Cloudflared Tunnel Endpoints
-@app.route('/start_scrcpy_tunnel')
-def start_scrcpy_tunnel():
-    try:
-        # First ensure ws-scrcpy is running
-        if not process_manager.is_process_running('ws-scrcpy'):
-
-            dist_path = os.path.join(WS_SCRCPY_PATH, 'dist', 'index.js')
-            if os.path.exists(dist_path):
-                start_command = ['node', 'dist/index.js']
-                startup_message = "Starting ws-scrcpy from existing build..."
-            else:
-                start_command = ['npm', 'start']
-                startup_message = "No build found. Running 'npm start' (this may take a minute)..."
-                
-            process_manager.start_process(
-                'ws-scrcpy',
-                start_command,
-                cwd=WS_SCRCPY_PATH
-            )
-            time.sleep(2)  # Give it time to start
-        
-        # Check if tunnel is already running
-        if process_manager.is_process_running('cloudflared'):
-            # Get existing URL if available
-            public_url = process_manager.get_cloudflared_url()
-            if public_url:
-                return jsonify({
-                    "status": "success",
-                    "output": "Tunnel is already running",
-                    "public_url": public_url,
-                    "local_url": "ws://localhost:9786"
-                })
-        
-        # For a temporary "Quick Tunnel", we don't use a token.
-        # The command is `cloudflared tunnel --url <local-service-url>`
-        # This is much simpler and avoids the cert.pem error.
-        
-        # Start cloudflared quick tunnel process
-        process_manager.start_process(
-            'cloudflared',
-            ['cloudflared', 'tunnel', '--url', 'http://localhost:9786'],
-            capture_output=True
-        )
-        
-        # This will now wait for up to 20 seconds for the URL to be detected.
+def start_quick_tunnel_job(job):
+    """Starts ws-scrcpy if needed and a Cloudflare quick tunnel in front of it."""
+    # The tunnel fronts the primary ws-scrcpy instance.
+    primary = scrcpy_cluster.primary
+    local_url = scrcpy_cluster.local_url(primary)
+
+    # First ensure ws-scrcpy is running. The tunnel does not need the origin
+    # to be up yet, so both start in parallel and we wait for readiness below.
+    if not scrcpy_cluster.is_running(primary):
+        scrcpy_cluster.launch(primary, job.log)
+    
+    # Check if tunnel is already running
+    if process_manager.is_process_running('cloudflared'):
+        # Get existing URL if available
         public_url = process_manager.get_cloudflared_url()
-        
         if public_url:
-            return jsonify({
+            return {
                 "status": "success",
-                "output": "Cloudflared tunnel is active.",
+                "output": "Tunnel is already running",
                 "public_url": public_url,
-                "local_url": "ws://localhost:9786"
-            })
-        else:
-            return jsonify({
-                "status": "error",
-                "output": "Cloudflared tunnel started, but a public URL could not be detected in time.",
-                "public_url": None,
-                "local_url": "ws://localhost:9786"
-            }), 500
+                "local_url": local_url
+            }, 200
+    
+    # For a temporary "Quick Tunnel", we don't use a token.
+    # The command is `cloudflared tunnel --url <local-service-url>`
+    # This is much simpler and avoids the cert.pem error.
+    
+    # Start cloudflared quick tunnel process
+    job.log("Starting cloudflared quick tunnel...")
+    process_manager.start_process(
+        'cloudflared',
+        ['cloudflared', 'tunnel', '--url', f"http://localhost:{primary['port']}"],
+        capture_output=True,
+        restart_policy=config.CLOUDFLARED_RESTART_POLICY
+    )
+    
+    # Returns the moment the reader thread sees the URL (up to 20 seconds).
+    public_url = process_manager.get_cloudflared_url()
+    
+    if public_url:
+        job.log(f"Tunnel URL: {public_url}")
+        if not process_manager.wait_until_ready(primary['name'], timeout=60, port=primary['port']):
+            job.log("Warning: ws-scrcpy is not ready yet; the tunnel may return errors until it is.")
+        return {
+            "status": "success",
+            "output": "Cloudflared tunnel is active.",
+            "public_url": public_url,
+            "local_url": local_url
+        }, 200
+    return {
+        "status": "error",
+        "output": "Cloudflared tunnel started, but a public URL could not be detected in time.",
+        "public_url": None,
+        "local_url": local_url
+    }, 500
+
+
+@app.route('/start_scrcpy_tunnel')
+def start_scrcpy_tunnel():
+    try:
+        return run_job('cloudflared', start_quick_tunnel_job, key='cloudflared:quick')
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -624,30 +1484,36 @@ def start_named_tunnel():
         if process_manager.is_process_running('cloudflared'):
             return jsonify({"status": "error", "output": "A tunnel process is already running."}), 409
 
-        if not process_manager.is_process_running('ws-scrcpy'):
-            run_ws_scrcpy()
+        def run(job):
+            if not scrcpy_cluster.is_running(scrcpy_cluster.primary):
+                # Submitted from inside a job, so it runs inline (or joins a running start) instead of queuing.
+                scrcpy_job, _ = job_manager.submit('ws-scrcpy', start_ws_scrcpy_job, key='ws-scrcpy:start')
+                job.log(f"Waiting for ws-scrcpy (job {scrcpy_job.id})...")
+                scrcpy_job.wait()
 
-        process_manager.start_process(
-            'cloudflared',
-            ['cloudflared', 'tunnel', 'run', '--token', token],
-            capture_output=True
-        )
+            process_manager.start_process(
+                'cloudflared',
+                ['cloudflared', 'tunnel', 'run', '--token', token],
+                capture_output=True,
+                restart_policy=config.CLOUDFLARED_RESTART_POLICY
+            )
 
-        public_url = process_manager.get_cloudflared_url()
-        
-        if public_url:
-            return jsonify({
-                "status": "success",
-                "output": "Named tunnel is active.",
-                "public_url": public_url,
-                "local_url": "ws://localhost:9786"
-            })
-        else:
-            return jsonify({
+            public_url = process_manager.get_cloudflared_url()
+            
+            if public_url:
+                return {
+                    "status": "success",
+                    "output": "Named tunnel is active.",
+                    "public_url": public_url,
+                    "local_url": scrcpy_cluster.local_url(scrcpy_cluster.primary)
+                }, 200
+            return {
                 "status": "error",
                 "output": "Named tunnel started, but a public URL could not be detected.",
                 "public_url": None
-            }), 500
+            }, 500
+
+        return run_job('cloudflared', run, key='cloudflared:named')
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -659,7 +1525,7 @@ def stop_scrcpy_tunnel():
     try:
         # Stop both the tunnel and the underlying ws-scrcpy service
         tunnel_stopped = process_manager.stop_process('cloudflared')
-        scrcpy_stopped = process_manager.stop_process('ws-scrcpy')
+        scrcpy_stopped = scrcpy_cluster.stop_all()
         
         messages = []
         if tunnel_stopped:
@@ -686,6 +1552,128 @@ def stop_scrcpy_tunnel():
             "details": str(e)
         }), 500
 
+# Process Endpoints
+@app.route('/processes')
+def list_processes():
+    return jsonify({
+        "status": "success",
+        "processes": process_manager.get_all_processes()
+    })
+
+
+@app.route('/processes/<name>/logs')
+def get_process_logs(name):
+    """
+    Tail a managed process's output.
+
+    Query params:
+        stream (str): 'stdout' or 'stderr' (default: both, merged).
+        since (int): Return lines after this sequence number.
+        tail (int): Return only the last N lines.
+        limit (int): Maximum number of lines to return.
+    """
+    stream = request.args.get('stream')
+    if stream not in (None, 'stdout', 'stderr'):
+        return jsonify({"status": "error", "output": "stream must be 'stdout' or 'stderr'."}), 400
+
+    logs = process_manager.get_logs(
+        name,
+        stream=stream,
+        since=request.args.get('since', 0, type=int),
+        tail=request.args.get('tail', type=int),
+        limit=request.args.get('limit', type=int)
+    )
+    if logs is None:
+        return jsonify({"status": "error", "output": f"No logs for process '{name}'."}), 404
+    return jsonify({"status": "success", **logs})
+
+
+# Federation Endpoints
+def federation_response(items_key, items, hosts, extra=None):
+    """Aggregated listing: 200 while at least one peer has data (possibly stale), else 502."""
+    answered = sum(1 for h in hosts.values() if h['ok'])
+    degraded = [name for name, h in hosts.items() if not h['ok']]
+    payload = {
+        "status": "success" if answered or any(h['stale'] for h in hosts.values()) else "error",
+        items_key: items,
+        "count": len(items),
+        "hosts": hosts,
+        "degraded": degraded,
+        "details": f"{answered}/{len(hosts)} host(s) answered"
+                   + (f"; stale or missing: {', '.join(degraded)}" if degraded else ""),
+        **(extra or {})
+    }
+    return jsonify(payload), 200 if payload["status"] == "success" else 502
+
+
+def federation_disabled():
+    return jsonify({
+        "status": "error",
+        "output": "Aggregator mode is off.",
+        "details": "Set PEERS to the peer backends' URLs."
+    }), 404
+
+
+@app.route('/federation/devices')
+def federation_devices():
+    """
+    Devices of every peer backend in one list, each tagged with its 'host'.
+
+    Query params:
+        state (str): Only devices in this state (passed on to the peers).
+        refresh (bool): Skip the short aggregate cache.
+    """
+    if not federation.enabled:
+        return federation_disabled()
+    try:
+        state = request.args.get('state')
+        # Aggregates are cached per query, so only real adb states are passed on.
+        if state and state not in DEVICE_STATES:
+            return jsonify({
+                "status": "error",
+                "output": f"Unknown device state '{state}'.",
+                "details": f"Use one of: {', '.join(DEVICE_STATES)}."
+            }), 400
+        devices, hosts, duplicates = federation.devices(
+            f"state={state}" if state else '',
+            refresh=request.args.get('refresh', 'false').lower() in ('1', 'true', 'yes')
+        )
+        return federation_response('devices', devices, hosts, {"duplicates": duplicates})
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "output": "",
+            "details": str(e)
+        }), 500
+
+
+@app.route('/federation/processes')
+def federation_processes():
+    """Managed processes of every peer backend, each tagged with its 'host' and 'name'."""
+    if not federation.enabled:
+        return federation_disabled()
+    try:
+        processes, hosts = federation.processes(
+            refresh=request.args.get('refresh', 'false').lower() in ('1', 'true', 'yes')
+        )
+        return federation_response('processes', processes, hosts)
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "output": "",
+            "details": str(e)
+        }), 500
+
+
+@app.route('/federation/peers')
+def federation_peers():
+    """Configured peers with their failure counts and backoff state."""
+    return jsonify({
+        "status": "success",
+        "peers": federation.status(),
+        "cache_ttl": federation.ttl
+    })
+
 if __name__ == '__main__':
 
     app.run(host='0.0.0.0', port=BACKEND_PORT, debug=True)
\ No newline at end of file
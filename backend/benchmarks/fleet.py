@@ -0,0 +1,139 @@
+"""
+Emulated device fleet for the benchmarks: a fake ADB server speaking the
+host protocol, and the outputs the stub `adb` binary (benchmarks/bin/adb)
+prints. Both describe the same fleet, so the socket and subprocess paths of
+the backend can be compared.
+
+Run a server on its own with:
+    python -m benchmarks.fleet --devices 1000 --port 15037 --latency-ms 2
+"""
+import argparse
+import ipaddress
+import socketserver
+import threading
+import time
+
+# Fleet addresses start here; use FLEET_RANGE as DEVICES_RANGE.
+FLEET_BASE = ipaddress.IPv4Address('10.0.0.1')
+FLEET_RANGE = '10.0.0.0/8'
+# The host protocol frames payloads with a 4-hex-digit length, so a real ADB
+# server cannot return a listing larger than this over the socket.
+MAX_PAYLOAD = 0xffff
+
+
+def device_addresses(count, port=5555):
+    return [f"{FLEET_BASE + i}:{port}" for i in range(count)]
+
+
+def devices_output(count, long=True):
+    """`adb devices [-l]` body (without the header) for a fleet of `count` TCP/IP devices."""
+    lines = []
+    for i, address in enumerate(device_addresses(count)):
+        if long:
+            lines.append(f"{address}\tdevice product:bench model:Bench_{i % 7} device:bench transport_id:{i + 1}")
+        else:
+            lines.append(f"{address}\tdevice")
+    return "".join(line + "\n" for line in lines)
+
+
+def mdns_output(count):
+    """`adb mdns services` body advertising every device of the fleet."""
+    lines = ["List of discovered mdns services"]
+    lines += [f"adb-bench{i:05d}\t_adb._tcp.\t{address}" for i, address in enumerate(device_addresses(count))]
+    return "\n".join(lines) + "\n"
+
+
+class FleetServer(socketserver.ThreadingTCPServer):
+    """
+    Fake ADB server for `devices` emulated TCP/IP devices and as many mDNS records.
+
+    Every host request is answered after `latency` seconds. The fleet is
+    static: connect and disconnect succeed but do not change it, so repeated
+    runs measure the same thing.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, devices, port=0, latency=0.0, mdns=None):
+        self.devices = devices
+        self.latency = latency
+        self.listing = devices_output(devices).encode()
+        self.mdns = mdns_output(devices if mdns is None else mdns).encode()
+        super().__init__(('127.0.0.1', port), _Handler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='fake-adb', daemon=True).start()
+        return self
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def _recv(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def _okay(self, payload):
+        if len(payload) > MAX_PAYLOAD:
+            self._fail(f"payload of {len(payload)} bytes does not fit the ADB host protocol")
+            return
+        self.request.sendall(b'OKAY' + b'%04x' % len(payload) + payload)
+
+    def _fail(self, message):
+        message = message.encode()
+        self.request.sendall(b'FAIL' + b'%04x' % len(message) + message)
+
+    def handle(self):
+        try:
+            service = self._recv(int(self._recv(4), 16)).decode()
+        except (EOFError, ValueError, OSError):
+            return
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        if service in ('host:devices', 'host:devices-l'):
+            self._okay(server.listing)
+        elif service in ('host:track-devices', 'host:track-devices-l'):
+            self._okay(server.listing)
+            if len(server.listing) > MAX_PAYLOAD:
+                return
+            # Nothing ever changes; hold the tracker open until the client leaves.
+            try:
+                while self.request.recv(1):
+                    pass
+            except OSError:
+                pass
+        elif service.startswith('host:connect:'):
+            self._okay(f"already connected to {service[len('host:connect:'):]}".encode())
+        elif service.startswith('host:disconnect:'):
+            self._okay(f"disconnected {service[len('host:disconnect:'):]}".encode())
+        elif service == 'host:mdns:services':
+            self._okay(server.mdns)
+        else:
+            self._fail(f"unsupported service '{service}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake ADB server emulating a device fleet.")
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--mdns', type=int, help="mDNS records (default: one per device)")
+    parser.add_argument('--port', type=int, default=15037)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    server = FleetServer(args.devices, args.port, args.latency_ms / 1000, args.mdns)
+    print(f"Fake ADB server on 127.0.0.1:{server.port} with {args.devices} device(s)", flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""
+HTTP API benchmarks against an emulated device fleet.
+
+For every fleet size and ADB mode the backend is started in its own process
+(threaded Werkzeug server) against either the fake ADB server ('socket') or
+the stub adb binary on PATH ('subprocess'), and each endpoint is driven by
+concurrent clients over keep-alive connections. is_ip_in_range is measured
+in-process against large allowlists. Results are written as JSON.
+
+Usage (from the backend directory):
+    python -m benchmarks.run --devices 10,100,1000,5000 --clients 1,16 --output report.json
+    python -m benchmarks.run --devices 100 --compare report.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fleet import FLEET_RANGE, MAX_PAYLOAD, device_addresses, devices_output
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_BIN = os.path.join(BACKEND_DIR, 'benchmarks', 'bin')
+ENDPOINTS = ('/get_adb_devices', '/get_mdns_services', '/connect_device', '/disconnect_all_devices')
+# Endpoints that touch every device per request get far fewer requests.
+HEAVY_ENDPOINTS = ('/disconnect_all_devices',)
+
+SERVE = (
+    "import sys, app\n"
+    "from werkzeug.serving import make_server\n"
+    "make_server('127.0.0.1', int(sys.argv[1]), app.app, threaded=True).serve_forever()\n"
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(values) / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            'mean': ms(sum(values) / len(values)) if values else None,
+            'p50': ms(percentile(values, 0.5)),
+            'p90': ms(percentile(values, 0.9)),
+            'p99': ms(percentile(values, 0.99)),
+            'max': ms(values[-1] if values else None)
+        }
+    }
+
+
+def drive(base_url, path_fn, total, clients, timeout):
+    """Send `total` GETs from `clients` threads, each with its own pooled session."""
+    counter = itertools.count()
+
+    def client():
+        session = requests.Session()
+        latencies, errors = [], 0
+        while next(counter) < total:
+            start = time.perf_counter()
+            try:
+                ok = session.get(base_url + path_fn(), timeout=timeout).status_code < 400
+            except requests.RequestException:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += 0 if ok else 1
+        session.close()
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = [f.result() for f in [executor.submit(client) for _ in range(clients)]]
+    elapsed = time.perf_counter() - start
+    return summarize([v for latencies, _ in results for v in latencies], sum(e for _, e in results), elapsed)
+
+
+class Backend:
+    """The backend (and, in socket mode, the fake ADB server) in child processes."""
+
+    def __init__(self, mode, devices, latency_ms, runtime_dir):
+        self.mode = mode
+        self.devices = devices
+        self.latency_ms = latency_ms
+        self.runtime_dir = runtime_dir
+        self.port = free_port()
+        self.adb_port = free_port()
+        self.processes = []
+
+    def __enter__(self):
+        env = {
+            **os.environ,
+            'MAGDROID_RUNTIME_DIR': self.runtime_dir,
+            'DEVICES_RANGE': FLEET_RANGE,
+            'ADB_SERVER_PORT': str(self.adb_port),
+            'ADB_USE_SUBPROCESS': '1' if self.mode == 'subprocess' else '0',
+            'PATH': STUB_BIN + os.pathsep + os.environ.get('PATH', ''),
+            'BENCH_ADB_DEVICES': str(self.devices),
+            'BENCH_ADB_LATENCY_MS': str(self.latency_ms),
+            # Background reconnects and probes would add load the benchmark does not ask for.
+            'RECONCILE_INTERVAL': '0',
+            'HEALTH_MONITOR_ENABLED': '0',
+            'PROCESS_LOG_ECHO': '0',
+        }
+        if self.mode == 'socket':
+            self.processes.append(subprocess.Popen(
+                [sys.executable, '-m', 'benchmarks.fleet', '--devices', str(self.devices),
+                 '--port', str(self.adb_port), '--latency-ms', str(self.latency_ms)],
+                cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL
+            ))
+        self.processes.append(subprocess.Popen(
+            [sys.executable, '-c', SERVE, str(self.port)],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(f"{self.url}/health", timeout=1)
+                return self
+            except requests.RequestException:
+                if time.monotonic() > deadline:
+                    self.__exit__()
+                    raise RuntimeError("backend did not start within 30 seconds")
+                time.sleep(0.1)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def __exit__(self, *exc):
+        for process in reversed(self.processes):
+            process.terminate()
+            try:
+                process.wait(5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def bench_http(args, runtime_dir):
+    results = []
+    for mode in args.modes:
+        for devices in args.devices:
+            listing = len(devices_output(devices))
+            if mode == 'socket' and listing > MAX_PAYLOAD:
+                # Same limit as a real ADB server: the length prefix is four hex digits.
+                reason = f"device listing is {listing} bytes; the ADB host protocol caps payloads at {MAX_PAYLOAD}"
+                for endpoint in args.endpoints:
+                    results.append({'mode': mode, 'devices': devices, 'endpoint': endpoint, 'skipped': reason})
+                print(f"[{mode} {devices}] skipped: {reason}")
+                continue
+
+            addresses = device_addresses(devices)
+            with Backend(mode, devices, args.latency_ms, os.path.join(runtime_dir, f"{mode}-{devices}")) as backend:
+                for endpoint in args.endpoints:
+                    if endpoint == '/connect_device':
+                        path_fn = lambda: f"/connect_device/{random.choice(addresses)}"
+                    else:
+                        path_fn = lambda endpoint=endpoint: endpoint
+                    heavy = endpoint in HEAVY_ENDPOINTS
+                    drive(backend.url, path_fn, min(args.warmup, 2) if heavy else args.warmup, 1, args.timeout)
+                    for clients in args.clients:
+                        total = args.heavy_requests if heavy else args.requests
+                        result = {
+                            'mode': mode,
+                            'devices': devices,
+                            'endpoint': endpoint,
+                            'clients': min(clients, total),
+                            **drive(backend.url, path_fn, total, min(clients, total), args.timeout)
+                        }
+                        results.append(result)
+                        print(f"[{mode} {devices}] {endpoint} x{result['clients']}: "
+                              f"{result['throughput_rps']} req/s, p50 {result['latency_ms']['p50']} ms, "
+                              f"p99 {result['latency_ms']['p99']} ms, {result['errors']} error(s)")
+    return results
+
+
+def random_allowlist(entries, rng):
+    """A DEVICES_RANGE string mixing CIDRs, dash ranges and single IPs in 172.16.0.0/12."""
+    parts = []
+    for i in range(entries):
+        a, b, c = 16 + rng.randrange(16), rng.randrange(256), rng.randrange(256)
+        kind = i % 3
+        if kind == 0:
+            parts.append(f"172.{a}.{b}.0/{rng.choice((24, 26, 28))}")
+        elif kind == 1:
+            parts.append(f"172.{a}.{b}.{c // 2}-172.{a}.{b}.{c // 2 + rng.randrange(1, 64)}")
+        else:
+            parts.append(f"172.{a}.{b}.{c}")
+    return ",".join(parts)
+
+
+def bench_ranges(args):
+    from app import is_ip_in_range
+
+    rng = random.Random(1)
+    ips = [f"172.{16 + rng.randrange(16)}.{rng.randrange(256)}.{rng.randrange(256)}" for _ in range(args.lookups)]
+    results = []
+    for entries in args.allowlists:
+        ranges_str = random_allowlist(entries, rng)
+        start = time.perf_counter()
+        is_ip_in_range(ips[0], ranges_str)
+        compile_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        matched = sum(1 for ip in ips if is_ip_in_range(ip, ranges_str))
+        elapsed = time.perf_counter() - start
+        result = {
+            'entries': entries,
+            'lookups': len(ips),
+            'matched': matched,
+            'compile_ms': round(compile_ms, 3),
+            'lookups_per_second': round(len(ips) / elapsed),
+            'ns_per_lookup': round(elapsed / len(ips) * 1e9)
+        }
+        results.append(result)
+        print(f"[is_ip_in_range {entries} entries] {result['lookups_per_second']} lookups/s, "
+              f"compile {result['compile_ms']} ms")
+    return results
+
+
+def http_key(result):
+    return result['mode'], result['devices'], result['endpoint'], result.get('clients')
+
+
+def compare(report, baseline):
+    """Print the change of every measurement that also appears in `baseline`."""
+    previous = {http_key(r): r for r in baseline.get('http', []) if 'skipped' not in r}
+    print(f"\nCompared with {baseline.get('git_commit') or 'baseline'} ({baseline.get('generated_at')}):")
+    for result in report['http']:
+        old = previous.get(http_key(result))
+        if 'skipped' in result or not old:
+            continue
+        delta = lambda new, before: f"{(new - before) / before * 100:+.1f}%" if new is not None and before else "n/a"
+        print(f"  {result['mode']:<10} {result['devices']:>5} {result['endpoint']:<24} x{result['clients']:<3} "
+              f"throughput {delta(result['throughput_rps'], old['throughput_rps'])}, "
+              f"p50 {delta(result['latency_ms']['p50'], old['latency_ms']['p50'])}, "
+              f"p99 {delta(result['latency_ms']['p99'], old['latency_ms']['p99'])}")
+    ranges = {r['entries']: r for r in baseline.get('is_ip_in_range', [])}
+    for result in report['is_ip_in_range']:
+        old = ranges.get(result['entries'])
+        if old:
+            change = (result['lookups_per_second'] - old['lookups_per_second']) / old['lookups_per_second'] * 100
+            print(f"  is_ip_in_range {result['entries']:>6} entries: lookups/s {change:+.1f}%")
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend HTTP API against an emulated fleet.")
+    parser.add_argument('--devices', type=int_list, default=[10, 100, 1000, 5000], help="Fleet sizes (comma-separated).")
+    parser.add_argument('--modes', type=lambda v: v.split(','), default=['socket', 'subprocess'],
+                        help="ADB modes: 'socket' (fake ADB server) and/or 'subprocess' (stub adb on PATH).")
+    parser.add_argument('--clients', type=int_list, default=[1, 16], help="Concurrent clients (comma-separated).")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and client count.")
+    parser.add_argument('--heavy-requests', type=int, default=4, help="Requests for fleet-wide endpoints.")
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Latency added to every ADB request.")
+    parser.add_argument('--timeout', type=float, default=300.0, help="Per-request client timeout (seconds).")
+    parser.add_argument('--endpoints', type=lambda v: v.split(','), default=list(ENDPOINTS))
+    parser.add_argument('--allowlists', type=int_list, default=[10, 1000, 10000],
+                        help="is_ip_in_range allowlist sizes (comma-separated).")
+    parser.add_argument('--lookups', type=int, default=200000)
+    parser.add_argument('--output', default='benchmark-report.json')
+    parser.add_argument('--compare', help="Earlier report to compare against.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='magdroid-bench-') as runtime_dir:
+        # is_ip_in_range is imported from the app in this process; keep its background work quiet.
+        os.environ.update({
+            'MAGDROID_RUNTIME_DIR': os.path.join(runtime_dir, 'ranges'),
+            'ADB_SERVER_PORT': str(free_port()),
+            'RECONCILE_INTERVAL': '0',
+            'HEALTH_MONITOR_ENABLED': '0',
+            'MDNS_REFRESH_INTERVAL': '86400',
+            'PATH': STUB_BIN + os.pathsep + os.environ.get('PATH', ''),
+        })
+        report = {
+            'schema': 1,
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+            'http': bench_http(args, runtime_dir),
+            'is_ip_in_range': bench_ranges(args)
+        }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+Discovery and reconnect benchmarks against a loopback device fleet.
+
+A FleetSimulator (benchmarks/simulator.py) puts fake adbd listeners on
+127.10.0.0/16 and the backend's own code is measured against it:
+
+    discovery   LAN sweep of the fleet range with scanner.iter_scan.
+    connect     Bulk `adb connect` of every device (device_ops.run_bulk).
+    recovery    A share of the connected devices disappears, comes back after
+                a while, and the health monitor or the reconciler has to
+                reconnect them; time-to-recover is measured from the moment
+                the devices are reachable again.
+
+Connects go to the stand-in ADB server (LoopbackAdbServer) unless
+--adb-server-port points at a real one (`adb -P <port> start-server`).
+
+Usage (from the backend directory):
+    python -m benchmarks.simulate --devices 2000 --output simulate-report.json
+    python -m benchmarks.simulate --devices 5000 --drop-rate 0.02 --flap-fraction 0.05 --recover-with reconciler
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+
+from benchmarks.fleet import MAX_PAYLOAD
+from benchmarks.run import free_port, git_commit, percentile
+from benchmarks.simulator import FleetSimulator, LoopbackAdbServer, raise_fd_limit
+
+
+def milestones(times, expected):
+    """Seconds until the first, half and all of `expected` events happened."""
+    times = sorted(times)
+    at = lambda count: round(times[count - 1], 3) if count and len(times) >= count else None
+    return {'first_s': at(1), 'half_s': at((expected + 1) // 2), 'all_s': at(expected)}
+
+
+def bench_discovery(fleet, args):
+    from scanner import iter_scan
+
+    expected = {d.address for d in fleet.devices if d.up}
+    found, times, summary = set(), [], {}
+    start = time.monotonic()
+    for result in iter_scan(fleet.range_str, fleet.port, args.scan_concurrency, args.scan_timeout,
+                            max_hosts=len(fleet.devices)):
+        if result['type'] == 'found':
+            found.add(result['address'])
+            if result['address'] in expected:
+                times.append(time.monotonic() - start)
+        elif result['type'] == 'summary':
+            summary = result
+    result = {
+        'hosts': len(fleet.devices),
+        'listening': len(expected),
+        'found': len(found),
+        'missed': len(expected - found),
+        'elapsed_s': summary.get('elapsed'),
+        'hosts_per_second': summary.get('hosts_per_second'),
+        'concurrency': summary.get('concurrency'),
+        **milestones(times, len(expected))
+    }
+    print(f"[discovery] {result['found']}/{result['listening']} found in {result['elapsed_s']} s "
+          f"({result['hosts_per_second']} hosts/s), all by {result['all_s']} s")
+    return result
+
+
+def bench_connect(addresses, args):
+    from device_ops import run_bulk, connect_one
+
+    start = time.monotonic()
+    results, _ = run_bulk(connect_one, addresses, max_workers=args.connect_workers, timeout=args.connect_timeout)
+    elapsed = time.monotonic() - start
+    latencies = sorted(r['latency_ms'] for r in results)
+    ok = [r['device'] for r in results if r['ok']]
+    result = {
+        'devices': len(addresses),
+        'connected': len(ok),
+        'failed': len(addresses) - len(ok),
+        'workers': args.connect_workers,
+        'elapsed_s': round(elapsed, 3),
+        'connects_per_second': round(len(addresses) / elapsed, 1) if elapsed else None,
+        'latency_ms': {'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99),
+                       'max': latencies[-1] if latencies else None}
+    }
+    print(f"[connect] {result['connected']}/{result['devices']} in {result['elapsed_s']} s "
+          f"({result['connects_per_second']} connects/s), {result['failed']} failed")
+    return result, ok
+
+
+def wait_for(condition, timeout, interval=0.05):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(interval)
+    return True
+
+
+def bench_recovery(fleet, connected, args):
+    from device_registry import device_registry
+    from reconciler import reconciler
+
+    # Whatever reconnects the fleet only knows about devices it has seen.
+    for address in connected:
+        reconciler.known.record(address, connected=True)
+    device_registry.start()
+    wait_for(lambda: device_registry.synced, 10)
+    if args.recover_with == 'health':
+        from health_monitor import health_monitor
+        health_monitor.start()
+    else:
+        reconciler.start()
+
+    flapping = {d.address for d in fleet.flapping}
+    stable = [a for a in connected if a not in flapping]
+    outage = stable[:max(1, int(len(stable) * args.outage))]
+    attached = lambda: {d['serial'] for d in device_registry.get_devices() if d['state'] == 'device'}
+
+    fleet.take_down(outage)
+    lost = wait_for(lambda: not attached() & set(outage), args.recover_timeout)
+    time.sleep(args.outage_seconds)
+    fleet.bring_up(outage)
+    start = time.monotonic()
+
+    pending, times = set(outage), []
+    while pending and time.monotonic() - start < args.recover_timeout:
+        back = pending & attached()
+        times += [time.monotonic() - start] * len(back)
+        pending -= back
+        time.sleep(0.05)
+    result = {
+        'agent': args.recover_with,
+        'devices': len(outage),
+        'loss_detected': lost,
+        'outage_s': args.outage_seconds,
+        'recovered': len(outage) - len(pending),
+        'unrecovered': len(pending),
+        **milestones(times, len(outage))
+    }
+    print(f"[recovery/{args.recover_with}] {result['recovered']}/{result['devices']} back, "
+          f"all by {result['all_s']} s (half by {result['half_s']} s)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Discovery and reconnect benchmarks against a loopback fleet.")
+    parser.add_argument('--devices', type=int, default=2000)
+    parser.add_argument('--base', default='127.10.0.1', help="First simulated device address.")
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--accept-latency-ms', type=float, default=0.0, help="Delay before each handshake reply.")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Share of connections dropped at accept.")
+    parser.add_argument('--flap-fraction', type=float, default=0.0, help="Share of devices that flap.")
+    parser.add_argument('--flap-up', type=float, default=20.0)
+    parser.add_argument('--flap-down', type=float, default=5.0)
+    parser.add_argument('--scan-concurrency', type=int, default=1024)
+    parser.add_argument('--scan-timeout', type=float, default=0.3)
+    parser.add_argument('--connect-workers', type=int, default=32)
+    parser.add_argument('--connect-timeout', type=float, default=5.0)
+    parser.add_argument('--adb-server-port', type=int, help="Use a running ADB server instead of the stand-in.")
+    parser.add_argument('--recover-with', choices=('health', 'reconciler'), default='health')
+    parser.add_argument('--outage', type=float, default=0.1, help="Share of connected devices taken down.")
+    parser.add_argument('--outage-seconds', type=float, default=2.0)
+    parser.add_argument('--recover-timeout', type=float, default=120.0)
+    parser.add_argument('--phases', type=lambda v: v.split(','), default=['discovery', 'connect', 'recovery'])
+    parser.add_argument('--output', default='simulate-report.json')
+    args = parser.parse_args()
+
+    fd_limit = raise_fd_limit()
+    if args.devices * 2 + 512 > fd_limit:
+        parser.error(f"{args.devices} devices need about {args.devices * 2 + 512} file descriptors; "
+                     f"the limit is {fd_limit}")
+
+    fleet = FleetSimulator(args.devices, args.base, args.port, args.accept_latency_ms / 1000, args.drop_rate,
+                           args.flap_fraction, args.flap_up, args.flap_down).start()
+    server_port = args.adb_server_port or LoopbackAdbServer(free_port()).port
+    print(f"{args.devices} simulated device(s) on {fleet.range_str}, ADB server on port {server_port}")
+
+    # A real ADB server cannot list more devices than fit in one 64 KiB reply.
+    line = len(f"{fleet.devices[-1].address}\tdevice\n") if fleet.devices else 1
+    listable = fleet.devices[:MAX_PAYLOAD // line]
+    listable_range = f"{listable[0].ip}-{listable[-1].ip}" if listable else fleet.range_str
+    listable = [d.address for d in listable]
+
+    runtime_dir = tempfile.mkdtemp(prefix='magdroid-simulate-')
+    # The backend modules read their configuration at import time.
+    os.environ.update({
+        'MAGDROID_RUNTIME_DIR': runtime_dir,
+        'ADB_SERVER_PORT': str(server_port),
+        'ADB_USE_SUBPROCESS': '0',
+        # Keep reconnect passes to the devices an ADB server can list (see below).
+        'DEVICES_RANGE': listable_range,
+        'ADB_TCP_PORT': str(args.port),
+        'SCAN_MAX_HOSTS': str(max(args.devices, 1)),
+        'BULK_MAX_TARGETS': str(max(args.devices, 4096)),
+        'RECONCILE_INTERVAL': os.getenv('RECONCILE_INTERVAL', '1'),
+        'RECONCILE_CONNECT_TIMEOUT': str(args.connect_timeout),
+        'HEALTH_INTERVAL': os.getenv('HEALTH_INTERVAL', '1'),
+        'HEALTH_MIN_INTERVAL': os.getenv('HEALTH_MIN_INTERVAL', '0.5'),
+        'HEALTH_MAX_INTERVAL': os.getenv('HEALTH_MAX_INTERVAL', '2'),
+        'HEALTH_RECONNECT_BACKOFF': os.getenv('HEALTH_RECONNECT_BACKOFF', '0.5'),
+        'HEALTH_RECONNECT_WORKERS': str(args.connect_workers),
+        'PROPERTY_WAIT': '0',
+        'MDNS_REFRESH_INTERVAL': '86400',
+    })
+
+    report = {
+        'schema': 1,
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'fleet': {'range': fleet.range_str, 'flapping': len(fleet.flapping), 'listable': len(listable)}
+    }
+    if len(listable) < args.devices:
+        print(f"Connect and recovery use the first {len(listable)} devices: an ADB server cannot list more "
+              f"in one reply.")
+
+    if 'discovery' in args.phases:
+        report['discovery'] = bench_discovery(fleet, args)
+    connected = []
+    if 'connect' in args.phases or 'recovery' in args.phases:
+        report['connect'], connected = bench_connect(listable, args)
+    if 'recovery' in args.phases and connected:
+        report['recovery'] = bench_recovery(fleet, connected, args)
+    report['fleet'].update({
+        'accepted': sum(d.accepted for d in fleet.devices),
+        'dropped': sum(d.dropped for d in fleet.devices)
+    })
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+    # Background threads (registry, monitor, fleet) are daemons; leave without tearing them down.
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
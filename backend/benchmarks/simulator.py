@@ -0,0 +1,312 @@
+"""
+Loopback device fleet: thousands of fake adbd listeners on 127.0.0.0/8.
+
+Linux routes the whole of 127.0.0.0/8 to the loopback interface, so every
+simulated device gets its own address (127.10.0.1, 127.10.0.2, ...) on the
+ADB port and can be found by the LAN scanner like a phone on Wi-Fi. Each
+listener answers the adbd CNXN handshake without authentication, so a real
+ADB server can `adb connect` to it. Devices can be slow to answer
+(accept latency), drop connections at random and flap up and down on a
+schedule.
+
+LoopbackAdbServer is a small stand-in for the ADB server's host services
+(devices, track-devices, connect, disconnect) that connects to the
+simulated devices for real, so reconnect logic can be exercised without
+installing adb.
+
+Keep a fleet up for manual testing with:
+    python -m benchmarks.simulator --devices 2000 --drop-rate 0.01 --flap-fraction 0.05
+"""
+import argparse
+import asyncio
+import ipaddress
+import random
+import resource
+import struct
+import threading
+import time
+
+# adb transport protocol (see adb's protocol.txt).
+A_CNXN = 0x4e584e43
+A_OPEN = 0x4e45504f
+A_CLSE = 0x45534c43
+A_VERSION = 0x01000001
+MAX_DATA = 256 * 1024
+HEADER = struct.Struct('<6I')
+DEVICE_BANNER = b"device::ro.product.name=sim;ro.product.model=Simulated;ro.product.device=sim;\0"
+HOST_BANNER = b"host::\0"
+# Host protocol replies carry a 4-hex-digit length.
+MAX_HOST_PAYLOAD = 0xffff
+
+
+def pack_message(command, arg0, arg1, data=b''):
+    return HEADER.pack(command, arg0, arg1, len(data), sum(data) & 0xffffffff, command ^ 0xffffffff) + data
+
+
+async def read_message(reader):
+    command, arg0, arg1, length, _, _ = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return command, arg0, arg1, await reader.readexactly(length) if length else b''
+
+
+def raise_fd_limit():
+    """Every listener and connection is a file descriptor; use as many as allowed."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+class _Loop:
+    """An asyncio loop on a daemon thread, driven with run() from other threads."""
+
+    def __init__(self, name):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name=name, daemon=True).start()
+
+    def run(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+
+class SimulatedDevice:
+    def __init__(self, ip, port):
+        self.ip = ip
+        self.port = port
+        self.address = f"{ip}:{port}"
+        self.server = None
+        self.connections = set()
+        self.accepted = 0
+        self.dropped = 0
+
+    @property
+    def up(self):
+        return self.server is not None
+
+
+class FleetSimulator(_Loop):
+    """
+    `count` fake adbd listeners starting at `base`.
+
+    Args:
+        accept_latency (float): Seconds before a device answers the handshake.
+        drop_rate (float): Probability that an incoming connection is closed at once.
+        flap_fraction (float): Share of devices that go down and up on a schedule.
+        flap_up / flap_down (float): Seconds up and down per flapping cycle.
+    """
+
+    def __init__(self, count, base='127.10.0.1', port=5555, accept_latency=0.0, drop_rate=0.0,
+                 flap_fraction=0.0, flap_up=20.0, flap_down=5.0, seed=1):
+        super().__init__('fleet-simulator')
+        self.port = port
+        self.accept_latency = accept_latency
+        self.drop_rate = drop_rate
+        self.flap_up = flap_up
+        self.flap_down = flap_down
+        self.random = random.Random(seed)
+        first = ipaddress.IPv4Address(base)
+        self.devices = [SimulatedDevice(str(first + i), port) for i in range(count)]
+        self.by_address = {d.address: d for d in self.devices}
+        self.flapping = self.random.sample(self.devices, int(count * flap_fraction))
+        self.range_str = f"{self.devices[0].ip}-{self.devices[-1].ip}" if self.devices else ''
+
+    @property
+    def addresses(self):
+        return [d.address for d in self.devices]
+
+    def start(self):
+        self.run(self._start_all(self.devices))
+        for device in self.flapping:
+            asyncio.run_coroutine_threadsafe(self._flap(device), self.loop)
+        return self
+
+    def take_down(self, addresses):
+        """Close the listeners and drop every open connection, like a phone leaving Wi-Fi."""
+        self.run(self._stop_all([self.by_address[a] for a in addresses]))
+
+    def bring_up(self, addresses):
+        self.run(self._start_all([self.by_address[a] for a in addresses]))
+
+    def stop(self):
+        self.take_down(self.addresses)
+
+    async def _start_all(self, devices):
+        await asyncio.gather(*(self._start(d) for d in devices if not d.up))
+
+    async def _stop_all(self, devices):
+        for device in devices:
+            self._stop(device)
+
+    async def _start(self, device):
+        device.server = await asyncio.start_server(
+            lambda r, w: self._serve(device, r, w), device.ip, device.port, reuse_address=True, backlog=64
+        )
+
+    def _stop(self, device):
+        if device.server:
+            device.server.close()
+            device.server = None
+        for writer in list(device.connections):
+            writer.transport.abort()
+
+    async def _flap(self, device):
+        # Random phase so the fleet does not flap in lockstep.
+        await asyncio.sleep(self.random.uniform(0, self.flap_up))
+        while True:
+            self._stop(device)
+            await asyncio.sleep(self.flap_down)
+            await self._start(device)
+            await asyncio.sleep(self.flap_up)
+
+    async def _serve(self, device, reader, writer):
+        device.accepted += 1
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            device.dropped += 1
+            writer.transport.abort()
+            return
+        device.connections.add(writer)
+        try:
+            while True:
+                command, _, arg1, _ = await read_message(reader)
+                if command == A_CNXN:
+                    if self.accept_latency:
+                        await asyncio.sleep(self.accept_latency)
+                    writer.write(pack_message(A_CNXN, A_VERSION, MAX_DATA, DEVICE_BANNER))
+                elif command == A_OPEN:
+                    # No device services are emulated; refuse the stream.
+                    writer.write(pack_message(A_CLSE, 0, arg1))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            device.connections.discard(writer)
+            writer.close()
+
+
+class LoopbackAdbServer(_Loop):
+    """
+    Stand-in for the ADB server's host services, backed by real connections.
+
+    `host:connect` opens a TCP connection and performs the CNXN handshake;
+    when a device closes its connection it disappears from the device list
+    and trackers are notified, as with a real server. Listings use the short
+    `devices` format: a real server cannot send more than 64 KiB per reply,
+    which caps how many devices one server can list, so connects beyond
+    that are refused.
+    """
+
+    def __init__(self, port=0, connect_timeout=5.0):
+        super().__init__('loopback-adb')
+        self.connect_timeout = connect_timeout
+        self.transports = {}
+        self.trackers = set()
+        self.server = self.run(asyncio.start_server(self._handle, '127.0.0.1', port, backlog=1024))
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def listing(self):
+        return "".join(f"{address}\tdevice\n" for address in self.transports).encode()
+
+    @staticmethod
+    def _reply(writer, status, payload):
+        writer.write(status + b'%04x' % len(payload) + payload)
+
+    def _notify(self):
+        listing = self.listing()
+        for writer in list(self.trackers):
+            writer.write(b'%04x' % len(listing) + listing)
+
+    async def _handle(self, reader, writer):
+        try:
+            service = (await reader.readexactly(int(await reader.readexactly(4), 16))).decode()
+            if service in ('host:devices', 'host:devices-l'):
+                self._reply(writer, b'OKAY', self.listing())
+            elif service in ('host:track-devices', 'host:track-devices-l'):
+                self._reply(writer, b'OKAY', self.listing())
+                self.trackers.add(writer)
+                try:
+                    await reader.read()
+                finally:
+                    self.trackers.discard(writer)
+            elif service.startswith('host:connect:'):
+                self._reply(writer, b'OKAY', (await self._connect(service[len('host:connect:'):])).encode())
+            elif service.startswith('host:disconnect:'):
+                address = service[len('host:disconnect:'):]
+                transport = self.transports.pop(address, None)
+                if transport:
+                    transport.transport.abort()
+                    self._notify()
+                    self._reply(writer, b'OKAY', f"disconnected {address}".encode())
+                else:
+                    self._reply(writer, b'FAIL', f"no such device '{address}'".encode())
+            elif service == 'host:mdns:services':
+                self._reply(writer, b'OKAY', b"List of discovered mdns services\n")
+            else:
+                self._reply(writer, b'FAIL', f"unsupported service '{service}'".encode())
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _connect(self, address):
+        if address in self.transports:
+            return f"already connected to {address}"
+        if len(self.listing()) + len(f"{address}\tdevice\n") > MAX_HOST_PAYLOAD:
+            return f"failed to connect to '{address}': device list is full"
+        host, _, port = address.rpartition(':')
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), self.connect_timeout)
+        except (OSError, asyncio.TimeoutError, ValueError) as e:
+            return f"failed to connect to '{address}': {e or 'timed out'}"
+        try:
+            writer.write(pack_message(A_CNXN, A_VERSION, MAX_DATA, HOST_BANNER))
+            command, _, _, _ = await asyncio.wait_for(read_message(reader), self.connect_timeout)
+            if command != A_CNXN:
+                raise ConnectionError("unexpected handshake reply")
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError) as e:
+            writer.transport.abort()
+            return f"failed to connect to '{address}': {e or 'handshake failed'}"
+        self.transports[address] = writer
+        self._notify()
+        asyncio.ensure_future(self._watch(address, reader, writer))
+        return f"connected to {address}"
+
+    async def _watch(self, address, reader, writer):
+        try:
+            while await reader.read(65536):
+                pass
+        except (ConnectionError, OSError):
+            pass
+        if self.transports.get(address) is writer:
+            del self.transports[address]
+            self._notify()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a loopback fleet of fake adbd listeners.")
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--base', default='127.10.0.1')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--accept-latency-ms', type=float, default=0.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--flap-fraction', type=float, default=0.0)
+    parser.add_argument('--flap-up', type=float, default=20.0)
+    parser.add_argument('--flap-down', type=float, default=5.0)
+    parser.add_argument('--adb-server-port', type=int, help="Also run the stand-in ADB server on this port.")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    fleet = FleetSimulator(args.devices, args.base, args.port, args.accept_latency_ms / 1000, args.drop_rate,
+                           args.flap_fraction, args.flap_up, args.flap_down).start()
+    print(f"{args.devices} simulated device(s) on {fleet.range_str} port {args.port} "
+          f"(set DEVICES_RANGE={fleet.range_str})", flush=True)
+    if args.adb_server_port is not None:
+        server = LoopbackAdbServer(args.adb_server_port)
+        print(f"Stand-in ADB server on 127.0.0.1:{server.port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,153 @@ FLASK_RUN_PORT = os.getenv('BACKEND_PORT', 5000)
 # --- Cloudflare Tunnels ---
 CLOUDFLARED_TUNNEL_TOKEN = os.getenv('CLOUDFLARED_TUNNEL_TOKEN')
 
+# --- Runtime Files ---
+# Generated files (per-instance configs, pidfiles, caches) live here.
+RUNTIME_DIR = os.getenv('MAGDROID_RUNTIME_DIR', os.path.join(os.path.dirname(__file__), 'data'))
+
+# --- Shared State ---
+# SQLite database shared by all worker processes (process registry, tunnel URL, device snapshot).
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', os.path.join(RUNTIME_DIR, 'state.db'))
+# How often non-leader workers pick up the device snapshot published by the leader.
+DEVICE_SNAPSHOT_POLL_INTERVAL = float(os.getenv('DEVICE_SNAPSHOT_POLL_INTERVAL', 0.5))
+# Removals are remembered for this many versions of a listing; older ?since= cursors get a full listing.
+LISTING_TOMBSTONE_VERSIONS = int(os.getenv('LISTING_TOMBSTONE_VERSIONS', 1000))
+
+# --- ws-scrcpy ---
+# Number of ws-scrcpy instances; they listen on consecutive ports from the base port.
+WS_SCRCPY_INSTANCES = int(os.getenv('WS_SCRCPY_INSTANCES', 1))
+WS_SCRCPY_BASE_PORT = int(os.getenv('WS_SCRCPY_BASE_PORT', 9786))
+# How devices are mapped to instances: 'hash' (consistent hash) or 'least-loaded'.
+WS_SCRCPY_ASSIGNMENT = os.getenv('WS_SCRCPY_ASSIGNMENT', 'hash')
+
+# --- Managed Process Logs ---
+# Output of ws-scrcpy/cloudflared is kept in bounded in-memory ring buffers.
+# Set PROCESS_LOG_DIR to also write size-rotated log files.
+PROCESS_LOG_MAX_LINES = int(os.getenv('PROCESS_LOG_MAX_LINES', 5000))
+PROCESS_LOG_MAX_BYTES = int(os.getenv('PROCESS_LOG_MAX_BYTES', 1024 * 1024))
+PROCESS_LOG_DIR = os.getenv('PROCESS_LOG_DIR', '')
+PROCESS_LOG_FILE_MAX_BYTES = int(os.getenv('PROCESS_LOG_FILE_MAX_BYTES', 10 * 1024 * 1024))
+PROCESS_LOG_FILE_BACKUPS = int(os.getenv('PROCESS_LOG_FILE_BACKUPS', 3))
+PROCESS_LOG_ECHO = os.getenv('PROCESS_LOG_ECHO', '1').lower() in ('1', 'true', 'yes')
+
+# --- Process Supervisor ---
+# Restart policy for managed processes: 'never', 'on-failure' or 'always'.
+WS_SCRCPY_RESTART_POLICY = os.getenv('WS_SCRCPY_RESTART_POLICY', 'on-failure')
+CLOUDFLARED_RESTART_POLICY = os.getenv('CLOUDFLARED_RESTART_POLICY', 'on-failure')
+PROCESS_RESTART_BACKOFF = float(os.getenv('PROCESS_RESTART_BACKOFF', 0.1))
+PROCESS_RESTART_MAX_BACKOFF = float(os.getenv('PROCESS_RESTART_MAX_BACKOFF', 30))
+# A process that stays up this long resets its backoff.
+PROCESS_STABLE_AFTER = float(os.getenv('PROCESS_STABLE_AFTER', 30))
+PROCESS_SAMPLE_INTERVAL = float(os.getenv('PROCESS_SAMPLE_INTERVAL', 5))
+PROCESS_SAMPLE_HISTORY = int(os.getenv('PROCESS_SAMPLE_HISTORY', 120))
+
+# --- ADB Server ---
+# The backend talks to the ADB server directly over its socket protocol.
+# Set ADB_USE_SUBPROCESS=1 to force the old behaviour of spawning `adb`.
+ADB_SERVER_HOST = os.getenv('ADB_SERVER_HOST', '127.0.0.1')
+ADB_SERVER_PORT = int(os.getenv('ADB_SERVER_PORT') or os.getenv('ANDROID_ADB_SERVER_PORT') or 5037)
+ADB_SOCKET_TIMEOUT = float(os.getenv('ADB_SOCKET_TIMEOUT', 5))
+ADB_POOL_SIZE = int(os.getenv('ADB_POOL_SIZE', 64))
+ADB_USE_SUBPROCESS = os.getenv('ADB_USE_SUBPROCESS', '0').lower() in ('1', 'true', 'yes')
+# Identical concurrent host requests share one call; results of read-only ones
+# (device list, mDNS services) are also reused for this many seconds (0 disables).
+ADB_QUERY_CACHE_TTL = float(os.getenv('ADB_QUERY_CACHE_TTL', 0.5))
+
+# --- Device Scheduler ---
+# adb operations run one at a time per device, at most SCHEDULER_WORKERS at once.
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', 64))
+# Workers kept free for interactive requests, and for health checks and reconnects.
+SCHEDULER_RESERVED_INTERACTIVE = int(os.getenv('SCHEDULER_RESERVED_INTERACTIVE', 8))
+SCHEDULER_RESERVED_HEALTH = int(os.getenv('SCHEDULER_RESERVED_HEALTH', 8))
+
+# --- Bulk Device Operations ---
+BULK_MAX_WORKERS = int(os.getenv('BULK_MAX_WORKERS', 32))
+BULK_OP_TIMEOUT = float(os.getenv('BULK_OP_TIMEOUT', 10))
+BULK_MAX_TARGETS = int(os.getenv('BULK_MAX_TARGETS', 4096))
+# How long to keep retrying 'adb connect' after switching a device to TCP/IP.
+TCPIP_CONNECT_TIMEOUT = float(os.getenv('TCPIP_CONNECT_TIMEOUT', 15))
+# Per-device output kept from fan-out shell commands (characters).
+BULK_SHELL_MAX_OUTPUT = int(os.getenv('BULK_SHELL_MAX_OUTPUT', 65536))
+
+# --- Bulk Deploy ---
+DEPLOY_MAX_UPLOAD_BYTES = int(os.getenv('DEPLOY_MAX_UPLOAD_BYTES', 1024 * 1024 * 1024))
+# Uploads are bandwidth-bound, so fewer devices at once than other bulk operations.
+DEPLOY_MAX_WORKERS = int(os.getenv('DEPLOY_MAX_WORKERS', 16))
+DEPLOY_INSTALL_TIMEOUT = float(os.getenv('DEPLOY_INSTALL_TIMEOUT', 120))
+
+# --- Background Jobs ---
+JOB_MAX_WORKERS = int(os.getenv('JOB_MAX_WORKERS', 8))
+JOB_HISTORY = int(os.getenv('JOB_HISTORY', 200))
+
+# --- Device Properties ---
+# Seconds a device's cached properties (model, Android version, battery, IP) stay fresh.
+PROPERTY_CACHE_TTL = float(os.getenv('PROPERTY_CACHE_TTL', 300))
+PROPERTY_CACHE_MAX = int(os.getenv('PROPERTY_CACHE_MAX', 5000))
+PROPERTY_FETCH_WORKERS = int(os.getenv('PROPERTY_FETCH_WORKERS', 32))
+PROPERTY_FETCH_TIMEOUT = float(os.getenv('PROPERTY_FETCH_TIMEOUT', 5))
+# How long GET /devices waits for devices that have no cached properties yet.
+PROPERTY_WAIT = float(os.getenv('PROPERTY_WAIT', 2))
+
+# --- LAN Scanner ---
+ADB_TCP_PORT = int(os.getenv('ADB_TCP_PORT', 5555))
+SCAN_CONCURRENCY = int(os.getenv('SCAN_CONCURRENCY', 1024))
+SCAN_TIMEOUT = float(os.getenv('SCAN_TIMEOUT', 0.3))
+SCAN_MAX_HOSTS = int(os.getenv('SCAN_MAX_HOSTS', 262144))
+
+# --- mDNS Discovery ---
+# Seconds between background `adb mdns services` queries.
+MDNS_REFRESH_INTERVAL = float(os.getenv('MDNS_REFRESH_INTERVAL', 5))
+# A service no longer advertised is forgotten after this many seconds.
+MDNS_TTL = float(os.getenv('MDNS_TTL', 30))
+
+# --- Device Reconciler ---
+# Seconds between reconcile passes (0 disables the background reconciler; it still runs on demand).
+RECONCILE_INTERVAL = float(os.getenv('RECONCILE_INTERVAL', 60))
+# Minimum seconds between fallback LAN sweeps when known devices cannot be reached.
+RECONCILE_SCAN_INTERVAL = float(os.getenv('RECONCILE_SCAN_INTERVAL', 600))
+RECONCILE_CONNECT_TIMEOUT = float(os.getenv('RECONCILE_CONNECT_TIMEOUT', 5))
+# Disconnect this instance's known devices once their IP falls outside DEVICES_RANGE. Off by
+# default: other instances sharing the ADB server may manage devices outside our range.
+RECONCILE_DISCONNECT_OUT_OF_RANGE = os.getenv('RECONCILE_DISCONNECT_OUT_OF_RANGE', '0').lower() in ('1', 'true', 'yes')
+# Known devices not seen for this many seconds are forgotten.
+KNOWN_DEVICE_MAX_AGE = float(os.getenv('KNOWN_DEVICE_MAX_AGE', 30 * 24 * 3600))
+
+# --- Health Monitor ---
+HEALTH_MONITOR_ENABLED = os.getenv('HEALTH_MONITOR_ENABLED', '1').lower() in ('1', 'true', 'yes')
+# Probe interval for a device whose status just changed; stable devices back off
+# towards HEALTH_MAX_INTERVAL, flapping ones are probed every HEALTH_MIN_INTERVAL.
+HEALTH_INTERVAL = float(os.getenv('HEALTH_INTERVAL', 10))
+HEALTH_MIN_INTERVAL = float(os.getenv('HEALTH_MIN_INTERVAL', 2))
+HEALTH_MAX_INTERVAL = float(os.getenv('HEALTH_MAX_INTERVAL', 60))
+# Fraction of the interval added or removed at random so probes do not bunch up.
+HEALTH_JITTER = float(os.getenv('HEALTH_JITTER', 0.2))
+HEALTH_PROBE_TIMEOUT = float(os.getenv('HEALTH_PROBE_TIMEOUT', 1))
+HEALTH_CONCURRENCY = int(os.getenv('HEALTH_CONCURRENCY', 512))
+# A device that changes status this many times within the window is flapping.
+HEALTH_FLAP_WINDOW = float(os.getenv('HEALTH_FLAP_WINDOW', 300))
+HEALTH_FLAP_THRESHOLD = int(os.getenv('HEALTH_FLAP_THRESHOLD', 3))
+HEALTH_RECONNECT_BACKOFF = float(os.getenv('HEALTH_RECONNECT_BACKOFF', 2))
+HEALTH_RECONNECT_MAX_BACKOFF = float(os.getenv('HEALTH_RECONNECT_MAX_BACKOFF', 300))
+HEALTH_RECONNECT_WORKERS = int(os.getenv('HEALTH_RECONNECT_WORKERS', 8))
+# Probe results kept per device.
+HEALTH_HISTORY = int(os.getenv('HEALTH_HISTORY', 10))
+# How often health is published to the device registry and the other workers.
+HEALTH_PUBLISH_INTERVAL = float(os.getenv('HEALTH_PUBLISH_INTERVAL', 2))
+
+# --- Aggregator (multi-host) ---
+# Peer backends for the /federation endpoints: comma-separated "[name=]url[|timeout]",
+# e.g. "rack1=http://10.0.0.11:5000,rack2=http://10.0.0.12:5000|5". Empty disables them.
+PEERS = os.getenv('PEERS', '')
+# Default per-peer request timeout in seconds.
+PEER_TIMEOUT = float(os.getenv('PEER_TIMEOUT', 2))
+# Keep-alive connections kept per peer.
+PEER_POOL_SIZE = int(os.getenv('PEER_POOL_SIZE', 4))
+# After a failure a peer is skipped (its last data served as stale) for this long, doubling per failure.
+PEER_BACKOFF = float(os.getenv('PEER_BACKOFF', 1))
+PEER_MAX_BACKOFF = float(os.getenv('PEER_MAX_BACKOFF', 30))
+# Seconds an aggregated listing is reused before peers are asked again.
+FEDERATION_CACHE_TTL = float(os.getenv('FEDERATION_CACHE_TTL', 1))
+
 # --- Validation ---
 # Ensure essential variables are loaded.
 # if not CLERK_ISSUER:
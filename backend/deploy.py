@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import re
+import shlex
+import tempfile
+import time
+
+import config
+from adb_client import adb, AdbError
+from device_ops import run_shell
+from state_store import state_store
+
+
+ARTIFACT_NAME_RE = re.compile(r'[^A-Za-z0-9._-]+')
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+# ----------------------------------------------------------------------
+# Artifact store
+# ----------------------------------------------------------------------
+def artifact_dir():
+    path = os.path.join(config.RUNTIME_DIR, 'artifacts')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def store_artifact(stream, filename, max_bytes=None):
+    """
+    Save an uploaded file under its SHA-256, hashing while it is written.
+
+    Uploading the same bytes twice stores them once.
+
+    Returns:
+        dict: Artifact metadata (sha256, name, size, kind, uploaded_at).
+    """
+    max_bytes = max_bytes or config.DEPLOY_MAX_UPLOAD_BYTES
+    name = ARTIFACT_NAME_RE.sub('_', os.path.basename(filename or 'artifact')) or 'artifact'
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=artifact_dir(), prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"Upload exceeds DEPLOY_MAX_UPLOAD_BYTES ({max_bytes}).")
+                digest.update(chunk)
+                f.write(chunk)
+        sha256 = digest.hexdigest()
+        os.replace(tmp_path, os.path.join(artifact_dir(), sha256))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    meta = {
+        'sha256': sha256,
+        'name': name,
+        'size': size,
+        'kind': 'apk' if name.lower().endswith('.apk') else 'file',
+        'uploaded_at': time.time()
+    }
+    with open(os.path.join(artifact_dir(), f"{sha256}.json"), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def get_artifact(sha256):
+    """Return metadata (plus the local 'path') of a stored artifact, or None."""
+    if not SHA256_RE.match(sha256 or ''):
+        return None
+    path = os.path.join(artifact_dir(), sha256)
+    try:
+        with open(f"{path}.json") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(path):
+        return None
+    return {**meta, 'path': path}
+
+
+def list_artifacts():
+    artifacts = []
+    for entry in os.listdir(artifact_dir()):
+        if entry.endswith('.json'):
+            meta = get_artifact(entry[:-5])
+            if meta:
+                meta.pop('path')
+                artifacts.append(meta)
+    return sorted(artifacts, key=lambda a: a['uploaded_at'], reverse=True)
+
+
+# ----------------------------------------------------------------------
+# Per-device deploy cache
+# ----------------------------------------------------------------------
+class DeployCache:
+    """
+    What was last deployed to each device: pushed file hashes by remote path,
+    installed artifact hashes (and versions) by package.
+
+    Kept in the shared state store so every worker, and the next restart,
+    can skip devices that are already up to date.
+    """
+
+    def __init__(self, store=None):
+        self.store = store or state_store
+        self.store.execute(
+            'CREATE TABLE IF NOT EXISTS deploy_cache ('
+            'serial TEXT, target TEXT, sha256 TEXT, detail TEXT, updated_at REAL, '
+            'PRIMARY KEY (serial, target))'
+        )
+
+    def get(self, serial, target):
+        row = self.store.execute(
+            'SELECT sha256 FROM deploy_cache WHERE serial = ? AND target = ?', (serial, target)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, serial, target, sha256, detail=None):
+        self.store.execute(
+            'INSERT OR REPLACE INTO deploy_cache (serial, target, sha256, detail, updated_at) VALUES (?, ?, ?, ?, ?)',
+            (serial, target, sha256, json.dumps(detail or {}), time.time())
+        )
+
+    def forget(self, serial, target=None):
+        if target is None:
+            self.store.execute('DELETE FROM deploy_cache WHERE serial = ?', (serial,))
+        else:
+            self.store.execute('DELETE FROM deploy_cache WHERE serial = ? AND target = ?', (serial, target))
+
+    def for_device(self, serial):
+        rows = self.store.execute(
+            'SELECT target, sha256, detail, updated_at FROM deploy_cache WHERE serial = ?', (serial,)
+        ).fetchall()
+        return [
+            {'target': target, 'sha256': sha256, **json.loads(detail or '{}'), 'updated_at': updated_at}
+            for target, sha256, detail, updated_at in rows
+        ]
+
+
+# ----------------------------------------------------------------------
+# Deploying
+# ----------------------------------------------------------------------
+def remote_sha256(serial, path, timeout=None):
+    """SHA-256 of a file on the device, or None if it is missing or sha256sum is unavailable."""
+    exit_code, output = run_shell(serial, f"sha256sum {shlex.quote(path)} 2>/dev/null", timeout)
+    token = output.split()[0] if exit_code == 0 and output.split() else ''
+    return token if SHA256_RE.match(token) else None
+
+
+def installed_package(serial, package, timeout=None):
+    """Return (base.apk path, versionName) of an installed package; (None, None) if absent."""
+    quoted = shlex.quote(package)
+    exit_code, output = run_shell(
+        serial,
+        f"pm path {quoted} | grep -m1 base.apk; dumpsys package {quoted} | grep -m1 versionName",
+        timeout
+    )
+    path = version = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('package:'):
+            path = line[len('package:'):]
+        elif line.startswith('versionName='):
+            version = line[len('versionName='):]
+    return path, version
+
+
+def deploy_operation(artifact, action, remote_path=None, package=None, force=False, verify=False,
+                     cache=None, on_progress=None):
+    """
+    Build a bulk operation (see device_ops.iter_bulk) that deploys one artifact.
+
+    action 'push' copies the file to `remote_path`; 'install' pushes the APK to
+    a temporary path and runs `pm install -r`. A device is skipped when the
+    deploy cache says it already has this artifact, unless `force`. With
+    `verify` (and sha256sum on the device) the cache is not trusted: the
+    file actually on the device is hashed instead.
+
+    `on_progress(serial, sent, total)` receives upload progress.
+    """
+    cache = cache or deploy_cache
+    sha256 = artifact['sha256']
+    target = f"push:{remote_path}" if action == 'push' else f"install:{package or artifact['name']}"
+
+    def up_to_date(serial, timeout):
+        if force:
+            return False
+        if verify:
+            if action == 'push':
+                check_path = remote_path
+            elif package:
+                check_path = installed_package(serial, package, timeout)[0]
+            else:
+                check_path = None
+            if check_path:
+                return remote_sha256(serial, check_path, timeout) == sha256
+        return cache.get(serial, target) == sha256
+
+    def run(serial, timeout=None):
+        if up_to_date(serial, timeout):
+            cache.put(serial, target, sha256)
+            return True, "Already up to date.", {"skipped": True, "bytes": 0}
+
+        progress = (lambda sent, total: on_progress(serial, sent, total)) if on_progress else None
+        start = time.monotonic()
+        if action == 'push':
+            sent = adb.push(serial, artifact['path'], remote_path, timeout=timeout, progress=progress)
+            output, detail = f"Pushed to {remote_path}", {}
+        else:
+            tmp_path = f"/data/local/tmp/magdroid-{sha256[:16]}.apk"
+            sent = adb.push(serial, artifact['path'], tmp_path, timeout=timeout, progress=progress)
+            exit_code, output = run_shell(
+                serial,
+                # `(exit $status)` sets $? for the exit marker run_shell appends; a bare
+                # `exit` would end the shell before the marker is printed.
+                f"pm install -r {shlex.quote(tmp_path)}; status=$?; rm -f {shlex.quote(tmp_path)}; (exit $status)",
+                max(timeout or 0, config.DEPLOY_INSTALL_TIMEOUT)
+            )
+            if exit_code is None:
+                raise AdbError(f"pm install did not report an exit status: {output.strip()}")
+            if exit_code != 0 or 'Success' not in output:
+                raise AdbError(output.strip() or f"pm install exited with code {exit_code}")
+            detail = {}
+            if package:
+                detail['version'] = installed_package(serial, package, timeout)[1]
+        elapsed = time.monotonic() - start
+        cache.put(serial, target, sha256, detail)
+        return True, output.strip(), {
+            "skipped": False,
+            "bytes": sent,
+            "seconds": round(elapsed, 3),
+            "throughput_mbps": round(sent * 8 / elapsed / 1e6, 2) if elapsed > 0 else None,
+            **detail
+        }
+
+    return run
+
+
+# Shared deploy cache used by the Flask routes.
+deploy_cache = DeployCache()
@@ -0,0 +1,210 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import config
+from adb_client import adb, AdbError
+from device_properties import parse_inet_address
+from device_scheduler import device_scheduler, BULK
+from ip_ranges import get_matcher
+
+
+# Replies from the ADB server that mean the operation succeeded.
+CONNECT_OK_PREFIXES = ('connected to', 'already connected to')
+DISCONNECT_OK_PREFIXES = ('disconnected',)
+# Appended to shell commands so the exit status survives the shell protocol.
+EXIT_MARKER = '__MAGDROID_EXIT:'
+
+
+def connect_one(address, timeout=None):
+    """Connect a single device. Returns (ok, server message)."""
+    output = device_scheduler.run(address, lambda: adb.connect(address, timeout=timeout))
+    return output.lower().startswith(CONNECT_OK_PREFIXES), output
+
+
+def disconnect_one(address, timeout=None):
+    """Disconnect a single device. Returns (ok, server message)."""
+    output = device_scheduler.run(address, lambda: adb.disconnect(address, timeout=timeout))
+    return output.lower().startswith(DISCONNECT_OK_PREFIXES), output
+
+
+def run_shell(serial, command, timeout=None):
+    """
+    Run a shell command on one device.
+
+    Returns:
+        tuple: (exit code or None if it could not be determined, output).
+    """
+    output = device_scheduler.run(
+        serial, lambda: adb.shell(serial, f"{command}\necho {EXIT_MARKER}$?", timeout=timeout)
+    )
+    body, marker, code = output.rpartition(EXIT_MARKER)
+    code = code.strip()
+    if not marker or not code.lstrip('-').isdigit():
+        return None, output
+    return int(code), body.rstrip('\n')
+
+
+def shell_operation(command, max_output=None):
+    """
+    Build a bulk operation that runs `command` in each device's shell.
+
+    The result carries the command's exit code; output beyond `max_output`
+    characters is truncated.
+    """
+    max_output = max_output or config.BULK_SHELL_MAX_OUTPUT
+
+    def run(serial, timeout=None):
+        exit_code, output = run_shell(serial, command, timeout)
+        extra = {"exit_code": exit_code}
+        if len(output) > max_output:
+            output = output[:max_output]
+            extra["truncated"] = True
+        return exit_code == 0, output, extra
+    return run
+
+
+def is_usb_device(device):
+    """True for devices attached over USB (not ip:port or mDNS wireless transports)."""
+    if 'usb' in device:
+        return True
+    serial = device['serial']
+    return ':' not in serial and '._adb' not in serial
+
+
+def connect_with_retry(address, timeout):
+    """Connect, retrying with backoff while a freshly restarted adbd comes up."""
+    deadline = time.monotonic() + timeout
+    delay = 0.25
+    while True:
+        try:
+            ok, output = connect_one(address, timeout=min(timeout, config.BULK_OP_TIMEOUT))
+        except AdbError as e:
+            ok, output = False, str(e)
+        if ok or time.monotonic() + delay > deadline:
+            return ok, output
+        time.sleep(delay)
+        delay = min(delay * 2, 2.0)
+
+
+def tcpip_operation(port, ranges_str, connected=()):
+    """
+    Build a bulk operation that moves a USB device onto TCP/IP without disturbing others.
+
+    One shell call reads the device's Wi-Fi IP and the port adbd already
+    listens on. Devices outside `ranges_str` are left alone; devices already
+    connected as ip:port are skipped; `tcpip` (which restarts the device's
+    adbd) is only sent if adbd is not already listening on `port`. The device
+    is then connected over TCP straight away.
+    """
+    connected = set(connected)
+    matcher = get_matcher(ranges_str)
+
+    def run(serial, timeout=None):
+        exit_code, output = run_shell(
+            serial, "getprop service.adb.tcp.port; ip -o -4 addr show wlan0 2>/dev/null", timeout
+        )
+        first_line = output.splitlines()[0].strip() if output else ''
+        listening_port = int(first_line) if first_line.isdigit() else None
+        ip = parse_inet_address(output)
+        if not ip:
+            return False, "No Wi-Fi IPv4 address; is the device on Wi-Fi?", {"ip": None}
+        if not matcher.contains(ip):
+            return False, f"Wi-Fi IP {ip} is outside DEVICES_RANGE; TCP/IP not enabled.", {"ip": ip}
+
+        address = f"{ip}:{port}"
+        if address in connected:
+            return True, f"Already connected as {address}.", {"ip": ip, "address": address, "skipped": True}
+
+        enabled = listening_port != port
+        if enabled:
+            adb.tcpip(serial, port, timeout)
+        # connect_one holds `address` in the device scheduler, so this cannot overlap a
+        # health monitor or reconciler connect to the same ip:port.
+        ok, output = connect_with_retry(address, config.TCPIP_CONNECT_TIMEOUT)
+        return ok, output, {"ip": ip, "address": address, "tcpip_enabled": enabled}
+    return run
+
+
+def _timed(operation, target, timeout, priority):
+    start = time.monotonic()
+    extra = {}
+    try:
+        # The whole per-device operation is one scheduler task; its adb calls run inline.
+        ok, output, *rest = device_scheduler.run(target, lambda: operation(target, timeout), priority)
+        if rest:
+            extra = rest[0]
+    except AdbError as e:
+        ok, output = False, str(e)
+    except Exception as e:
+        ok, output = False, f"Unexpected error: {e}"
+    return {
+        "device": target,
+        "ok": ok,
+        "output": output,
+        **extra,
+        "latency_ms": round((time.monotonic() - start) * 1000, 1)
+    }
+
+
+def run_bulk(operation, targets, max_workers=None, timeout=None, priority=BULK):
+    """
+    Run `operation(target, timeout)` for every target on a bounded worker pool.
+
+    Each operation is a task in the device scheduler, so it never overlaps
+    another operation on the same device.
+
+    Args:
+        operation (callable): e.g. connect_one or disconnect_one.
+        targets (list): Device addresses / serials.
+        max_workers (int): Maximum operations in flight (default BULK_MAX_WORKERS).
+        timeout (float): Per-operation timeout in seconds (default BULK_OP_TIMEOUT).
+        priority (int): Scheduler class (device_scheduler.BULK unless given).
+
+    Returns:
+        tuple: (results, summary). Results are in the same order as `targets`.
+    """
+    max_workers = max(1, min(max_workers or config.BULK_MAX_WORKERS, len(targets) or 1))
+    timeout = timeout or config.BULK_OP_TIMEOUT
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bulk-adb') as executor:
+        results = list(executor.map(lambda target: _timed(operation, target, timeout, priority), targets))
+    elapsed = time.monotonic() - start
+
+    succeeded = sum(1 for r in results if r["ok"])
+    summary = {
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "elapsed_ms": round(elapsed * 1000, 1)
+    }
+    return results, summary
+
+
+def iter_bulk(operation, targets, max_workers=None, timeout=None, priority=BULK):
+    """
+    Like run_bulk, but yields each result as soon as its device finishes.
+
+    Closing the generator early cancels the operations that have not started.
+    """
+    max_workers = max(1, min(max_workers or config.BULK_MAX_WORKERS, len(targets) or 1))
+    timeout = timeout or config.BULK_OP_TIMEOUT
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bulk-adb')
+    try:
+        futures = [executor.submit(_timed, operation, target, timeout, priority) for target in targets]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def format_results(title, results):
+    """Human-readable version of bulk results for the dashboard log."""
+    if not results:
+        return f"{title}: no devices selected."
+    lines = [f"{title}:"]
+    for r in results:
+        mark = "✔" if r["ok"] else "✖"
+        lines.append(f"{mark} {r['device']} ({r['latency_ms']} ms) {r['output']}")
+    return "\n".join(lines)
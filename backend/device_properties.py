@@ -0,0 +1,209 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from adb_client import adb as default_adb, AdbError
+from device_scheduler import device_scheduler, HEALTH
+
+
+# System properties collected for every device, keyed by the name used in the API.
+PROPERTIES = {
+    'model': 'ro.product.model',
+    'manufacturer': 'ro.product.manufacturer',
+    'brand': 'ro.product.brand',
+    'android_version': 'ro.build.version.release',
+    'sdk': 'ro.build.version.sdk',
+    'build_id': 'ro.build.display.id',
+    'hardware_serial': 'ro.serialno',
+}
+
+
+def build_property_command():
+    """
+    One shell command line that prints every property we need as key=value lines.
+
+    Battery level and the Wi-Fi address come from the same call, so a device
+    costs exactly one round-trip however many fields we show.
+    """
+    parts = [f'echo "{key}=$(getprop {prop})"' for key, prop in PROPERTIES.items()]
+    parts.append('echo "battery=$(dumpsys battery 2>/dev/null | grep -m1 level)"')
+    parts.append('echo "wifi_ip=$(ip -o -4 addr show wlan0 2>/dev/null)"')
+    return '; '.join(parts)
+
+
+PROPERTY_COMMAND = build_property_command()
+
+
+def parse_inet_address(output):
+    """First IPv4 address in `ip -o -4 addr show` output ("30: wlan0    inet 192.168.1.41/24 brd ...")."""
+    fields = output.split()
+    if 'inet' not in fields or fields.index('inet') + 1 >= len(fields):
+        return None
+    return fields[fields.index('inet') + 1].split('/')[0]
+
+
+def parse_property_output(output):
+    """Turn the key=value output of PROPERTY_COMMAND into a dict."""
+    properties = {}
+    for line in output.splitlines():
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            continue
+        value = value.strip()
+        if key == 'battery':
+            # "  level: 87"
+            digits = value.rpartition(':')[2].strip()
+            value = int(digits) if digits.isdigit() else None
+        elif key == 'wifi_ip':
+            value = parse_inet_address(value)
+        elif key == 'sdk':
+            value = int(value) if value.isdigit() else None
+        properties[key] = value if value != '' else None
+    return properties
+
+
+class PropertyCache:
+    """
+    Per-device system properties with a TTL and LRU-bounded size.
+
+    Properties are fetched with a single batched shell call per device on a
+    bounded worker pool. Entries older than `ttl` are refreshed in the
+    background; stale values keep being served until the refresh lands. At
+    most `max_entries` devices are cached, least recently used first out.
+    """
+
+    def __init__(self, adb=None, ttl=None, max_entries=None, max_workers=None, timeout=None):
+        self.adb = adb or default_adb
+        self.ttl = ttl or config.PROPERTY_CACHE_TTL
+        self.max_entries = max_entries or config.PROPERTY_CACHE_MAX
+        self.timeout = timeout or config.PROPERTY_FETCH_TIMEOUT
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or config.PROPERTY_FETCH_WORKERS,
+            thread_name_prefix='getprop'
+        )
+        self.entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _fetch(self, serial):
+        start = time.monotonic()
+        try:
+            entry = {
+                'properties': parse_property_output(device_scheduler.run(
+                    serial, lambda: self.adb.shell(serial, PROPERTY_COMMAND, self.timeout), HEALTH
+                )),
+                'error': None
+            }
+        except (AdbError, OSError) as e:
+            entry = {'properties': None, 'error': str(e)}
+        entry['fetched_at'] = time.time()
+        entry['fetch_ms'] = round((time.monotonic() - start) * 1000, 1)
+        with self._lock:
+            previous = self.entries.get(serial)
+            # A failed refresh keeps the last good properties.
+            if entry['properties'] is None and previous and previous['properties']:
+                entry['properties'] = previous['properties']
+            self.entries[serial] = entry
+            self.entries.move_to_end(serial)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._pending.pop(serial, None)
+        return entry
+
+    def _is_fresh(self, entry, max_age=None):
+        return entry is not None and time.time() - entry['fetched_at'] < (max_age or self.ttl)
+
+    def refresh(self, serials, force=False, max_age=None):
+        """
+        Schedule fetches for devices whose entry is missing or older than `max_age` (default: the TTL).
+
+        Returns:
+            dict: serial -> Future for every fetch that is in flight.
+        """
+        futures = {}
+        with self._lock:
+            for serial in serials:
+                if serial in self._pending:
+                    futures[serial] = self._pending[serial]
+                elif force or not self._is_fresh(self.entries.get(serial), max_age):
+                    futures[serial] = self._pending[serial] = self.executor.submit(self._fetch, serial)
+        return futures
+
+    def get_many(self, serials, wait=None, force=False):
+        """
+        Return serial -> entry for the given (online) devices.
+
+        Missing or stale entries are refreshed concurrently. Only devices with
+        nothing cached at all are waited for, up to `wait` seconds; stale
+        entries are returned as they are while the refresh runs.
+        """
+        serials = list(serials)
+        wait = config.PROPERTY_WAIT if wait is None else wait
+        futures = self.refresh(serials, force)
+        with self._lock:
+            missing = [futures[s] for s in serials if s in futures and (force or s not in self.entries)]
+        if missing and wait > 0:
+            deadline = time.monotonic() + wait
+            for future in missing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    future.result(remaining)
+                except Exception:
+                    pass
+        with self._lock:
+            result = {}
+            for serial in serials:
+                entry = self.entries.get(serial)
+                if entry is not None:
+                    self.entries.move_to_end(serial)
+                    result[serial] = entry
+            return result
+
+    def evict(self, serial):
+        with self._lock:
+            self.entries.pop(serial, None)
+
+    def start(self, registry, interval=None):
+        """
+        Keep the cache warm from the device registry. Safe to call more than once.
+
+        New devices are fetched as soon as they come online, devices that
+        disappear are evicted, and entries nearing their TTL are refreshed
+        every `interval` seconds.
+        """
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(
+                target=self._run, args=(registry, interval or self.ttl / 2), name='property-cache', daemon=True
+            )
+            self._thread.start()
+        return True
+
+    def _run(self, registry, interval):
+        subscriber = registry.subscribe()
+        next_sweep = 0
+        while True:
+            try:
+                event = subscriber.get(timeout=max(0, next_sweep - time.monotonic()))
+            except queue.Empty:
+                # Refresh anything that would expire before the next sweep.
+                online = [d['serial'] for d in registry.snapshot()[1] if d['state'] == 'device']
+                self.refresh(online, max_age=max(1, self.ttl - interval))
+                next_sweep = time.monotonic() + interval
+                continue
+            if event['type'] == 'disconnected':
+                self.evict(event['serial'])
+            elif event['type'] != 'health' and event['state'] == 'device':
+                # A device that just came online (or out of 'unauthorized') gets fresh values.
+                self.refresh([event['serial']], force=event['type'] == 'state')
+
+
+# Shared cache used by the Flask routes.
+property_cache = PropertyCache()
@@ -0,0 +1,193 @@
+import queue
+import threading
+import time
+
+import config
+from adb_client import adb as default_adb, AdbError
+from state_store import state_store
+
+
+class DeviceRegistry:
+    """
+    In-memory view of the devices attached to the ADB server.
+
+    A single background thread subscribes to the server's `track-devices` feed
+    and keeps a snapshot of every device. Readers get that snapshot without
+    touching adb, and subscribers receive only the connect, disconnect and
+    state-change deltas.
+
+    With a shared `store`, only one worker process (the holder of the
+    'device-registry' lock) talks to adb; it publishes every snapshot to the
+    store and the other workers follow it from there.
+
+    Per-device health comes from the health monitor (see health_monitor.py)
+    through update_health(); status changes are sent to subscribers as
+    'health' events.
+    """
+
+    def __init__(self, adb=None, reconnect_delay=1.0, max_reconnect_delay=30.0, store=None,
+                 poll_interval=None):
+        self.adb = adb or default_adb
+        self.store = store
+        self.poll_interval = poll_interval or config.DEVICE_SNAPSHOT_POLL_INTERVAL
+        self.leader = False
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.devices = {}
+        self.version = 0
+        self.synced = False
+        self.last_update = None
+        self.health = {}
+        self._health_local = False
+        self._health_seen = 0
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+
+    def start(self):
+        """Start the tracker thread. Safe to call more than once."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(target=self._run, name='device-registry', daemon=True)
+            self._thread.start()
+        return True
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while True:
+            if self.store and not self.store.try_acquire('device-registry'):
+                # Another worker is tracking; retry leadership after a while in case it exits.
+                self._follow(self.reconnect_delay * 5)
+                continue
+            self.leader = True
+            try:
+                for devices in self.adb.track_devices():
+                    self._apply(devices)
+                    self._publish(devices, True)
+                    delay = self.reconnect_delay
+            except (OSError, AdbError) as e:
+                print(f"Device tracker disconnected: {e}")
+            self.synced = False
+            self._publish(list(self.devices.values()), False)
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _publish(self, devices, synced):
+        """Leader only: share the snapshot with the other workers."""
+        if self.store:
+            self.store.put('devices', {'devices': devices, 'synced': synced, 'updated_at': time.time()})
+
+    def _follow(self, duration):
+        """Mirror the leader's published snapshot for `duration` seconds."""
+        deadline = time.time() + duration
+        seen = 0
+        while time.time() < deadline:
+            shared, seen = self.store.get_if_newer('devices', seen)
+            if shared:
+                if shared['synced']:
+                    self._apply(shared['devices'])
+                else:
+                    self.synced = False
+            time.sleep(self.poll_interval)
+
+    def _apply(self, devices):
+        """Replace the snapshot with a new device list and publish the differences."""
+        new_devices = {d['serial']: d for d in devices}
+        events = []
+        with self._lock:
+            for serial, device in new_devices.items():
+                previous = self.devices.get(serial)
+                if previous is None:
+                    events.append({'type': 'connected', 'serial': serial, 'state': device['state'], 'device': device})
+                elif previous['state'] != device['state']:
+                    events.append({
+                        'type': 'state',
+                        'serial': serial,
+                        'state': device['state'],
+                        'previous_state': previous['state'],
+                        'device': device
+                    })
+            for serial, previous in self.devices.items():
+                if serial not in new_devices:
+                    events.append({'type': 'disconnected', 'serial': serial, 'state': None, 'previous_state': previous['state']})
+
+            self.devices = new_devices
+            self.synced = True
+            self.last_update = time.time()
+            if events:
+                self.version += 1
+                for event in events:
+                    event['version'] = self.version
+            subscribers = list(self._subscribers)
+
+        for event in events:
+            for subscriber in subscribers:
+                subscriber.put(event)
+
+    def snapshot(self):
+        """Return (version, list of devices) from the in-memory view."""
+        with self._lock:
+            return self.version, list(self.devices.values())
+
+    def get_devices(self):
+        """
+        Return the current device list.
+
+        Served from memory while the tracker is connected; otherwise falls back
+        to a one-off query so callers never see a stale or empty list.
+        """
+        if self.synced:
+            return self.snapshot()[1]
+        return self.adb.devices()
+
+    def update_health(self, health):
+        """
+        Health monitor only: replace the per-device health (serial -> dict with
+        a 'status') and share it with the other workers.
+        """
+        events = []
+        with self._lock:
+            for serial, entry in health.items():
+                previous = self.health.get(serial)
+                if previous is None or previous['status'] != entry['status']:
+                    device = self.devices.get(serial)
+                    events.append({
+                        'type': 'health',
+                        'serial': serial,
+                        'state': device['state'] if device else None,
+                        'status': entry['status'],
+                        'previous_status': previous['status'] if previous else None,
+                        'version': self.version
+                    })
+            self.health = health
+            self._health_local = True
+            subscribers = list(self._subscribers)
+        if self.store:
+            self.store.put('device_health', health)
+        for event in events:
+            for subscriber in subscribers:
+                subscriber.put(event)
+
+    def get_health(self):
+        """Per-device health: from memory in the monitoring worker, otherwise from the store."""
+        if self.store and not self._health_local:
+            shared, seen = self.store.get_if_newer('device_health', self._health_seen)
+            if shared is not None:
+                self.health, self._health_seen = shared, seen
+        return self.health
+
+    def subscribe(self):
+        """Register for change events. Returns a queue that receives event dicts."""
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+
+# Shared registry used by the Flask routes.
+device_registry = DeviceRegistry(store=state_store)
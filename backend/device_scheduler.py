@@ -0,0 +1,224 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import config
+from metrics import SCHEDULER_WAIT_SECONDS
+
+
+# Priority classes, most urgent first.
+INTERACTIVE = 0
+HEALTH = 1
+BULK = 2
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', HEALTH: 'health', BULK: 'bulk'}
+
+
+class _Task:
+    def __init__(self, key, fn, priority, seq):
+        self.key = key
+        self.fn = fn
+        self.priority = priority
+        self.seq = seq
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class DeviceScheduler:
+    """
+    Runs adb operations as tasks keyed by device.
+
+    Tasks for one device run one at a time, in priority order (interactive,
+    then health, then bulk; first come first served within a class), while
+    different devices run in parallel on `workers` threads. The last
+    `reserved_interactive` workers only take interactive tasks and the
+    `reserved_health` before them also take health tasks (bulk and health
+    tasks together never use more than `workers - reserved_interactive`),
+    so a click on one phone is served promptly even while a fleet-wide
+    install keeps every other worker busy.
+
+    A task started from inside another task runs inline on the same worker,
+    since waiting for a second worker could deadlock. For the same device it
+    simply runs. For another device (e.g. the ip:port connect at the end of a
+    tcpip operation on a USB serial) the worker first waits until nothing
+    else runs on that device and holds it for the call, so the one-at-a-time
+    rule still applies.
+    """
+
+    def __init__(self, workers=None, reserved_interactive=None, reserved_health=None):
+        self.workers = workers or config.SCHEDULER_WORKERS
+        reserved_interactive = config.SCHEDULER_RESERVED_INTERACTIVE if reserved_interactive is None \
+            else reserved_interactive
+        reserved_health = config.SCHEDULER_RESERVED_HEALTH if reserved_health is None else reserved_health
+        # Most workers a class and every less urgent one may occupy together.
+        self.limits = {
+            INTERACTIVE: self.workers,
+            HEALTH: max(1, self.workers - reserved_interactive),
+            BULK: max(1, self.workers - reserved_interactive - reserved_health)
+        }
+        self.running = {p: 0 for p in PRIORITY_NAMES}
+        self._devices = {}
+        self._busy = set()
+        # Per class, devices whose next task has that priority (may hold stale entries).
+        self._ready = {p: deque() for p in PRIORITY_NAMES}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._threads = []
+
+    def _start_workers(self):
+        # Called with the condition held.
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f'device-scheduler-{len(self._threads)}', daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def submit(self, key, fn, priority=None):
+        """
+        Queue `fn()` to run on device `key`.
+
+        Args:
+            key (str): Device serial or ip:port.
+            fn (callable): The operation; its return value becomes the future's result.
+            priority (int): INTERACTIVE, HEALTH or BULK (default: the caller's current class).
+
+        Returns:
+            Future
+        """
+        priority = self.current_priority() if priority is None else priority
+        task = _Task(key, fn, priority, next(self._seq))
+        with self._cond:
+            self._start_workers()
+            queue = self._devices.setdefault(key, [])
+            head = queue[0].priority if queue else None
+            heapq.heappush(queue, task)
+            if key not in self._busy and (head is None or priority < head):
+                self._ready[priority].append(key)
+                self._cond.notify_all()
+        return task.future
+
+    def run(self, key, fn, priority=None):
+        """Run `fn()` on device `key` and return its result (or raise its exception)."""
+        held = getattr(self._local, 'held', None)
+        if held is None:
+            return self.submit(key, fn, priority).result()
+        if key in held:
+            return fn()
+        return self._run_nested(key, fn, held)
+
+    def _run_nested(self, key, fn, held):
+        """Hold another device for a call made from inside a task, on the current worker."""
+        with self._cond:
+            self._cond.wait_for(lambda: key not in self._busy)
+            self._busy.add(key)
+        held.add(key)
+        try:
+            return fn()
+        finally:
+            held.discard(key)
+            with self._cond:
+                self._busy.discard(key)
+                # Tasks queued for the device meanwhile (or whose ready entry was skipped) can start now.
+                queue = self._devices.get(key)
+                if queue:
+                    self._ready[queue[0].priority].append(key)
+                self._cond.notify_all()
+
+    def current_priority(self):
+        """The class of the task running on this thread, or the one set with priority()."""
+        task = getattr(self._local, 'task', None)
+        if task is not None:
+            return task.priority
+        return getattr(self._local, 'priority', INTERACTIVE)
+
+    def priority(self, priority):
+        """Context manager: operations started on this thread default to `priority`."""
+        return _PriorityContext(self._local, priority)
+
+    def _next_task(self):
+        # Called with the condition held; returns None if nothing may start now.
+        for priority in (INTERACTIVE, HEALTH, BULK):
+            ready = self._ready[priority]
+            while ready and self._may_start(priority):
+                key = ready.popleft()
+                queue = self._devices.get(key)
+                if key in self._busy or not queue or queue[0].priority != priority:
+                    continue
+                task = heapq.heappop(queue)
+                self._busy.add(key)
+                self.running[priority] += 1
+                return task
+        return None
+
+    def _may_start(self, priority):
+        # A task counts against its own class's limit and every more urgent one's, so bulk and
+        # health together never take the workers held back for interactive tasks.
+        return all(
+            sum(count for p, count in self.running.items() if p >= limited) < self.limits[limited]
+            for limited in PRIORITY_NAMES if limited <= priority
+        )
+
+    def _work(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    self._cond.wait()
+                    task = self._next_task()
+            SCHEDULER_WAIT_SECONDS.observe(time.monotonic() - task.queued_at, priority=PRIORITY_NAMES[task.priority])
+            if task.future.set_running_or_notify_cancel():
+                self._local.task = task
+                self._local.held = {task.key}
+                try:
+                    task.future.set_result(task.fn())
+                except BaseException as e:
+                    task.future.set_exception(e)
+                finally:
+                    self._local.task = None
+                    self._local.held = None
+            with self._cond:
+                self._busy.discard(task.key)
+                self.running[task.priority] -= 1
+                queue = self._devices[task.key]
+                if queue:
+                    self._ready[queue[0].priority].append(task.key)
+                else:
+                    del self._devices[task.key]
+                self._cond.notify_all()
+
+    def status(self):
+        """Queued and running tasks per priority class."""
+        with self._cond:
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for queue in self._devices.values():
+                for task in queue:
+                    queued[PRIORITY_NAMES[task.priority]] += 1
+            return {
+                'workers': self.workers,
+                'limits': {PRIORITY_NAMES[p]: limit for p, limit in self.limits.items()},
+                'running': {PRIORITY_NAMES[p]: count for p, count in self.running.items()},
+                'queued': queued,
+                'busy_devices': len(self._busy)
+            }
+
+
+class _PriorityContext:
+    def __init__(self, local, priority):
+        self.local = local
+        self.priority = priority
+
+    def __enter__(self):
+        self.previous = getattr(self.local, 'priority', INTERACTIVE)
+        self.local.priority = self.priority
+
+    def __exit__(self, *exc):
+        self.local.priority = self.previous
+
+
+# Shared scheduler for every adb operation that targets a device.
+device_scheduler = DeviceScheduler()
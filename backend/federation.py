@@ -0,0 +1,221 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+
+
+def parse_peers(spec, default_timeout=None):
+    """
+    Parse a PEERS string into (name, url, timeout) tuples.
+
+    Entries are comma-separated `[name=]url[|timeout]`, e.g.
+    "rack1=http://10.0.0.11:5000|5, http://10.0.0.12:5000". Without a name
+    the URL's host:port is used; without a timeout, `default_timeout`.
+    """
+    default_timeout = default_timeout or config.PEER_TIMEOUT
+    peers = []
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, url = entry.partition('=') if '=' in entry.split('://', 1)[0] else ('', '', entry)
+        url, _, timeout = url.partition('|')
+        parsed = urlparse(url.strip())
+        if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+            raise ValueError(f"Invalid peer URL: '{url}'")
+        try:
+            timeout = float(timeout) if timeout else default_timeout
+        except ValueError:
+            raise ValueError(f"Invalid timeout for peer '{url}': '{timeout}'")
+        peers.append((name.strip() or parsed.netloc, url.strip().rstrip('/'), timeout))
+    return peers
+
+
+class Peer:
+    """
+    One peer backend, reached over a pooled keep-alive session.
+
+    The last good response of every path is kept with its ETag: the next
+    request revalidates it (a 304 costs no body), and it is served as stale
+    while the peer is failing. After a failure the peer is skipped for a
+    backoff that doubles up to PEER_MAX_BACKOFF, so one dead host does not add
+    its timeout to every aggregated request.
+    """
+
+    def __init__(self, name, url, timeout, pool_size=None):
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or config.PEER_POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.responses = {}
+        self.failures = 0
+        self.retry_at = 0
+        self.last_error = None
+        self.last_ok = None
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """
+        GET `path` from the peer.
+
+        Returns:
+            dict: ok, data, stale, error, latency_ms and age_s (of the data).
+        """
+        start = time.monotonic()
+        with self._lock:
+            previous = self.responses.get(path)
+            skip = time.monotonic() < self.retry_at
+        error = f"skipped after {self.failures} failure(s): {self.last_error}" if skip else None
+        if not skip:
+            headers = {'If-None-Match': previous['etag']} if previous and previous['etag'] else {}
+            try:
+                response = self.session.get(self.url + path, headers=headers, timeout=self.timeout)
+                if response.status_code == 304 and previous:
+                    entry = {**previous, 'fetched_at': time.time()}
+                elif response.status_code >= 400:
+                    raise ValueError(f"HTTP {response.status_code}")
+                else:
+                    entry = {'data': response.json(), 'etag': response.headers.get('ETag'), 'fetched_at': time.time()}
+                with self._lock:
+                    self.responses[path] = entry
+                    self.failures = 0
+                    self.retry_at = 0
+                    self.last_ok = entry['fetched_at']
+                return self._result(entry, start, fresh=True)
+            except (requests.RequestException, ValueError) as e:
+                error = str(e)
+                with self._lock:
+                    self.failures += 1
+                    self.last_error = error
+                    self.retry_at = time.monotonic() + min(
+                        config.PEER_BACKOFF * 2 ** (self.failures - 1), config.PEER_MAX_BACKOFF
+                    )
+        result = self._result(previous, start, fresh=False) if previous else {
+            'ok': False, 'data': None, 'stale': False, 'age_s': None,
+            'latency_ms': round((time.monotonic() - start) * 1000, 1)
+        }
+        result['error'] = error
+        return result
+
+    @staticmethod
+    def _result(entry, start, fresh):
+        return {
+            'ok': fresh,
+            'data': entry['data'],
+            'stale': not fresh,
+            'error': None,
+            'age_s': round(time.time() - entry['fetched_at'], 1),
+            'latency_ms': round((time.monotonic() - start) * 1000, 1)
+        }
+
+    def status(self):
+        return {
+            'name': self.name,
+            'url': self.url,
+            'timeout': self.timeout,
+            'failures': self.failures,
+            'last_ok': self.last_ok,
+            'last_error': self.last_error,
+            'backing_off': time.monotonic() < self.retry_at
+        }
+
+
+class Federation:
+    """
+    Aggregator view over several Magdroid backends (see PEERS).
+
+    Each query fans out to every peer at once, so an aggregated listing takes
+    about one round trip to the slowest peer, bounded by its timeout. Results
+    are cached for `ttl` seconds per path and concurrent callers share one
+    fan-out. A failing peer degrades to its last good (stale) data or an
+    error entry; the other peers are still merged.
+    """
+
+    def __init__(self, spec=None, ttl=None, workers=None):
+        self.peers = [Peer(*peer) for peer in parse_peers(config.PEERS if spec is None else spec)]
+        self.ttl = config.FEDERATION_CACHE_TTL if ttl is None else ttl
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or max(1, len(self.peers)), thread_name_prefix='federation'
+        )
+        self._cache = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.peers)
+
+    def fetch(self, path, refresh=False):
+        """
+        GET `path` from every peer concurrently.
+
+        Returns:
+            dict: peer name -> result (see Peer.get).
+        """
+        with self._lock:
+            lock = self._locks.setdefault(path, threading.Lock())
+        with lock:
+            cached = self._cache.get(path)
+            if cached and not refresh and time.monotonic() - cached[0] < self.ttl:
+                return cached[1]
+            futures = {peer.name: self.executor.submit(peer.get, path) for peer in self.peers}
+            results = {name: future.result() for name, future in futures.items()}
+            self._cache[path] = (time.monotonic(), results)
+            return results
+
+    @staticmethod
+    def hosts_summary(results, key):
+        """Per-peer status block for an aggregated response; `key(data)` counts its items."""
+        return {
+            name: {
+                'ok': r['ok'],
+                'stale': r['stale'],
+                'error': r['error'],
+                'latency_ms': r['latency_ms'],
+                'age_s': r['age_s'],
+                'count': key(r['data']) if r['data'] else 0
+            }
+            for name, r in results.items()
+        }
+
+    def devices(self, query='', refresh=False):
+        """
+        Every peer's /devices merged into one list, each device tagged with its host.
+
+        Returns:
+            tuple: (devices, hosts, duplicates) where duplicates maps serials
+                   reported by more than one host to those hosts.
+        """
+        results = self.fetch('/devices' + (f"?{query}" if query else ''), refresh)
+        devices, seen = [], {}
+        for name, result in results.items():
+            for device in (result['data'] or {}).get('devices', []):
+                devices.append({**device, 'host': name, 'stale': result['stale']})
+                seen.setdefault(device['serial'], []).append(name)
+        duplicates = {serial: hosts for serial, hosts in seen.items() if len(hosts) > 1}
+        hosts = self.hosts_summary(results, lambda data: len(data.get('devices', [])))
+        return devices, hosts, duplicates
+
+    def processes(self, refresh=False):
+        """Every peer's managed processes, as a list tagged with host and process name."""
+        results = self.fetch('/processes', refresh)
+        processes = []
+        for name, result in results.items():
+            for process, info in ((result['data'] or {}).get('processes') or {}).items():
+                processes.append({**(info or {}), 'host': name, 'name': process, 'stale': result['stale']})
+        return processes, self.hosts_summary(results, lambda data: len(data.get('processes') or {}))
+
+    def status(self):
+        return [peer.status() for peer in self.peers]
+
+
+# Shared aggregator used by the Flask routes (no peers unless PEERS is set).
+federation = Federation()
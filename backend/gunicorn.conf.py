@@ -0,0 +1,17 @@
+# Gunicorn settings for running the backend with several worker processes:
+#   gunicorn app:app
+# Process registrations, the tunnel URL and the device snapshot are shared
+# between workers through the state store (see state_store.py).
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('BACKEND_PORT', '5000')}"
+workers = int(os.getenv('GUNICORN_WORKERS', min(4, multiprocessing.cpu_count())))
+# Threaded workers: log/job/device streams are long-lived requests.
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+# Streaming responses may stay open indefinitely.
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 0))
+# Every worker must open its own SQLite connection and lock files, so do not
+# import the app in the master before forking.
+preload_app = False
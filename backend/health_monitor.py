@@ -0,0 +1,236 @@
+import asyncio
+import heapq
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from adb_client import AdbError
+from device_ops import connect_one, disconnect_one, is_usb_device
+from device_registry import device_registry as default_registry
+from device_scheduler import device_scheduler, HEALTH
+from ip_ranges import get_matcher, extract_ip
+from metrics import HEALTH_PROBES, HEALTH_RECONNECTS
+from reconciler import reconciler as default_reconciler
+from scanner import probe
+from state_store import state_store
+
+# Health statuses.
+HEALTHY = 'healthy'      # ADB port answers and the device is attached ('device')
+DEGRADED = 'degraded'    # only one of the two
+DOWN = 'down'            # neither
+
+
+class DeviceHealth:
+    """Probe state of one ip:port device."""
+
+    def __init__(self, address, interval):
+        self.address = address
+        self.ip = extract_ip(address)
+        port = address.rpartition(':')[2]
+        self.port = int(port) if port.isdigit() else config.ADB_TCP_PORT
+        self.status = None
+        self.since = None
+        self.adb_state = None
+        self.latency_ms = None
+        self.last_probe = None
+        self.interval = interval
+        self.failures = 0
+        self.changes = deque(maxlen=config.HEALTH_FLAP_THRESHOLD)
+        self.history = deque(maxlen=config.HEALTH_HISTORY)
+        self.reconnects = 0
+        self.reconnect_delay = config.HEALTH_RECONNECT_BACKOFF
+        self.retry_at = 0
+        self.reconnecting = False
+        # When the next probe is due; stale schedule entries are skipped.
+        self.due = None
+
+    def flapping(self, now):
+        return (len(self.changes) >= config.HEALTH_FLAP_THRESHOLD
+                and now - self.changes[0] <= config.HEALTH_FLAP_WINDOW)
+
+    def to_dict(self, now):
+        return {
+            'status': self.status,
+            'since': self.since,
+            'adb_state': self.adb_state,
+            'latency_ms': self.latency_ms,
+            'last_probe': self.last_probe,
+            'interval': round(self.interval, 1),
+            'flapping': self.flapping(now),
+            'failures': self.failures,
+            'reconnects': self.reconnects,
+            'history': list(self.history)
+        }
+
+
+class HealthMonitor:
+    """
+    Continuously probes every TCP/IP device in DEVICES_RANGE.
+
+    Each probe is a non-blocking connect to the device's ADB port plus a
+    look at its state in the device registry (no adb round-trip), so one
+    asyncio loop on one thread can watch thousands of devices. Probe
+    intervals adapt per device: a status change drops it to
+    HEALTH_INTERVAL, flapping devices are probed every HEALTH_MIN_INTERVAL
+    and stable ones back off towards HEALTH_MAX_INTERVAL, all with random
+    jitter. A device whose port answers but that is not attached is
+    reconnected with exponential backoff.
+
+    Health is published to the device registry (and from there to the other
+    workers). With a shared store only one worker process runs the monitor.
+    """
+
+    def __init__(self, registry=None, reconciler=None, store=None, concurrency=None):
+        self.registry = registry or default_registry
+        self.reconciler = reconciler or default_reconciler
+        self.store = store or state_store
+        self.concurrency = concurrency or config.HEALTH_CONCURRENCY
+        self.devices = {}
+        self.executor = ThreadPoolExecutor(
+            max_workers=config.HEALTH_RECONNECT_WORKERS, thread_name_prefix='health-reconnect'
+        )
+        self._lock = threading.Lock()
+        self._thread = None
+        self._dirty = False
+
+    def start(self):
+        """Start the monitor thread. Safe to call more than once."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return False
+            self.registry.start()
+            self._thread = threading.Thread(target=self._run, name='health-monitor', daemon=True)
+            self._thread.start()
+        return True
+
+    def _run(self):
+        while not self.store.try_acquire('health-monitor'):
+            time.sleep(config.HEALTH_INTERVAL)
+        asyncio.run(self._main())
+
+    def _targets(self, matcher, known):
+        """ip:port of every in-range TCP/IP device attached or known."""
+        attached = {
+            d['serial'] for d in self.registry.snapshot()[1]
+            if not is_usb_device(d) and matcher.contains(extract_ip(d['serial']) or '')
+        }
+        return attached | {address for address in known if matcher.contains(extract_ip(address) or '')}
+
+    def _next_interval(self, device, changed, now):
+        if device.flapping(now):
+            interval = config.HEALTH_MIN_INTERVAL
+        elif changed:
+            interval = config.HEALTH_INTERVAL
+        else:
+            interval = min(device.interval * 1.5, config.HEALTH_MAX_INTERVAL)
+        device.interval = interval
+        jitter = config.HEALTH_JITTER
+        return interval * random.uniform(1 - jitter, 1 + jitter)
+
+    async def _main(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        schedule = []
+        tasks = set()
+        known, known_at = [], 0
+        next_targets = next_publish = 0
+
+        while True:
+            now = time.monotonic()
+            if now >= next_targets:
+                if now - known_at >= 30:
+                    known = [d['address'] for d in self.reconciler.known.all()]
+                    known_at = now
+                targets = self._targets(get_matcher(os.getenv('DEVICES_RANGE', "192.168.1.0/24")), known)
+                for address in targets - self.devices.keys():
+                    device = self.devices[address] = DeviceHealth(address, config.HEALTH_INTERVAL)
+                    # Spread the first probes of a large fleet over a second.
+                    device.due = now + random.random()
+                    heapq.heappush(schedule, (device.due, address))
+                for address in self.devices.keys() - targets:
+                    del self.devices[address]
+                    self._dirty = True
+                next_targets = now + 1
+
+            while schedule and schedule[0][0] <= now:
+                due, address = heapq.heappop(schedule)
+                device = self.devices.get(address)
+                if device is None or device.due != due:
+                    continue
+                task = asyncio.create_task(self._check(device, semaphore, schedule))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if self._dirty and now >= next_publish:
+                self._publish()
+                next_publish = now + config.HEALTH_PUBLISH_INTERVAL
+
+            wake = min(next_targets, schedule[0][0] if schedule else next_targets)
+            await asyncio.sleep(min(max(wake - time.monotonic(), 0.01), 1))
+
+    async def _check(self, device, semaphore, schedule):
+        async with semaphore:
+            latency = await probe(device.ip, device.port, config.HEALTH_PROBE_TIMEOUT)
+        now = time.monotonic()
+        attached = self.registry.devices.get(device.address)
+        device.adb_state = attached['state'] if attached else None
+        port_open = latency is not None
+        if port_open and device.adb_state == 'device':
+            status = HEALTHY
+        elif port_open or device.adb_state == 'device':
+            status = DEGRADED
+        else:
+            status = DOWN
+
+        changed = status != device.status
+        if changed:
+            if device.status is not None:
+                device.changes.append(now)
+            device.status = status
+            device.since = time.time()
+        device.latency_ms = round(latency * 1000, 1) if port_open else None
+        device.last_probe = time.time()
+        device.failures = 0 if status == HEALTHY else device.failures + 1
+        device.history.append((round(device.last_probe, 1), status, device.latency_ms))
+        HEALTH_PROBES.inc(status=status)
+
+        if status == HEALTHY:
+            device.reconnect_delay = config.HEALTH_RECONNECT_BACKOFF
+        elif port_open and not device.reconnecting and now >= device.retry_at:
+            # adbd answers but the server has no working transport: reconnect.
+            device.reconnecting = True
+            device.retry_at = now + device.reconnect_delay
+            device.reconnect_delay = min(device.reconnect_delay * 2, config.HEALTH_RECONNECT_MAX_BACKOFF)
+            asyncio.get_running_loop().run_in_executor(self.executor, self._reconnect, device)
+
+        self._dirty = True
+        device.due = now + self._next_interval(device, changed, now)
+        heapq.heappush(schedule, (device.due, device.address))
+
+    def _reconnect(self, device):
+        """Reconnect one device (runs on the reconnect pool)."""
+        try:
+            with device_scheduler.priority(HEALTH):
+                if device.adb_state == 'offline':
+                    disconnect_one(device.address, timeout=config.RECONCILE_CONNECT_TIMEOUT)
+                ok, output = connect_one(device.address, timeout=config.RECONCILE_CONNECT_TIMEOUT)
+        except (AdbError, OSError) as e:
+            ok, output = False, str(e)
+        finally:
+            device.reconnecting = False
+        device.reconnects += 1
+        HEALTH_RECONNECTS.inc(outcome='ok' if ok else 'fail')
+        print(f"Health monitor reconnect {device.address}: {output}")
+
+    def _publish(self):
+        now = time.monotonic()
+        self.registry.update_health({address: device.to_dict(now) for address, device in self.devices.items()
+                                     if device.status is not None})
+        self._dirty = False
+
+
+# Shared monitor used by the Flask routes.
+health_monitor = HealthMonitor()
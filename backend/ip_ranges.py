@@ -0,0 +1,174 @@
+import bisect
+import ipaddress
+import re
+import socket
+import threading
+
+
+def ip_to_int(ip):
+    """
+    Convert an IP address string to (version, integer).
+
+    Returns None if the string is not a valid IPv4 or IPv6 address.
+    """
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except OSError:
+        pass
+    try:
+        # Strip an optional zone index (e.g. 'fe80::1%wlan0').
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip.split('%', 1)[0]), 'big')
+    except (OSError, ValueError):
+        return None
+
+
+def extract_ip(device_id):
+    """
+    Return the IP address from a device id, or None for USB serials.
+
+    Handles '192.168.1.10:5555' as well as bracketed IPv6 ids like '[fe80::1]:5555'.
+    """
+    match = re.match(r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})', device_id)
+    if match:
+        return match.group(1)
+    match = re.match(r'\[([0-9a-fA-F:.%\w]+)\]', device_id)
+    return match.group(1) if match else None
+
+
+class RangeMatcher:
+    """
+    Compiled form of a DEVICES_RANGE string.
+
+    CIDRs ("192.168.1.0/24"), dash ranges ("192.168.1.40-192.168.1.45") and
+    single IPs are turned into integer intervals, sorted and merged once. Each
+    lookup is then a binary search over the interval starts, independent of how
+    many ranges were configured. IPv4 and IPv6 are kept in separate indexes.
+    """
+
+    def __init__(self, ranges_str):
+        self.ranges_str = ranges_str or ''
+        self.invalid = []
+        intervals = {4: [], 6: []}
+
+        for r in self.ranges_str.split(','):
+            r = r.strip().strip('"\'')
+            if not r:
+                continue
+            try:
+                interval = self._parse_range(r)
+            except ValueError:
+                self.invalid.append(r)
+                continue
+            version, start, end = interval
+            intervals[version].append((start, end))
+
+        if self.invalid:
+            print(f"Warning: ignoring malformed DEVICES_RANGE entries: {', '.join(self.invalid)}")
+
+        self._starts = {}
+        self._ends = {}
+        for version, items in intervals.items():
+            merged = self._merge(items)
+            self._starts[version] = [start for start, _ in merged]
+            self._ends[version] = [end for _, end in merged]
+
+    @staticmethod
+    def _parse_range(r):
+        # Handle CIDR format (e.g., "192.168.1.0/24")
+        if '/' in r:
+            net = ipaddress.ip_network(r, strict=False)
+            return net.version, int(net.network_address), int(net.broadcast_address)
+
+        # Handle range format (e.g., "192.168.1.40-192.168.1.45")
+        if '-' in r:
+            start_ip, end_ip = (part.strip() for part in r.split('-', 1))
+            start = ip_to_int(start_ip)
+            end = ip_to_int(end_ip)
+            if start is None or end is None or start[0] != end[0]:
+                raise ValueError(r)
+            if start[1] > end[1]:
+                start, end = end, start
+            return start[0], start[1], end[1]
+
+        # Handle single IP format
+        single = ip_to_int(r)
+        if single is None:
+            raise ValueError(r)
+        return single[0], single[1], single[1]
+
+    @staticmethod
+    def _merge(intervals):
+        """Sort intervals and merge the overlapping or adjacent ones."""
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1] + 1:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        return merged
+
+    def _contains_int(self, version, value):
+        starts = self._starts[version]
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value <= self._ends[version][i]
+
+    def contains(self, ip):
+        """Return True if the IP address string falls within any configured range."""
+        parsed = ip_to_int(ip)
+        if parsed is None:
+            return False
+        return self._contains_int(*parsed)
+
+    __contains__ = contains
+
+    def filter(self, ips):
+        """
+        Return the subset of `ips` that falls within the configured ranges.
+
+        Input order is preserved. Invalid addresses are dropped.
+        """
+        return [ip for ip in ips if self.contains(ip)]
+
+    def intervals(self, version=4):
+        """Return the merged (start, end) integer intervals for one IP version."""
+        return list(zip(self._starts[version], self._ends[version]))
+
+    def addresses(self, version=4):
+        """Lazily yield every address covered by the ranges, in ascending order."""
+        if version == 4:
+            to_str = lambda value: socket.inet_ntop(socket.AF_INET, value.to_bytes(4, 'big'))
+        else:
+            to_str = lambda value: socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, 'big'))
+        for start, end in self.intervals(version):
+            for value in range(start, end + 1):
+                yield to_str(value)
+
+    def size(self, version=4):
+        """Return the number of addresses covered for one IP version."""
+        return sum(end - start + 1 for start, end in self.intervals(version))
+
+    def __bool__(self):
+        return bool(self._starts[4] or self._starts[6])
+
+
+_matcher_lock = threading.Lock()
+_matcher = None
+
+
+def get_matcher(ranges_str):
+    """
+    Return the compiled matcher for a ranges string.
+
+    The last compiled matcher is reused as long as the string is unchanged, so
+    a config reload (a new DEVICES_RANGE value) transparently triggers a rebuild.
+    """
+    global _matcher
+    ranges_str = ranges_str or ''
+    matcher = _matcher
+    if matcher is not None and matcher.ranges_str == ranges_str:
+        return matcher
+    with _matcher_lock:
+        if _matcher is None or _matcher.ranges_str != ranges_str:
+            _matcher = RangeMatcher(ranges_str)
+        return _matcher
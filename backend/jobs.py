@@ -0,0 +1,190 @@
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from metrics import JOB_SECONDS
+
+
+class Job:
+    """A unit of long-running work with incremental output."""
+
+    def __init__(self, kind, key=None, params=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.params = params or {}
+        self.status = 'queued'
+        self.lines = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cond = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in ('succeeded', 'failed')
+
+    def log(self, line):
+        """Append one line of output and wake anyone streaming this job."""
+        with self._cond:
+            self.lines.append(line)
+            self._cond.notify_all()
+
+    def lines_since(self, offset=0):
+        """Return (lines after `offset`, next offset)."""
+        with self._cond:
+            offset = max(0, offset)
+            return self.lines[offset:], len(self.lines)
+
+    def wait_for_output(self, offset, timeout=None):
+        """Block until there is output past `offset` or the job finishes."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.lines) > offset or self.done, timeout)
+
+    def wait(self, timeout=None):
+        """Block until the job finishes. Returns True if it did."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout)
+
+    def _set_status(self, status):
+        with self._cond:
+            self.status = status
+            if status == 'running':
+                self.started_at = time.time()
+            elif self.done:
+                self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def to_dict(self, since=None):
+        info = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'params': self.params,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error
+        }
+        if self.done and self.result is not None:
+            info['result'] = self.result[0]
+        if since is not None:
+            info['lines'], info['offset'] = self.lines_since(since)
+        return info
+
+
+class JobManager:
+    """
+    Runs long operations on a managed executor so Flask workers return at once.
+
+    Jobs submitted with the same `key` while one is still queued or running are
+    deduplicated: the caller gets the in-flight job instead of a second run.
+
+    A job submitted from inside a running job (e.g. starting ws-scrcpy before
+    a tunnel) runs inline on the same worker, or reuses an identical job that
+    is already running. Queuing it and waiting could deadlock once every
+    worker is an outer job waiting for an inner one.
+    """
+
+    def __init__(self, max_workers=None, history=None):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or config.JOB_MAX_WORKERS,
+            thread_name_prefix='job'
+        )
+        self.history = history or config.JOB_HISTORY
+        self.jobs = {}
+        self.active_keys = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def submit(self, kind, fn, key=None, params=None):
+        """
+        Queue `fn(job)` for execution.
+
+        `fn` must return a (payload dict, http status code) tuple; output can be
+        streamed with job.log() while it runs.
+
+        Returns:
+            tuple: (job, created) where created is False if an identical job was
+                   already in flight.
+        """
+        nested = getattr(self._local, 'job', None) is not None
+        with self._lock:
+            active = self.active_keys.get(key) if key is not None else None
+            # From inside a job only a running duplicate is safe to wait for; a queued one may never get a worker.
+            if active is not None and (not nested or active.status == 'running'):
+                return active, False
+            job = Job(kind, key, params)
+            self.jobs[job.id] = job
+            if key is not None and active is None:
+                self.active_keys[key] = job
+            self._prune()
+        if nested:
+            self._run(job, fn)
+        else:
+            self.executor.submit(self._run, job, fn)
+        return job, True
+
+    def _run(self, job, fn):
+        job._set_status('running')
+        outer, self._local.job = getattr(self._local, 'job', None), job
+        try:
+            job.result = fn(job)
+            status = 'succeeded' if job.result[1] < 400 else 'failed'
+        except Exception as e:
+            job.error = str(e)
+            job.result = ({"status": "error", "output": "", "details": str(e)}, 500)
+            status = 'failed'
+        finally:
+            self._local.job = outer
+        with self._lock:
+            if job.key is not None and self.active_keys.get(job.key) is job:
+                del self.active_keys[job.key]
+        job._set_status(status)
+        JOB_SECONDS.observe(job.finished_at - job.started_at, kind=job.kind, status=status)
+
+    def _prune(self):
+        """Drop the oldest finished jobs beyond the history limit."""
+        finished = [j for j in self.jobs.values() if j.done]
+        excess = len(self.jobs) - self.history
+        for job in sorted(finished, key=lambda j: j.finished_at)[:max(0, excess)]:
+            del self.jobs[job.id]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        return [job.to_dict() for job in sorted(self.jobs.values(), key=lambda j: j.created_at, reverse=True)]
+
+
+def run_command(job, command, cwd=None, env=None):
+    """
+    Run a command, streaming its combined stdout/stderr into the job log.
+
+    Returns:
+        tuple: (return code, full output).
+    """
+    process = subprocess.Popen(
+        command,
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1
+    )
+    output = []
+    for line in iter(process.stdout.readline, ''):
+        output.append(line)
+        job.log(line.rstrip('\n'))
+    process.stdout.close()
+    return process.wait(), ''.join(output)
+
+
+# Shared job manager used by the Flask routes.
+job_manager = JobManager()
@@ -0,0 +1,109 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+
+class LogBuffer:
+    """
+    Fixed-size ring buffer of output lines.
+
+    Every line gets a monotonically increasing sequence number, so readers can
+    ask for "everything after N" and resume later without re-reading. Memory is
+    capped both by line count and by total bytes; the oldest lines are dropped
+    first. Optionally every line is also written to a size-rotated file.
+    """
+
+    def __init__(self, max_lines=5000, max_bytes=1024 * 1024, counter=None, log_file=None,
+                 file_max_bytes=10 * 1024 * 1024, file_backups=3):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.lines = deque()
+        self.size = 0
+        self.dropped = 0
+        # A shared counter lets several buffers (stdout/stderr) share one sequence.
+        self._counter = counter or itertools.count(1)
+        self._lock = threading.Lock()
+        self._file_logger = None
+        if log_file:
+            self._file_logger = self._make_file_logger(log_file, file_max_bytes, file_backups)
+
+    @staticmethod
+    def _make_file_logger(path, max_bytes, backups):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        logger = logging.getLogger(f"process-log:{path}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        if not logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            logger.addHandler(handler)
+        return logger
+
+    def append(self, line, stream=None):
+        """Store a line and return its sequence number."""
+        size = len(line.encode('utf-8', errors='replace'))
+        with self._lock:
+            seq = next(self._counter)
+            self.lines.append((seq, time.time(), stream, line))
+            self.size += size
+            while self.lines and (len(self.lines) > self.max_lines or self.size > self.max_bytes):
+                _, _, _, old = self.lines.popleft()
+                self.size -= len(old.encode('utf-8', errors='replace'))
+                self.dropped += 1
+        if self._file_logger:
+            self._file_logger.info(f"[{stream}] {line}" if stream else line)
+        return seq
+
+    @property
+    def first_seq(self):
+        with self._lock:
+            return self.lines[0][0] if self.lines else None
+
+    @property
+    def last_seq(self):
+        with self._lock:
+            return self.lines[-1][0] if self.lines else 0
+
+    def since(self, offset=0, limit=None):
+        """
+        Return entries with a sequence number greater than `offset`.
+
+        Entries are (seq, timestamp, stream, line) tuples. Only the requested
+        slice is materialised.
+        """
+        with self._lock:
+            if not self.lines or offset >= self.lines[-1][0]:
+                return []
+            # Sequence numbers increase but may have gaps when a counter is
+            # shared, so bisect for the first entry past the offset.
+            start, end = 0, len(self.lines)
+            while start < end:
+                middle = (start + end) // 2
+                if self.lines[middle][0] <= offset:
+                    start = middle + 1
+                else:
+                    end = middle
+            stop = start + limit if limit else None
+            return list(itertools.islice(self.lines, start, stop))
+
+    def tail(self, count):
+        """Return the last `count` entries."""
+        with self._lock:
+            count = max(0, min(count, len(self.lines)))
+            entries = list(itertools.islice(reversed(self.lines), count))
+        entries.reverse()
+        return entries
+
+    def stats(self):
+        with self._lock:
+            return {
+                'lines': len(self.lines),
+                'bytes': self.size,
+                'dropped': self.dropped,
+                'first_seq': self.lines[0][0] if self.lines else None,
+                'last_seq': self.lines[-1][0] if self.lines else 0
+            }
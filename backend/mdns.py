@@ -0,0 +1,151 @@
+import sys
+import threading
+import time
+
+import config
+from adb_client import adb as default_adb, AdbError
+from ip_ranges import extract_ip
+from state_store import state_store
+
+
+# Plain ADB over TCP; '_adb-tls-connect._tcp' and '_adb-tls-pairing._tcp'
+# services need `adb pair` first.
+ADB_SERVICE = '_adb._tcp'
+
+
+def parse_mdns_output(output):
+    """
+    Parse `adb mdns services` output into structured entries.
+
+    Lines look like "adb-XYZ\t_adb._tcp.\t192.168.1.41:5555"; the header and
+    anything without an ip:port address are skipped.
+
+    Returns:
+        list: dicts with name, service (trailing dot removed), ip, port and address.
+    """
+    entries = []
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) < 3:
+            continue
+        name, service, address = parts[0], parts[1].rstrip('.'), parts[2]
+        ip = extract_ip(address)
+        port = address.rpartition(':')[2]
+        if not ip or not port.isdigit():
+            continue
+        entries.append({'name': name, 'service': service, 'ip': ip, 'port': int(port), 'address': address})
+    return entries
+
+
+class MdnsCache:
+    """
+    ADB services seen over mDNS, refreshed in the background.
+
+    One worker (the holder of the 'mdns' lock) asks the ADB server every
+    `refresh_interval` seconds and publishes the result to the shared store;
+    everyone else reads it from there, so requests never trigger discovery
+    themselves. A service that stops being advertised is kept for `ttl`
+    seconds, which rides out the gaps in mDNS announcements. When nothing has
+    refreshed the cache recently (no background thread, e.g. a script) the
+    caller refreshes it inline.
+    """
+
+    def __init__(self, adb=None, store=None, ttl=None, refresh_interval=None):
+        self.adb = adb or default_adb
+        self.store = store if store is not None else state_store
+        self.ttl = ttl or config.MDNS_TTL
+        self.refresh_interval = refresh_interval or config.MDNS_REFRESH_INTERVAL
+        self.entries = {}
+        self.refreshed_at = 0
+        self.error = None
+        self.leader = False
+        self._shared_seen = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start background refreshing. Safe to call more than once."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(target=self._run, name='mdns-cache', daemon=True)
+            self._thread.start()
+        return True
+
+    def _run(self):
+        while True:
+            if self.store is None or self.store.try_acquire('mdns'):
+                self.leader = True
+                try:
+                    self.refresh()
+                except (AdbError, OSError) as e:
+                    print(f"mDNS refresh failed: {e}")
+            time.sleep(self.refresh_interval)
+
+    def refresh(self):
+        """Query the ADB server now, merge the results and expire old entries."""
+        with self._refresh_lock:
+            try:
+                found = parse_mdns_output(self.adb.mdns_services())
+            except (AdbError, OSError) as e:
+                self.error = str(e)
+                raise
+            now = time.time()
+            with self._lock:
+                for entry in found:
+                    key = f"{entry['name']} {entry['service']}"
+                    previous = self.entries.get(key)
+                    entry['first_seen'] = previous['first_seen'] if previous else now
+                    entry['last_seen'] = now
+                    self.entries[key] = entry
+                for key in [k for k, e in self.entries.items() if now - e['last_seen'] > self.ttl]:
+                    del self.entries[key]
+                self.refreshed_at = now
+                self.error = None
+                snapshot = {'entries': self.entries.copy(), 'refreshed_at': now}
+            if self.store is not None:
+                self.store.put('mdns_services', snapshot)
+
+    def _load_shared(self):
+        shared, seen = self.store.get_if_newer('mdns_services', self._shared_seen)
+        if shared is not None:
+            with self._lock:
+                self.entries, self.refreshed_at = shared['entries'], shared['refreshed_at']
+            self._shared_seen = seen
+
+    def services(self, service=ADB_SERVICE, max_age=None):
+        """
+        Unexpired entries, optionally only of one service type (None for all).
+
+        Refreshes inline if the cache is older than `max_age` seconds
+        (default: twice the refresh interval).
+        """
+        if self.store is not None and not self.leader:
+            self._load_shared()
+        max_age = max_age if max_age is not None else self.refresh_interval * 2
+        if time.time() - self.refreshed_at > max_age:
+            self.refresh()
+        now = time.time()
+        with self._lock:
+            entries = [
+                {**entry, 'expires_at': entry['last_seen'] + self.ttl}
+                for entry in self.entries.values()
+                if now - entry['last_seen'] <= self.ttl and (service is None or entry['service'] == service)
+            ]
+        return sorted(entries, key=lambda e: (e['name'], e['service']))
+
+
+# Shared cache used by the Flask routes and the reconciler.
+mdns_cache = MdnsCache()
+
+
+if __name__ == '__main__':
+    # Used by scripts/connect_ip_devices.sh: print the cached ADB services in the
+    # `adb mdns services` layout ("name<TAB>service<TAB>ip:port").
+    try:
+        for entry in mdns_cache.services():
+            print(f"{entry['name']}\t{entry['service']}.\t{entry['address']}")
+    except AdbError as e:
+        print(f"mDNS discovery failed: {e}", file=sys.stderr)
+        sys.exit(1)
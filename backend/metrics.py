@@ -0,0 +1,290 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Latency buckets (seconds) shared by the request and adb histograms.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Buckets for slow operations: process startup, tunnel URL, scans, scripts.
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+class _Sharded:
+    """
+    Base for metrics whose hot path must not take a lock.
+
+    Every thread writes into its own shard (a plain dict), so recording is a
+    dict lookup and a few integer additions. Shards are merged only when the
+    metrics are scraped; shards of finished threads are folded into a base
+    total so per-request threads do not accumulate.
+    """
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._base = {}
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+                if len(self._shards) > 256:
+                    self._compact()
+        return shard
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labelnames)
+
+    def _compact(self):
+        """Fold shards of dead threads into the base total. Caller holds the lock."""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                for key, value in list(shard.items()):
+                    self._merge_into(self._base, key, value)
+        self._shards = alive
+
+    def _merged(self):
+        with self._lock:
+            self._compact()
+            totals = {}
+            for key, value in self._base.items():
+                self._merge_into(totals, key, value)
+            for _, shard in self._shards:
+                for key, value in list(shard.items()):
+                    self._merge_into(totals, key, value)
+        return totals
+
+    def _labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter(_Sharded):
+    """A monotonically increasing count."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name if name.endswith('_total') else f"{name}_total", help_text, labelnames)
+
+    def inc(self, amount=1, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    @staticmethod
+    def _merge_into(totals, key, value):
+        totals[key] = totals.get(key, 0) + value
+
+    def samples(self):
+        for key, value in sorted(self._merged().items()):
+            yield f"{self.name}{self._labels(key)} {_format(value)}"
+
+
+class Histogram(_Sharded):
+    """Bucketed distribution of observations (e.g. durations in seconds)."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        entry = shard.get(key)
+        if entry is None:
+            # Per-bucket counts (+Inf last), then sum.
+            entry = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with-block. Labels may be changed inside it."""
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def _merge_into(totals, key, value):
+        current = totals.get(key)
+        if current is None:
+            totals[key] = list(value)
+        else:
+            for i, v in enumerate(value):
+                current[i] += v
+
+    def samples(self):
+        for key, entry in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), entry):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else _format(bound)
+                yield f"{self.name}_bucket{self._labels(key, ('le', le))} {cumulative}"
+            yield f"{self.name}_sum{self._labels(key)} {_format(entry[-1])}"
+            yield f"{self.name}_count{self._labels(key)} {cumulative}"
+
+
+class Gauge:
+    """A value that goes up and down; set directly or computed at scrape time."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), callback=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}
+
+    def set(self, value, **labels):
+        # A single dict assignment is atomic; no lock needed.
+        self._values[tuple(str(labels.get(label, '')) for label in self.labelnames)] = value
+
+    def samples(self):
+        if self.callback:
+            try:
+                values = {
+                    tuple(str(labels.get(label, '')) for label in self.labelnames): value
+                    for labels, value in self.callback()
+                }
+            except Exception as e:
+                print(f"Metrics callback for {self.name} failed: {e}")
+                return
+        else:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            if value is None:
+                continue
+            labels = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, key))
+            yield f"{self.name}{{{labels}}} {_format(value)}" if labels else f"{self.name} {_format(value)}"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format(value):
+    if isinstance(value, float):
+        if value == math.inf:
+            return '+Inf'
+        return repr(round(value, 6))
+    return str(value)
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, labelnames=(), callback=None):
+        return self._register(Gauge(name, help_text, labelnames, callback))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# Shared registry and the metrics recorded across the backend. Values are per
+# worker process.
+registry = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'magdroid_http_request_duration_seconds',
+    'Time to produce a response (streaming responses: until the first byte).',
+    ('method', 'route', 'status')
+)
+ADB_COMMAND_SECONDS = registry.histogram(
+    'magdroid_adb_command_duration_seconds',
+    'Duration of ADB server requests by service.',
+    ('command', 'transport', 'outcome')
+)
+ADB_COMMANDS = registry.counter(
+    'magdroid_adb_commands',
+    'ADB server requests by service and outcome.',
+    ('command', 'transport', 'outcome')
+)
+ADB_COALESCED = registry.counter(
+    'magdroid_adb_coalesced',
+    'ADB requests answered by another in-flight call (shared) or the short result cache (cached).',
+    ('command', 'source')
+)
+SCHEDULER_WAIT_SECONDS = registry.histogram(
+    'magdroid_scheduler_wait_seconds',
+    'Time adb operations wait in the device scheduler before they start.',
+    ('priority',)
+)
+SCRIPT_SECONDS = registry.histogram(
+    'magdroid_script_duration_seconds',
+    'Duration of the shell scripts in ./scripts.',
+    ('script', 'outcome'),
+    SLOW_BUCKETS
+)
+JOB_SECONDS = registry.histogram(
+    'magdroid_job_duration_seconds',
+    'Duration of background jobs.',
+    ('kind', 'status'),
+    SLOW_BUCKETS
+)
+SCAN_HOSTS = registry.counter('magdroid_scan_hosts', 'Hosts probed by the LAN scanner.')
+SCAN_FOUND = registry.counter('magdroid_scan_found', 'ADB ports found by the LAN scanner.')
+SCAN_SECONDS = registry.histogram('magdroid_scan_duration_seconds', 'Duration of LAN scans.', (), SLOW_BUCKETS)
+SCAN_HOSTS_PER_SECOND = registry.gauge(
+    'magdroid_scan_hosts_per_second', 'Throughput of the most recent LAN scan.'
+)
+PROCESS_READY_SECONDS = registry.histogram(
+    'magdroid_process_time_to_ready_seconds',
+    'Time from spawning a managed process until it is ready.',
+    ('process',),
+    SLOW_BUCKETS
+)
+TUNNEL_URL_SECONDS = registry.histogram(
+    'magdroid_tunnel_time_to_url_seconds',
+    'Time from starting cloudflared until the public URL is known.',
+    (),
+    SLOW_BUCKETS
+)
+HEALTH_PROBES = registry.counter(
+    'magdroid_health_probes',
+    'Device health probes by resulting status.',
+    ('status',)
+)
+HEALTH_RECONNECTS = registry.counter(
+    'magdroid_health_reconnects',
+    'Reconnects started by the health monitor.',
+    ('outcome',)
+)
@@ -3,21 +3,169 @@ import threading
 import time
 import re
 import os
+import heapq
+import itertools
+import socket
+import sqlite3
+from collections import deque
+
+import config
+from log_buffer import LogBuffer
+from metrics import PROCESS_READY_SECONDS, TUNNEL_URL_SECONDS
+
+
+def is_port_open(port, host='127.0.0.1', timeout=0.2):
+    """Return True if something accepts TCP connections on host:port."""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def read_proc_stats(pid):
+    """
+    Sample resource usage of a process from /proc/<pid>.
+
+    Returns:
+        dict or None: cpu_seconds, rss_bytes, threads and open_fds, or None if
+                      the process is gone or /proc is unavailable.
+    """
+    base = f"/proc/{pid}"
+    try:
+        with open(f"{base}/stat") as f:
+            # The command name may contain spaces; fields start after the last ')'.
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        threads = int(fields[17])
+        rss_bytes = 0
+        with open(f"{base}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss_bytes = int(line.split()[1]) * 1024
+                    break
+        try:
+            open_fds = len(os.listdir(f"{base}/fd"))
+        except OSError:
+            open_fds = None
+    except (OSError, IndexError, ValueError):
+        return None
+    return {
+        'time': time.time(),
+        'cpu_seconds': cpu_seconds,
+        'rss_bytes': rss_bytes,
+        'threads': threads,
+        'open_fds': open_fds
+    }
+
 
 class ProcessManager:
-    def __init__(self):
+    """
+    Starts and supervises the helper processes (ws-scrcpy, cloudflared).
+
+    With a `store`, every spawned process is also registered in the shared
+    state store, so other worker processes see it as running, can stop it and
+    read the tunnel URL, and starting (or restarting) a process is serialized
+    across workers. Output lines and readiness are written through to the
+    store as well, so any worker can serve a process's logs (read from the
+    store) and wait for it.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
         self.processes = {}
+        self.logs = {}
         self.cloudflared_url = None
         self.url_detected = False
+        # Set as soon as the tunnel URL shows up (or cloudflared exits).
+        self.url_event = threading.Event()
+        # Recent time-to-ready measurements, per process name.
+        self.ready_history = {}
+        # Supervisor state, kept across restarts of the same name.
+        self.restart_counts = {}
+        self.resource_history = {}
+        self._supervisor = None
+        self._lock = threading.RLock()
+
+    def _log_buffers(self, name):
+        """Return the stdout/stderr ring buffers for a process, creating them on first use."""
+        if name not in self.logs:
+            # Both streams share one sequence so they can be merged in order; with a store
+            # it continues where the last run (in any worker) left off.
+            counter = itertools.count(self.store.last_log_seq(name) + 1 if self.store else 1)
+            buffers = {}
+            for stream in ('stdout', 'stderr'):
+                log_file = None
+                if config.PROCESS_LOG_DIR:
+                    log_file = os.path.join(config.PROCESS_LOG_DIR, f"{name}.{stream}.log")
+                buffers[stream] = LogBuffer(
+                    max_lines=config.PROCESS_LOG_MAX_LINES,
+                    max_bytes=config.PROCESS_LOG_MAX_BYTES,
+                    counter=counter,
+                    log_file=log_file,
+                    file_max_bytes=config.PROCESS_LOG_FILE_MAX_BYTES,
+                    file_backups=config.PROCESS_LOG_FILE_BACKUPS
+                )
+            self.logs[name] = buffers
+        return self.logs[name]
         
-    def start_process(self, name, command, cwd=None, capture_output=False):
-        """Start a subprocess and track it"""
-        if name in self.processes:
-            return False
-            
-        env = os.environ.copy()
+    def start_process(self, name, command, cwd=None, capture_output=False, ready_pattern=None, env=None,
+                      restart_policy='never'):
+        """
+        Start a subprocess and track it.
+
+        If `ready_pattern` is given (requires capture_output), the process is
+        marked ready the moment a matching output line appears.
+
+        `restart_policy` controls what the supervisor does when the process
+        exits on its own: 'never', 'on-failure' (non-zero exit) or 'always'.
+        """
+        spec = {
+            'command': command,
+            'cwd': cwd,
+            'capture_output': capture_output,
+            'ready_pattern': ready_pattern,
+            'env': env,
+            'restart_policy': restart_policy
+        }
+        with self._lock:
+            if self.store:
+                # Check-and-spawn must be atomic across workers, not just threads.
+                with self.store.lock(f"process-{name}"):
+                    if self.is_process_running(name):
+                        return False
+                    self._spawn(name, spec)
+            else:
+                if self.is_process_running(name):
+                    return False
+                self._spawn(name, spec)
+        self.start_supervisor()
+        return True
+
+    def _spawn(self, name, spec):
+        """Launch a process from its spec and register it."""
+        command = spec['command']
+        cwd = spec['cwd']
+        capture_output = spec['capture_output']
+        ready_pattern = spec['ready_pattern']
+        env = dict(os.environ, **(spec['env'] or {}))
         
+        if name == 'cloudflared':
+            self.url_detected = False
+            self.cloudflared_url = None
+            self.url_event.clear()
+            if self.store:
+                self.store.delete('cloudflared_url')
+
         if capture_output:
+            if self.store and name in self.logs and \
+                    self.store.last_log_seq(name) > max(b.last_seq for b in self.logs[name].values()):
+                # Another worker ran it since; start new buffers on the shared sequence.
+                del self.logs[name]
+            self._log_buffers(name)
             process = subprocess.Popen(
                 command,
                 cwd=cwd,
@@ -28,52 +176,265 @@ class ProcessManager:
                 universal_newlines=True,
                 env=env
             )
-            
-            # Start threads to read stdout and stderr
-            threading.Thread(target=self._read_output, args=(process.stdout, name, 'stdout'), daemon=True).start()
-            threading.Thread(target=self._read_output, args=(process.stderr, name, 'stderr'), daemon=True).start()
         else:
             process = subprocess.Popen(command, cwd=cwd, env=env)
         
+        # Registered before the readers start so the first lines are never missed.
         self.processes[name] = {
             'process': process,
             'start_time': time.time(),
-            'output_lines': []
+            'ready_pattern': re.compile(ready_pattern) if ready_pattern else None,
+            'ready_event': threading.Event(),
+            'time_to_ready': None,
+            'spec': spec,
+            'stopping': False,
+            'exit_code': None
+        }
+        process_info = self.processes[name]
+        if self.store:
+            self.store.register_process(name, process.pid, process_info['start_time'], {
+                'command': command,
+                'restart_policy': spec['restart_policy']
+            })
+
+        if capture_output:
+            # Start threads to read stdout and stderr
+            threading.Thread(target=self._read_output, args=(process.stdout, name, 'stdout', process_info), daemon=True).start()
+            threading.Thread(target=self._read_output, args=(process.stderr, name, 'stderr', process_info), daemon=True).start()
+
+        # Reap the child as soon as it exits so crashes are handled immediately.
+        threading.Thread(target=self._watch, args=(name, process_info), daemon=True).start()
+        return process_info
+
+    def _watch(self, name, process_info):
+        """Wait for a process to exit and apply its restart policy."""
+        exit_code = process_info['process'].wait()
+        process_info['exit_code'] = exit_code
+        process_info['ready_event'].set()
+        if self.store:
+            pid = process_info['process'].pid
+            self.store.unregister_process(name, pid)
+            # Another worker stopped it through the store.
+            if self.store.get(f"stop-requested:{name}") == pid:
+                process_info['stopping'] = True
+                self.store.delete(f"stop-requested:{name}")
+
+        with self._lock:
+            if process_info['stopping'] or self.processes.get(name) is not process_info:
+                return
+            policy = process_info['spec']['restart_policy']
+            if policy == 'never' or (policy == 'on-failure' and exit_code == 0):
+                return
+
+            # Exponential backoff on consecutive crashes; a long, stable run resets it.
+            uptime = time.time() - process_info['start_time']
+            if uptime >= config.PROCESS_STABLE_AFTER:
+                process_info['consecutive_failures'] = 0
+            failures = process_info.get('consecutive_failures', 0)
+            delay = min(config.PROCESS_RESTART_BACKOFF * (2 ** failures), config.PROCESS_RESTART_MAX_BACKOFF)
+
+        print(f"{name} exited with code {exit_code}; restarting in {delay:.2f}s")
+        timer = threading.Timer(delay, self._restart, args=(name, process_info, failures + 1))
+        timer.daemon = True
+        timer.start()
+
+    def _restart(self, name, old_info, failures):
+        with self._lock:
+            # Someone stopped or replaced the process while we were backing off.
+            if old_info['stopping'] or self.processes.get(name) is not old_info:
+                return
+            if self.store:
+                with self.store.lock(f"process-{name}"):
+                    # Another worker started it again meanwhile.
+                    if self.store.get_process(name):
+                        return
+                    new_info = self._respawn(name, old_info)
+            else:
+                new_info = self._respawn(name, old_info)
+            if new_info:
+                new_info['consecutive_failures'] = failures
+                self.restart_counts[name] = self.restart_counts.get(name, 0) + 1
+
+    def _respawn(self, name, old_info):
+        try:
+            return self._spawn(name, old_info['spec'])
+        except OSError as e:
+            print(f"Failed to restart {name}: {e}")
+            return None
+
+    def start_supervisor(self):
+        """Start the resource sampling thread. Safe to call more than once."""
+        with self._lock:
+            if self._supervisor and self._supervisor.is_alive():
+                return
+            self._supervisor = threading.Thread(target=self._sample_loop, name='process-supervisor', daemon=True)
+            self._supervisor.start()
+
+    def _sample_loop(self):
+        while True:
+            for name, process_info in list(self.processes.items()):
+                if process_info['process'].poll() is not None:
+                    continue
+                sample = read_proc_stats(process_info['process'].pid)
+                if sample is None:
+                    continue
+                history = self.resource_history.setdefault(name, deque(maxlen=config.PROCESS_SAMPLE_HISTORY))
+                # CPU usage since the previous sample of the same pid.
+                previous = process_info.get('last_sample')
+                if previous:
+                    elapsed = sample['time'] - previous['time']
+                    used = sample['cpu_seconds'] - previous['cpu_seconds']
+                    sample['cpu_percent'] = round(100 * used / elapsed, 1) if elapsed > 0 else 0.0
+                process_info['last_sample'] = sample
+                history.append(sample)
+            time.sleep(config.PROCESS_SAMPLE_INTERVAL)
+
+    def get_resource_trend(self, name):
+        """Summarize the sampled history: latest values plus RSS/fd growth rates."""
+        history = list(self.resource_history.get(name, []))
+        if not history:
+            return None
+        first, last = history[0], history[-1]
+        minutes = (last['time'] - first['time']) / 60
+        cpu_values = [s['cpu_percent'] for s in history if 'cpu_percent' in s]
+        return {
+            'latest': last,
+            'samples': len(history),
+            'window_seconds': round(minutes * 60, 1),
+            'rss_bytes_per_minute': round((last['rss_bytes'] - first['rss_bytes']) / minutes) if minutes > 0 else 0,
+            'rss_peak_bytes': max(s['rss_bytes'] for s in history),
+            'cpu_percent_avg': round(sum(cpu_values) / len(cpu_values), 1) if cpu_values else None,
+            'open_fds_delta': (last['open_fds'] or 0) - (first['open_fds'] or 0)
         }
-        
-        if name == 'cloudflared':
-            self.url_detected = False
-            self.cloudflared_url = None
-        
-        return True
     
-    def _read_output(self, pipe, process_name, stream_type):
+    def _read_output(self, pipe, process_name, stream_type, process_info):
         """Read output from a subprocess pipe and log it."""
         try:
+            buffer = self._log_buffers(process_name)[stream_type]
             for line in iter(pipe.readline, ''):
                 if line:
                     line = line.rstrip()
-                    if process_name in self.processes:
-                        self.processes[process_name]['output_lines'].append(line)
+                    seq = buffer.append(line, stream_type)
+                    if self.store:
+                        try:
+                            self.store.append_log(process_name, seq, stream_type, line, config.PROCESS_LOG_MAX_LINES)
+                        except sqlite3.Error as e:
+                            print(f"Could not share {stream_type} of {process_name}: {e}")
                     
-                    print(f"[{process_name}:{stream_type}] {line}")
+                    if config.PROCESS_LOG_ECHO:
+                        print(f"[{process_name}:{stream_type}] {line}")
                     
+                    if process_info['time_to_ready'] is None:
+                        pattern = process_info['ready_pattern']
+                        if pattern and pattern.search(line):
+                            self.mark_ready(process_name, process_info)
+
                     if process_name == 'cloudflared' and not self.url_detected:
                         url_match = re.search(r'https://[^\s]+\.trycloudflare\.com', line)
                         if url_match:
                             self.cloudflared_url = url_match.group(0)
                             self.url_detected = True
+                            TUNNEL_URL_SECONDS.observe(time.time() - process_info['start_time'])
+                            if self.store:
+                                self.store.put('cloudflared_url', self.cloudflared_url)
+                            self.mark_ready(process_name, process_info)
+                            self.url_event.set()
             pipe.close()
         except Exception as e:
             print(f"Error reading {stream_type} for {process_name}: {e}")
+        finally:
+            # EOF means the process is gone: wake anyone still waiting on it.
+            process_info['ready_event'].set()
+            if process_name == 'cloudflared':
+                self.url_event.set()
+
+    def mark_ready(self, name, process_info=None):
+        """Record that a process is ready to serve and wake its waiters."""
+        process_info = process_info or self.processes.get(name)
+        if not process_info or process_info['time_to_ready'] is not None:
+            return
+        elapsed = time.time() - process_info['start_time']
+        process_info['time_to_ready'] = elapsed
+        self.ready_history.setdefault(name, deque(maxlen=20)).append(elapsed)
+        PROCESS_READY_SECONDS.observe(elapsed, process=name)
+        process_info['ready_event'].set()
+        if self.store:
+            self.store.put(f"ready:{name}", process_info['process'].pid)
+        print(f"{name} ready after {elapsed:.2f}s")
+
+    def wait_until_ready(self, name, timeout=60, port=None, host='127.0.0.1'):
+        """
+        Block until a process is ready, it exits, or `timeout` expires.
+
+        Readiness is either a `ready_pattern` output line (signalled by the
+        reader thread) or, when `port` is given, a successful TCP connect.
+        Port probes back off exponentially from 10 ms to 500 ms in between
+        waits on the ready event, so a matching line wakes us immediately.
+
+        Returns:
+            bool: True if the process became ready.
+        """
+        if not self._is_local(name):
+            return self._wait_until_ready_shared(name, timeout, port, host)
+        process_info = self.processes[name]
+        deadline = time.time() + timeout
+        delay = 0.01
+        while True:
+            if process_info['time_to_ready'] is not None:
+                return True
+            if process_info['process'].poll() is not None:
+                return False
+            if port and is_port_open(port, host):
+                self.mark_ready(name, process_info)
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            process_info['ready_event'].wait(min(delay, remaining))
+            delay = min(delay * 2, 0.5)
     
+    def _wait_until_ready_shared(self, name, timeout, port, host):
+        """Readiness of a process owned by another worker: its ready mark in the store, or a port probe."""
+        entry = self.store.get_process(name) if self.store else None
+        if not entry:
+            return False
+        deadline = time.time() + timeout
+        delay = 0.01
+        while True:
+            if self.store.get(f"ready:{name}") == entry['pid'] or (port and is_port_open(port, host)):
+                return True
+            if not self.store.get_process(name):
+                return False
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.5)
+
+    def _is_local(self, name):
+        """True if `name` is (or last was) owned by this worker rather than another one."""
+        process_info = self.processes.get(name)
+        if not process_info:
+            return False
+        if process_info['process'].poll() is None or not self.store:
+            return True
+        entry = self.store.get_process(name)
+        return not entry or entry['pid'] == process_info['process'].pid
+
     def stop_process(self, name):
         """Stop a tracked subprocess gracefully."""
-        if name not in self.processes:
+        if not self._is_local(name):
+            # Possibly started by another worker.
+            if self.store and self.store.terminate_process(name):
+                if name == 'cloudflared':
+                    self.store.delete('cloudflared_url')
+                return True
             return False
             
         process_info = self.processes[name]
         process = process_info['process']
+        # Tell the supervisor this exit is intentional.
+        process_info['stopping'] = True
         
         try:
             process.terminate()
@@ -84,10 +445,15 @@ class ProcessManager:
                 process.wait()
                 
             del self.processes[name]
+            if self.store:
+                self.store.unregister_process(name, process.pid)
             
             if name == 'cloudflared':
                 self.cloudflared_url = None
                 self.url_detected = False
+                self.url_event.clear()
+                if self.store:
+                    self.store.delete('cloudflared_url')
                 
             return True
         except Exception as e:
@@ -95,15 +461,15 @@ class ProcessManager:
             return False
     
     def is_process_running(self, name):
-        """Check if a process is still running."""
-        if name not in self.processes:
-            return False
-        return self.processes[name]['process'].poll() is None
+        """Check if a process is still running (in this worker or, with a store, any worker)."""
+        if name in self.processes and self.processes[name]['process'].poll() is None:
+            return True
+        return bool(self.store and self.store.get_process(name))
     
     def get_process_info(self, name):
         """Get information about a process."""
-        if name not in self.processes:
-            return None
+        if not self._is_local(name):
+            return self._get_shared_process_info(name)
         
         process_info = self.processes[name]
         process = process_info['process']
@@ -112,18 +478,101 @@ class ProcessManager:
             'pid': process.pid,
             'running': self.is_process_running(name),
             'start_time': process_info['start_time'],
-            'uptime': time.time() - process_info['start_time']
+            'uptime': time.time() - process_info['start_time'],
+            'time_to_ready': process_info['time_to_ready'],
+            'recent_times_to_ready': list(self.ready_history.get(name, [])),
+            'exit_code': process_info['exit_code'],
+            'restart_policy': process_info['spec']['restart_policy'],
+            'restarts': self.restart_counts.get(name, 0),
+            'resources': self.get_resource_trend(name)
         }
     
+    def _get_shared_process_info(self, name):
+        """Information about a process registered by another worker."""
+        entry = self.store.get_process(name) if self.store else None
+        if not entry:
+            return None
+        return {
+            'pid': entry['pid'],
+            'running': True,
+            'start_time': entry['start_time'],
+            'uptime': time.time() - entry['start_time'],
+            'restart_policy': entry['meta'].get('restart_policy'),
+            'owner_pid': entry['owner_pid'],
+            'resources': read_proc_stats(entry['pid'])
+        }
+
     def get_cloudflared_url(self, timeout=20):
-        """Get the public URL from cloudflared, waiting for it to be detected."""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if self.url_detected and self.cloudflared_url:
+        """Get the public URL from cloudflared, waiting until the reader signals it (or cloudflared exits)."""
+        if not self._is_local('cloudflared'):
+            if not self.store:
                 return self.cloudflared_url
-            time.sleep(1)
+            # cloudflared belongs to another worker; its URL arrives via the store.
+            deadline = time.time() + timeout
+            while True:
+                url = self.store.get('cloudflared_url')
+                if url or not self.store.get_process('cloudflared') or time.time() >= deadline:
+                    return url
+                time.sleep(0.1)
+        self.url_event.wait(timeout)
+        if self.url_detected and self.cloudflared_url:
+            return self.cloudflared_url
         return None
     
     def get_all_processes(self):
         """Get information about all running processes."""
-        return {name: self.get_process_info(name) for name in self.processes}
\ No newline at end of file
+        names = list(self.processes)
+        if self.store:
+            names += [name for name in self.store.all_processes() if name not in self.processes]
+        return {name: self.get_process_info(name) for name in names}
+
+    def get_logs(self, name, stream=None, since=0, tail=None, limit=None):
+        """
+        Read buffered output of a process.
+
+        Args:
+            name (str): Process name.
+            stream (str): 'stdout', 'stderr' or None for both, merged in order.
+            since (int): Only return lines with a sequence number above this.
+            tail (int): Return only the last `tail` matching lines.
+            limit (int): Return at most `limit` lines after `since`.
+
+        Returns:
+            dict or None: 'lines' plus 'next', the offset to pass as `since` next time.
+        """
+        if self.store:
+            # The store has every worker's lines, including runs started elsewhere.
+            return self._get_shared_logs(name, stream, since, tail, limit)
+        if name not in self.logs:
+            return None
+        buffers = self.logs[name]
+        selected = [buffers[stream]] if stream else list(buffers.values())
+
+        if tail:
+            entries = list(heapq.merge(*(b.tail(tail) for b in selected)))[-tail:]
+        else:
+            entries = list(heapq.merge(*(b.since(since, limit) for b in selected)))
+            if limit:
+                entries = entries[:limit]
+
+        return {
+            'lines': [
+                {'seq': seq, 'time': ts, 'stream': s, 'line': line}
+                for seq, ts, s, line in entries
+            ],
+            'next': entries[-1][0] if entries else since,
+            'buffers': {s: buffers[s].stats() for s in buffers}
+        }
+
+    def _get_shared_logs(self, name, stream, since, tail, limit):
+        if not self.store.last_log_seq(name):
+            return None
+        entries = self.store.read_logs(name, stream, since, tail, limit)
+        return {
+            'lines': [
+                {'seq': seq, 'time': ts, 'stream': s, 'line': line}
+                for seq, ts, s, line in entries
+            ],
+            'next': entries[-1][0] if entries else since,
+            'buffers': self.store.log_stats(name)
+        }
@@ -0,0 +1,284 @@
+import os
+import threading
+import time
+
+import config
+from adb_client import AdbError
+from device_ops import run_bulk, connect_one, disconnect_one, is_usb_device
+from device_properties import property_cache as default_property_cache
+from device_scheduler import HEALTH
+from device_registry import device_registry as default_registry
+from ip_ranges import get_matcher, extract_ip
+from mdns import mdns_cache as default_mdns_cache
+from scanner import iter_scan
+from state_store import state_store
+
+
+class KnownDevices:
+    """
+    Every TCP/IP device this host has seen, kept on disk in the state store.
+
+    A row is keyed by the device's last ip:port and remembers its hardware
+    serial, mDNS name and when it was last seen and connected. When a serial
+    turns up at a new address (DHCP gave it a new lease) the old row is
+    replaced, so each physical device has one entry.
+    """
+
+    def __init__(self, store=None):
+        self.store = store or state_store
+        self.store.execute(
+            'CREATE TABLE IF NOT EXISTS known_devices ('
+            'address TEXT PRIMARY KEY, serial TEXT, mdns_name TEXT, first_seen REAL, last_seen REAL, '
+            'last_connected REAL, failures INTEGER DEFAULT 0)'
+        )
+        self.store.execute('CREATE INDEX IF NOT EXISTS known_devices_serial ON known_devices (serial)')
+
+    def record(self, address, serial=None, mdns_name=None, connected=False):
+        """Note that `address` was seen (and, with `connected`, is attached right now)."""
+        now = time.time()
+        with self.store.transaction() as conn:
+            if serial:
+                conn.execute('DELETE FROM known_devices WHERE serial = ? AND address != ?', (serial, address))
+            conn.execute(
+                'INSERT INTO known_devices (address, serial, mdns_name, first_seen, last_seen, last_connected, failures) '
+                'VALUES (?, ?, ?, ?, ?, ?, 0) '
+                'ON CONFLICT (address) DO UPDATE SET '
+                'serial = COALESCE(excluded.serial, serial), '
+                'mdns_name = COALESCE(excluded.mdns_name, mdns_name), '
+                'last_seen = excluded.last_seen, '
+                'last_connected = COALESCE(excluded.last_connected, last_connected), '
+                'failures = CASE WHEN excluded.last_connected IS NULL THEN failures ELSE 0 END',
+                (address, serial, mdns_name, now, now, now if connected else None)
+            )
+
+    def mark_failed(self, address):
+        self.store.execute('UPDATE known_devices SET failures = failures + 1 WHERE address = ?', (address,))
+
+    def forget(self, address):
+        self.store.execute('DELETE FROM known_devices WHERE address = ?', (address,))
+
+    def prune(self, max_age=None):
+        """Forget devices not seen for `max_age` seconds (default KNOWN_DEVICE_MAX_AGE)."""
+        cutoff = time.time() - (max_age or config.KNOWN_DEVICE_MAX_AGE)
+        return self.store.execute('DELETE FROM known_devices WHERE last_seen < ?', (cutoff,)).rowcount
+
+    def all(self):
+        """Every known device, most recently connected first."""
+        rows = self.store.execute(
+            'SELECT address, serial, mdns_name, first_seen, last_seen, last_connected, failures '
+            'FROM known_devices ORDER BY last_connected IS NULL, last_connected DESC'
+        ).fetchall()
+        fields = ('address', 'serial', 'mdns_name', 'first_seen', 'last_seen', 'last_connected', 'failures')
+        return [dict(zip(fields, row)) for row in rows]
+
+
+class Reconciler:
+    """
+    Keeps the ADB server's TCP/IP connections in line with the desired state.
+
+    Desired: every known or discovered device inside DEVICES_RANGE is
+    connected, and (with RECONCILE_DISCONNECT_OUT_OF_RANGE) none of its known
+    devices outside it is; devices this instance never managed are left to
+    whoever shares the ADB server. Each pass compares that with the device registry and only
+    connects or disconnects the differences, never restarting the ADB
+    server. Last-known addresses and mDNS are tried first; a LAN sweep is the
+    fallback when known devices cannot be reached, at most every
+    RECONCILE_SCAN_INTERVAL seconds (or whenever a full scan is asked for).
+
+    With a shared store only one worker process runs the background loop.
+    """
+
+    def __init__(self, registry=None, properties=None, mdns=None, store=None, known=None,
+                 interval=None, scan_interval=None):
+        self.registry = registry or default_registry
+        self.properties = properties or default_property_cache
+        self.mdns = mdns or default_mdns_cache
+        self.store = store or state_store
+        self.known = known or KnownDevices(self.store)
+        self.interval = config.RECONCILE_INTERVAL if interval is None else interval
+        self.scan_interval = config.RECONCILE_SCAN_INTERVAL if scan_interval is None else scan_interval
+        self.last_scan = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wake = threading.Event()
+
+    def start(self):
+        """Start the background loop (first pass right away). Safe to call more than once."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return False
+            self.registry.start()
+            self._thread = threading.Thread(target=self._run, name='reconciler', daemon=True)
+            self._thread.start()
+        return True
+
+    def trigger(self):
+        """Run the next background pass now instead of waiting for the interval."""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            if self.store.try_acquire('reconciler'):
+                # Give the registry a moment to sync so the first diff is accurate.
+                deadline = time.monotonic() + 5
+                while not self.registry.synced and time.monotonic() < deadline:
+                    time.sleep(0.1)
+                try:
+                    lines = []
+                    summary = self.reconcile(log=lines.append)
+                    # Only passes that changed something (or failed to) are worth logging.
+                    if summary['connected'] or summary['disconnected'] or summary['failed']:
+                        print("\n".join(lines))
+                except Exception as e:
+                    print(f"Reconcile pass failed: {e}")
+            self._wake.wait(self.interval or None)
+            self._wake.clear()
+
+    def status(self):
+        """Result of the last pass (from any worker) plus the known-device count."""
+        return {
+            'last_run': self.store.get('reconciler'),
+            'known_devices': len(self.known.all()),
+            'interval': self.interval,
+            'scan_interval': self.scan_interval
+        }
+
+    def _connect(self, addresses, log, summary):
+        """Connect `addresses` in parallel; returns the set that connected."""
+        if not addresses:
+            return set()
+        results, _ = run_bulk(connect_one, sorted(addresses), timeout=config.RECONCILE_CONNECT_TIMEOUT,
+                              priority=HEALTH)
+        connected = set()
+        for r in results:
+            if r['ok']:
+                connected.add(r['device'])
+                self.known.record(r['device'], connected=True)
+            else:
+                self.known.mark_failed(r['device'])
+            log(f"{'✔' if r['ok'] else '✖'} connect {r['device']} ({r['latency_ms']} ms) {r['output']}")
+        summary['connected'].extend(sorted(connected))
+        summary['failed'].extend(sorted(set(addresses) - connected))
+        return connected
+
+    def _disconnect(self, addresses, log, summary):
+        if not addresses:
+            return
+        results, _ = run_bulk(disconnect_one, sorted(addresses), timeout=config.RECONCILE_CONNECT_TIMEOUT,
+                              priority=HEALTH)
+        for r in results:
+            if r['ok']:
+                summary['disconnected'].append(r['device'])
+            log(f"{'✔' if r['ok'] else '✖'} disconnect {r['device']} ({r['latency_ms']} ms) {r['output']}")
+
+    def _discover_mdns(self, matcher, log, fresh=False):
+        """In-range addresses advertised over mDNS (their names are remembered)."""
+        try:
+            if fresh:
+                self.mdns.refresh()
+            services = self.mdns.services()
+        except (AdbError, OSError) as e:
+            log(f"mDNS discovery failed: {e}")
+            return set()
+        found = set()
+        for service in services:
+            if matcher.contains(service['ip']):
+                self.known.record(service['address'], mdns_name=service['name'])
+                found.add(service['address'])
+        log(f"mDNS: {len(found)} in-range service(s).")
+        return found
+
+    def _discover_scan(self, ranges_str, log):
+        """ip:port of every open ADB port in range, from a LAN sweep."""
+        self.last_scan = time.monotonic()
+        found = set()
+        try:
+            for result in iter_scan(ranges_str):
+                if result['type'] == 'found':
+                    found.add(result['address'])
+                elif result['type'] == 'error':
+                    log(f"LAN scan error: {result['details']}")
+        except ValueError as e:
+            log(f"LAN scan skipped: {e}")
+        log(f"LAN scan: {len(found)} open ADB port(s).")
+        return found
+
+    def _identify(self, addresses):
+        """Learn hardware serials of connected devices so moved devices replace their old entry."""
+        if not addresses:
+            return
+        entries = self.properties.get_many(addresses, wait=config.PROPERTY_WAIT)
+        for address in addresses:
+            properties = (entries.get(address) or {}).get('properties') or {}
+            if properties.get('hardware_serial'):
+                self.known.record(address, serial=properties['hardware_serial'], connected=True)
+
+    def reconcile(self, full_scan=False, log=print):
+        """
+        Run one reconcile pass.
+
+        Args:
+            full_scan (bool): Sweep the LAN even if every known device connected.
+            log (callable): Receives progress lines (e.g. job.log).
+
+        Returns:
+            dict: Summary of what was connected, disconnected and still missing.
+        """
+        with self.store.lock('reconcile'):
+            return self._reconcile(full_scan, log)
+
+    def _reconcile(self, full_scan, log):
+        start = time.monotonic()
+        ranges_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
+        matcher = get_matcher(ranges_str)
+        summary = {'connected': [], 'disconnected': [], 'failed': [], 'scanned': False}
+
+        # Actual state: TCP/IP devices attached to the ADB server.
+        devices = [d for d in self.registry.get_devices() if not is_usb_device(d) and extract_ip(d['serial'])]
+        in_range = {d['serial']: d['state'] for d in devices if matcher.contains(extract_ip(d['serial']))}
+        online = {serial for serial, state in in_range.items() if state == 'device'}
+        for serial in online:
+            self.known.record(serial, connected=True)
+        log(f"Using IP Range: {ranges_str}")
+        log(f"{len(online)} device(s) connected in range, {len(devices) - len(in_range)} outside it.")
+
+        # Undesired: devices outside the range, and offline transports (reconnected below).
+        stale = {serial for serial, state in in_range.items() if state == 'offline'}
+        for serial in stale:
+            self.known.record(serial)
+        if config.RECONCILE_DISCONNECT_OUT_OF_RANGE:
+            ours = {d['address'] for d in self.known.all()}
+            stale |= {d['serial'] for d in devices if d['serial'] not in in_range and d['serial'] in ours}
+        self._disconnect(stale, log, summary)
+
+        # Desired: known devices first, then anything advertised over mDNS.
+        known = {d['address'] for d in self.known.all() if matcher.contains(extract_ip(d['address']))}
+        missing = known - online
+        log(f"{len(known)} known device(s) in range, {len(missing)} to reconnect.")
+        connected = self._connect(missing, log, summary)
+        unreachable = missing - connected
+
+        discovered = self._discover_mdns(matcher, log, fresh=full_scan) - online - missing
+        connected |= self._connect(discovered, log, summary)
+
+        # Fallback: known devices may have moved to a new address.
+        scan_due = time.monotonic() - self.last_scan >= self.scan_interval or not self.last_scan
+        if full_scan or ((unreachable or not known) and scan_due):
+            summary['scanned'] = True
+            found = self._discover_scan(ranges_str, log) - online - connected - missing
+            connected |= self._connect(found, log, summary)
+        self._identify(sorted(connected))
+
+        self.known.prune()
+        summary['failed'] = sorted(set(summary['failed']) - connected)
+        summary['online'] = len(online | connected)
+        summary['finished_at'] = time.time()
+        summary['elapsed_ms'] = round((time.monotonic() - start) * 1000, 1)
+        self.store.put('reconciler', summary)
+        log(f"Reconciled in {summary['elapsed_ms']} ms: {len(summary['connected'])} connected, "
+            f"{len(summary['disconnected'])} disconnected, {len(summary['failed'])} unreachable.")
+        return summary
+
+
+# Shared reconciler used by the Flask routes.
+reconciler = Reconciler()
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import queue
+import resource
+import socket
+import sys
+import threading
+import time
+
+import config
+from ip_ranges import get_matcher
+from metrics import SCAN_HOSTS, SCAN_FOUND, SCAN_SECONDS, SCAN_HOSTS_PER_SECOND
+
+
+# File descriptors kept free for Flask, adb and the managed processes.
+FD_RESERVE = 128
+
+
+def effective_concurrency(requested):
+    """Clamp the requested concurrency so a sweep cannot exhaust the fd table."""
+    try:
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ValueError, OSError):
+        return requested
+    if soft == resource.RLIM_INFINITY:
+        return requested
+    return max(1, min(requested, soft - FD_RESERVE))
+
+
+async def probe(ip, port, timeout):
+    """
+    Try a non-blocking TCP connect to ip:port.
+
+    Returns:
+        float or None: Connect latency in seconds, or None if the port is closed,
+                       filtered or did not answer within `timeout`.
+    """
+    loop = asyncio.get_running_loop()
+    family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    start = time.monotonic()
+    try:
+        await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), timeout)
+        return time.monotonic() - start
+    except (OSError, asyncio.TimeoutError):
+        return None
+    finally:
+        sock.close()
+
+
+async def scan(addresses, port=None, concurrency=None, timeout=None, stop_event=None, stats=None):
+    """
+    Probe every address and yield a result dict for each open ADB port.
+
+    A fixed number of workers pull from a shared iterator, so memory and open
+    sockets stay bounded by `concurrency` no matter how large the range is.
+    """
+    port = port or config.ADB_TCP_PORT
+    timeout = timeout or config.SCAN_TIMEOUT
+    concurrency = effective_concurrency(concurrency or config.SCAN_CONCURRENCY)
+    stats = stats if stats is not None else {}
+    stats.update({'scanned': 0, 'found': 0, 'port': port, 'concurrency': concurrency})
+
+    results = asyncio.Queue()
+    addresses = iter(addresses)
+
+    async def worker():
+        for ip in addresses:
+            if stop_event is not None and stop_event.is_set():
+                break
+            latency = await probe(ip, port, timeout)
+            stats['scanned'] += 1
+            if latency is not None:
+                stats['found'] += 1
+                await results.put({
+                    'type': 'found',
+                    'ip': ip,
+                    'address': f"[{ip}]:{port}" if ':' in ip else f"{ip}:{port}",
+                    'latency_ms': round(latency * 1000, 2)
+                })
+        await results.put(None)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    remaining = len(workers)
+    try:
+        while remaining:
+            item = await results.get()
+            if item is None:
+                remaining -= 1
+            else:
+                yield item
+    finally:
+        for task in workers:
+            task.cancel()
+
+
+def iter_scan(ranges_str=None, port=None, concurrency=None, timeout=None, max_hosts=None):
+    """
+    Synchronous, streaming sweep of the configured device ranges.
+
+    The asyncio loop runs on its own thread; results are yielded to the caller
+    as soon as they are found, and the final item is a 'summary' dict. Closing
+    the generator early stops the sweep.
+    """
+    if ranges_str is None:
+        ranges_str = os.getenv('DEVICES_RANGE', "192.168.1.0/24")
+    max_hosts = max_hosts or config.SCAN_MAX_HOSTS
+
+    # Only IPv4 ranges are swept; IPv6 prefixes are far too large to enumerate.
+    matcher = get_matcher(ranges_str)
+    total = matcher.size(4)
+    if total > max_hosts:
+        raise ValueError(f"Range covers {total} addresses, which exceeds SCAN_MAX_HOSTS ({max_hosts}).")
+
+    results = queue.Queue()
+    stop_event = threading.Event()
+    stats = {}
+
+    async def run():
+        async for item in scan(matcher.addresses(4), port, concurrency, timeout, stop_event, stats):
+            results.put(item)
+
+    def runner():
+        start = time.monotonic()
+        try:
+            asyncio.run(run())
+        except Exception as e:
+            results.put({'type': 'error', 'details': str(e)})
+        elapsed = time.monotonic() - start
+        stats.update({
+            'type': 'summary',
+            'total': total,
+            'elapsed': round(elapsed, 3),
+            'hosts_per_second': round(stats.get('scanned', 0) / elapsed, 1) if elapsed else 0.0
+        })
+        SCAN_HOSTS.inc(stats.get('scanned', 0))
+        SCAN_FOUND.inc(stats.get('found', 0))
+        SCAN_SECONDS.observe(elapsed)
+        SCAN_HOSTS_PER_SECOND.set(stats['hosts_per_second'])
+        results.put(None)
+
+    thread = threading.Thread(target=runner, name='lan-scan', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            yield item
+        yield stats
+    finally:
+        stop_event.set()
+
+
+if __name__ == '__main__':
+    # Used by scripts/connect_ip_devices.sh: print one 'ip:port' per open ADB port.
+    for result in iter_scan():
+        if result['type'] == 'found':
+            print(result['address'], flush=True)
+        elif result['type'] == 'summary':
+            print(f"Scanned {result['scanned']} hosts in {result['elapsed']}s "
+                  f"({result['hosts_per_second']} hosts/s)", file=sys.stderr)
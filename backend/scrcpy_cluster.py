@@ -0,0 +1,158 @@
+import bisect
+import hashlib
+import json
+import os
+import threading
+
+import config
+
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes, so resizing moves only ~1/N of the keys."""
+
+    def __init__(self, nodes, replicas=100):
+        self.replicas = replicas
+        self._keys = []
+        self._nodes = {}
+        for node in nodes:
+            for i in range(replicas):
+                key = self._hash(f"{node}#{i}")
+                self._nodes[key] = node
+                bisect.insort(self._keys, key)
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+    def get(self, key):
+        if not self._keys:
+            return None
+        i = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._nodes[self._keys[i]]
+
+
+class ScrcpyCluster:
+    """
+    Runs N ws-scrcpy instances on consecutive ports and routes devices to them.
+
+    Instance 0 keeps the historical process name 'ws-scrcpy' and the base port
+    (9786 by default); the others are 'ws-scrcpy-<i>' on base port + i. Every
+    instance can serve every device, so sharding is a routing decision: each
+    device is pinned to one instance, either by consistent hashing of its
+    serial ('hash') or by sticky least-loaded assignment ('least-loaded').
+    """
+
+    def __init__(self, process_manager, path, count=None, base_port=None, policy=None):
+        self.process_manager = process_manager
+        self.path = path
+        self.count = max(1, count or config.WS_SCRCPY_INSTANCES)
+        self.base_port = base_port or config.WS_SCRCPY_BASE_PORT
+        self.policy = policy or config.WS_SCRCPY_ASSIGNMENT
+        self.instances = [
+            {
+                'index': i,
+                'name': 'ws-scrcpy' if i == 0 else f'ws-scrcpy-{i}',
+                'port': self.base_port + i
+            }
+            for i in range(self.count)
+        ]
+        self._by_name = {inst['name']: inst for inst in self.instances}
+        self._ring = HashRing([inst['name'] for inst in self.instances])
+        self._assignments = {}
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.instances[0]
+
+    def local_url(self, instance):
+        return f"ws://localhost:{instance['port']}"
+
+    def start_command(self):
+        """Return (command, message) used to launch ws-scrcpy."""
+        # Optimization: Check if the 'dist' build already exists
+        dist_path = os.path.join(self.path, 'dist', 'index.js')
+        if os.path.exists(dist_path):
+            return ['node', 'dist/index.js'], "Starting ws-scrcpy from existing build..."
+        return ['npm', 'start'], "No build found. Running 'npm start' (this may take a minute)..."
+
+    def _write_config(self, instance):
+        """Write a per-instance ws-scrcpy config that only overrides the listen port."""
+        os.makedirs(config.RUNTIME_DIR, exist_ok=True)
+        config_path = os.path.join(config.RUNTIME_DIR, f"{instance['name']}.json")
+        with open(config_path, 'w') as f:
+            json.dump({'server': [{'secure': False, 'port': instance['port']}]}, f)
+        return config_path
+
+    def launch(self, instance, log=print):
+        """Start one instance without waiting for it to become ready."""
+        start_command, startup_message = self.start_command()
+        log(f"[{instance['name']}:{instance['port']}] {startup_message}")
+        return self.process_manager.start_process(
+            instance['name'],
+            start_command,
+            cwd=self.path,
+            capture_output=True,
+            ready_pattern=r'Listening on',
+            env={'WS_SCRCPY_CONFIG': self._write_config(instance)},
+            restart_policy=config.WS_SCRCPY_RESTART_POLICY
+        )
+
+    def is_running(self, instance):
+        return self.process_manager.is_process_running(instance['name'])
+
+    def running_instances(self):
+        return [inst for inst in self.instances if self.is_running(inst)]
+
+    def all_running(self):
+        return all(self.is_running(inst) for inst in self.instances)
+
+    def stop_all(self):
+        """Stop every instance. Returns the names that were running."""
+        return [inst['name'] for inst in self.instances if self.process_manager.stop_process(inst['name'])]
+
+    # ------------------------------------------------------------------
+    # Device routing
+    # ------------------------------------------------------------------
+    def instance_for(self, serial):
+        """Return the instance that should serve a device."""
+        if self.count == 1:
+            return self.primary
+        if self.policy == 'least-loaded':
+            with self._lock:
+                name = self._assignments.get(serial)
+                if name is None:
+                    loads = {inst['name']: 0 for inst in self.instances}
+                    for assigned in self._assignments.values():
+                        loads[assigned] = loads.get(assigned, 0) + 1
+                    name = min(self.instances, key=lambda inst: (loads[inst['name']], inst['index']))['name']
+                    self._assignments[serial] = name
+            return self._by_name[name]
+        return self._by_name[self._ring.get(serial)]
+
+    def assign(self, serials):
+        """
+        Map every serial to an instance.
+
+        For the least-loaded policy, devices that are no longer present are
+        released first so their slots can be reused.
+        """
+        serials = list(serials)
+        if self.policy == 'least-loaded':
+            present = set(serials)
+            with self._lock:
+                for serial in [s for s in self._assignments if s not in present]:
+                    del self._assignments[serial]
+        return {serial: self.instance_for(serial) for serial in serials}
+
+    def describe(self, instance, device_count=None):
+        info = {
+            'name': instance['name'],
+            'index': instance['index'],
+            'port': instance['port'],
+            'local_url': self.local_url(instance),
+            'running': self.is_running(instance)
+        }
+        if device_count is not None:
+            info['devices'] = device_count
+        return info
@@ -17,70 +17,77 @@ echo "=============================================="
 echo "Using IP Range: $DEVICES_RANGE"
 echo
 
-# Convert IP address to an integer for comparison.
-ip_to_int() {
+# Convert IP address to an integer without forking a subshell (result in IP_INT).
+set_ip_int() {
     local a b c d
     IFS=. read -r a b c d <<<"$1"
-    echo "$(( (a << 24) | (b << 16) | (c << 8) | d ))"
+    IP_INT=$(( (a << 24) | (b << 16) | (c << 8) | d ))
 }
 
-# Check if a given IP is within any of the specified ranges.
-is_ip_in_range() {
-    local ip_to_check_int
-    ip_to_check_int=$(ip_to_int "$1")
-    
-    # Use standard IFS for splitting.
-    local OLD_IFS="$IFS"
-    IFS=','
-    
+# Convert IP address to an integer for comparison.
+ip_to_int() {
+    set_ip_int "$1"
+    echo "$IP_INT"
+}
+
+# Compile DEVICES_RANGE once into integer intervals so that range checks are
+# pure shell arithmetic (no ipcalc or subshell per check).
+RANGE_STARTS=()
+RANGE_ENDS=()
+compile_ranges() {
+    local range prefix mask
+    local IFS=','
+
     for range in $DEVICES_RANGE; do
-        # Restore IFS if needed inside the loop, though we mostly use pattern matching.
-        IFS="$OLD_IFS"
+        range="${range//[[:space:]\"]/}"
+        [ -z "$range" ] && continue
+        # IPv6 ranges are only enforced by the backend.
+        [[ "$range" == *":"* ]] && continue
 
         # CIDR format: 192.168.1.0/24
-        if [[ "$range" == *"/"* ]]; then
-            # Use ipcalc to check if the IP is in the subnet.
-            if ipcalc -c -n "$range" "$1" &>/dev/null; then
-                return 0 # IP is in the range.
-            fi
+        if [[ "$range" =~ ^[0-9]+\.[0-9]+\.[0-9]+\.[0-9]+/[0-9]+$ ]]; then
+            prefix="${range#*/}"
+            set_ip_int "${range%/*}"
+            mask=$(( prefix == 0 ? 0 : (0xFFFFFFFF << (32 - prefix)) & 0xFFFFFFFF ))
+            RANGE_STARTS+=( $(( IP_INT & mask )) )
+            RANGE_ENDS+=( $(( (IP_INT & mask) | (~mask & 0xFFFFFFFF) )) )
 
         # Range format: 192.168.1.40-192.168.1.45
-        elif [[ "$range" == *"-"* ]]; then
-            local start_ip end_ip
-            start_ip="${range%-*}"
-            end_ip="${range#*-}"
-            
-            local start_ip_int end_ip_int
-            start_ip_int=$(ip_to_int "$start_ip")
-            end_ip_int=$(ip_to_int "$end_ip")
-            
-            if [[ "$ip_to_check_int" -ge "$start_ip_int" ]] && [[ "$ip_to_check_int" -le "$end_ip_int" ]]; then
-                return 0 # IP is in the range.
-            fi
+        elif [[ "$range" =~ ^[0-9]+\.[0-9]+\.[0-9]+\.[0-9]+-[0-9]+\.[0-9]+\.[0-9]+\.[0-9]+$ ]]; then
+            set_ip_int "${range%-*}"
+            RANGE_STARTS+=( "$IP_INT" )
+            set_ip_int "${range#*-}"
+            RANGE_ENDS+=( "$IP_INT" )
 
         # Single IP format: 192.168.2.100
-        else
-            if [[ "$1" == "$range" ]]; then
-                return 0 # IP matches.
-            fi
+        elif [[ "$range" =~ ^[0-9]+\.[0-9]+\.[0-9]+\.[0-9]+$ ]]; then
+            set_ip_int "$range"
+            RANGE_STARTS+=( "$IP_INT" )
+            RANGE_ENDS+=( "$IP_INT" )
         fi
+    done
+}
+compile_ranges
 
-        # Reset IFS for the next iteration of the loop.
-        IFS=","
+# Check if a given IP is within any of the specified ranges.
+is_ip_in_range() {
+    [[ "$1" =~ ^[0-9]+\.[0-9]+\.[0-9]+\.[0-9]+$ ]] || return 1
+    set_ip_int "$1"
+
+    local i
+    for i in "${!RANGE_STARTS[@]}"; do
+        if (( IP_INT >= RANGE_STARTS[i] && IP_INT <= RANGE_ENDS[i] )); then
+            return 0 # IP is in the range.
+        fi
     done
-    
-    # Restore original IFS after loop.
-    IFS="$OLD_IFS"
-    
+
     return 1 # IP is not in any of the ranges.
 }
 
-echo " • Restarting ADB server..."
-adb kill-server >/dev/null 2>&1
-sleep 1
+# Never restart the ADB server: that would drop every device already connected.
+echo " • Making sure the ADB server is running..."
 adb start-server >/dev/null 2>&1
-sleep 1
-echo "   → ADB restarted."
+echo "   → ADB server ready."
 echo
 
 
@@ -94,7 +101,10 @@ echo "$ADB_CONNECTED"
 # [B] DISCOVER DEVICES VIA mDNS
 # ==========================================
 echo " • Scanning ADB mDNS services..."
-MDNS_RAW=$(adb mdns services | grep "_adb._tcp")
+# Read from the backend's mDNS cache (refreshed in the background) instead of
+# starting another discovery.
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+MDNS_RAW=$(python3 "$SCRIPT_DIR/../mdns.py" | grep "_adb._tcp")
 
 if [ -z "$MDNS_RAW" ]; then
     echo "   → No mDNS devices found!"
@@ -109,8 +119,6 @@ echo "$MDNS_FOUND"
 # [C] SCAN LOCAL NETWORK
 # ==========================================
 LAN_DEVICES=""
-SCAN_TIMEOUT_PING="0.1"     # 100 ms
-SCAN_TIMEOUT_PORT="0.2"     # 200 ms
 
 echo
 echo "⚡ Running Ultra-Fast LAN Scan"
@@ -123,61 +131,11 @@ TMPFILE=$(mktemp)
 # Allow many parallel sockets
 ulimit -n 4096
 
-# Helper: iterate over DEVICE_RANGE (supports CIDR or dash ranges)
-iterate_ip_range() {
-    local range="$1"
-
-    if [[ "$range" == *"/"* ]]; then
-        # CIDR range → use 'prips' or 'ipcalc -n'
-        # Fallback to seq on last octet
-        BASE="${range%.*}.0"
-        START=1
-        END=254
-        for i in $(seq $START $END); do
-            echo "${BASE%0}$i"
-        done
-    elif [[ "$range" == *"-"* ]]; then
-        # Dash range: 192.168.1.40-192.168.1.45
-        local start_ip="${range%-*}"
-        local end_ip="${range#*-}"
-
-        local start_int end_int
-        start_int=$(ip_to_int "$start_ip")
-        end_int=$(ip_to_int "$end_ip")
-
-        for ((ip=start_int; ip<=end_int; ip++)); do
-            echo "$(int_to_ip "$ip")"
-        done
-    else
-        # Single IP
-        echo "$range"
-    fi
-}
-
-# Helper: convert int → IP
-int_to_ip() {
-    local ip=$1
-    echo "$(( (ip >> 24) & 255 )).$(( (ip >> 16) & 255 )).$(( (ip >> 8) & 255 )).$((ip & 255))"
-}
-
-# Iterate through DEVICE_RANGE and scan each IP
-for range in ${DEVICE_RANGE//,/ }; do
-    while read -r IP; do
-        (
-            # ⚡ ultra fast ping
-            ping -c1 -W$SCAN_TIMEOUT_PING "$IP" >/dev/null 2>&1 || exit
-
-            # ⚡ ultra fast ADB port check
-            timeout $SCAN_TIMEOUT_PORT bash -c "</dev/tcp/$IP/5555" 2>/dev/null || exit
-
-            # Only write authorized IPs
-            echo "$IP:5555" >> "$TMPFILE"
-        ) &
-    done < <(iterate_ip_range "$range")
-done
-
-# Wait for all background jobs
-wait
+# The sweep runs in the backend's asyncio scanner: it enumerates every address
+# in DEVICES_RANGE (full CIDRs, dash ranges and single IPs) and does
+# non-blocking connects to the ADB port with bounded concurrency.
+DEVICES_RANGE="$DEVICES_RANGE" ADB_TCP_PORT="$ADB_PORT" python3 "$SCRIPT_DIR/../scanner.py" \
+    | grep -E '^[0-9]+\.[0-9]+\.[0-9]+\.[0-9]+:[0-9]+$' > "$TMPFILE"
 
 if [ -s "$TMPFILE" ]; then
     echo "✔ Active & authorized ADB devices detected:"
@@ -0,0 +1,293 @@
+import fcntl
+import json
+import os
+import signal
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+
+
+def proc_start_ticks(pid):
+    """
+    Return the kernel start time of a pid (clock ticks since boot).
+
+    Stored alongside the pid so a recycled pid is never mistaken for the
+    process we registered.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return int(f.read().rsplit(')', 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def pid_alive(pid, start_ticks=None):
+    """Check that a pid exists (and, if given, is the same process instance)."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    if start_ticks is not None:
+        current = proc_start_ticks(pid)
+        if current is not None and current != start_ticks:
+            return False
+    # A zombie still answers kill(0) but is not running.
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            if f.read().rsplit(')', 1)[1].split()[0] == 'Z':
+                return False
+    except (OSError, IndexError):
+        pass
+    return True
+
+
+class StateStore:
+    """
+    State shared by every backend worker process on this host.
+
+    Backed by a SQLite database in WAL mode (readers never block the writer),
+    plus flock-based lock files for cross-process mutual exclusion. It holds
+    the registry of managed processes and the tail of their output, the tunnel
+    URL and the device snapshot, so several gunicorn workers see the same world
+    and never start duplicate ws-scrcpy or cloudflared processes.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config.STATE_DB_PATH
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.lock_dir = os.path.join(os.path.dirname(self.path), 'locks')
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._local = threading.local()
+        self._held = {}
+        self._held_lock = threading.Lock()
+        with self._conn() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS processes ('
+                'name TEXT PRIMARY KEY, pid INTEGER, start_ticks INTEGER, owner_pid INTEGER, '
+                'start_time REAL, meta TEXT)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS kv ('
+                'key TEXT PRIMARY KEY, value TEXT, updated_at REAL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS process_logs ('
+                'name TEXT, seq INTEGER, time REAL, stream TEXT, line TEXT, PRIMARY KEY (name, seq))'
+            )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        # SQLite connections must not cross a fork (e.g. gunicorn --preload).
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA busy_timeout=5000')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def execute(self, sql, params=()):
+        """Run one statement on this thread's connection (autocommit)."""
+        return self._conn().execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction; IMMEDIATE so concurrent writers queue instead of failing."""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    # ------------------------------------------------------------------
+    # Cross-process locks
+    # ------------------------------------------------------------------
+    def _lock_path(self, name):
+        return os.path.join(self.lock_dir, name.replace('/', '_') + '.lock')
+
+    @contextmanager
+    def lock(self, name):
+        """Exclusive lock across all worker processes (and threads) for `name`."""
+        with open(self._lock_path(name), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def try_acquire(self, name):
+        """
+        Try to take a long-lived lock without blocking (e.g. for leader election).
+
+        The lock is held until release() or until this process exits.
+        """
+        with self._held_lock:
+            if name in self._held:
+                return True
+            f = open(self._lock_path(name), 'w')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+            self._held[name] = f
+            return True
+
+    def release(self, name):
+        with self._held_lock:
+            f = self._held.pop(name, None)
+        if f:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    # ------------------------------------------------------------------
+    # Key/value state
+    # ------------------------------------------------------------------
+    def get(self, key, default=None):
+        row = self._conn().execute('SELECT value FROM kv WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def get_if_newer(self, key, updated_after):
+        """
+        Return (value, updated_at) if `key` changed after `updated_after`, else (None, updated_after).
+
+        Lets pollers skip decoding values they have already seen.
+        """
+        row = self._conn().execute(
+            'SELECT value, updated_at FROM kv WHERE key = ? AND updated_at > ?', (key, updated_after)
+        ).fetchone()
+        if not row:
+            return None, updated_after
+        return json.loads(row[0]), row[1]
+
+    def put(self, key, value):
+        self._conn().execute(
+            'INSERT INTO kv (key, value, updated_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at',
+            (key, json.dumps(value), time.time())
+        )
+
+    def delete(self, key):
+        self._conn().execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    # ------------------------------------------------------------------
+    # Process registry
+    # ------------------------------------------------------------------
+    def register_process(self, name, pid, start_time, meta=None):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO processes (name, pid, start_ticks, owner_pid, start_time, meta) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (name, pid, proc_start_ticks(pid), os.getpid(), start_time, json.dumps(meta or {}))
+        )
+
+    def unregister_process(self, name, pid=None):
+        if pid is None:
+            self._conn().execute('DELETE FROM processes WHERE name = ?', (name,))
+        else:
+            self._conn().execute('DELETE FROM processes WHERE name = ? AND pid = ?', (name, pid))
+
+    def get_process(self, name):
+        """Return the registration for `name` if that process is still alive, else None."""
+        row = self._conn().execute(
+            'SELECT name, pid, start_ticks, owner_pid, start_time, meta FROM processes WHERE name = ?',
+            (name,)
+        ).fetchone()
+        if not row:
+            return None
+        entry = {
+            'name': row[0],
+            'pid': row[1],
+            'start_ticks': row[2],
+            'owner_pid': row[3],
+            'start_time': row[4],
+            'meta': json.loads(row[5] or '{}')
+        }
+        if not pid_alive(entry['pid'], entry['start_ticks']):
+            self.unregister_process(name, entry['pid'])
+            return None
+        return entry
+
+    def all_processes(self):
+        names = [row[0] for row in self._conn().execute('SELECT name FROM processes').fetchall()]
+        return {name: entry for name in names if (entry := self.get_process(name))}
+
+    def terminate_process(self, name, timeout=5):
+        """Stop a process registered by another worker: SIGTERM, then SIGKILL."""
+        entry = self.get_process(name)
+        if not entry:
+            return False
+        pid = entry['pid']
+        # Tells the owning worker's supervisor that this exit is intentional.
+        self.put(f"stop-requested:{name}", pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+            deadline = time.time() + timeout
+            delay = 0.01
+            while pid_alive(pid, entry['start_ticks']) and time.time() < deadline:
+                time.sleep(delay)
+                delay = min(delay * 2, 0.25)
+            if pid_alive(pid, entry['start_ticks']):
+                os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.unregister_process(name, pid)
+        return True
+
+    # ------------------------------------------------------------------
+    # Process output
+    # ------------------------------------------------------------------
+    def append_log(self, name, seq, stream, line, keep):
+        """Store one output line of a managed process, keeping about its last `keep` lines."""
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO process_logs (name, seq, time, stream, line) VALUES (?, ?, ?, ?, ?)',
+            (name, seq, time.time(), stream, line)
+        )
+        # Trimming after every line would double the writes.
+        if seq % 100 == 0:
+            conn.execute('DELETE FROM process_logs WHERE name = ? AND seq <= ?', (name, seq - keep))
+
+    def last_log_seq(self, name):
+        row = self._conn().execute('SELECT MAX(seq) FROM process_logs WHERE name = ?', (name,)).fetchone()
+        return row[0] or 0
+
+    def read_logs(self, name, stream=None, since=0, tail=None, limit=None):
+        """
+        Stored output of a process as (seq, time, stream, line) tuples, oldest first.
+
+        Either the last `tail` lines, or at most `limit` lines after `since`.
+        """
+        where, params = 'name = ?', [name]
+        if stream:
+            where += ' AND stream = ?'
+            params.append(stream)
+        columns = 'SELECT seq, time, stream, line FROM process_logs'
+        if tail:
+            rows = self._conn().execute(
+                f'{columns} WHERE {where} ORDER BY seq DESC LIMIT ?', (*params, tail)
+            ).fetchall()
+            return [tuple(row) for row in reversed(rows)]
+        rows = self._conn().execute(
+            f'{columns} WHERE {where} AND seq > ? ORDER BY seq LIMIT ?', (*params, since, limit or -1)
+        ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def log_stats(self, name):
+        """Per stream: stored line count and the first and last sequence numbers."""
+        rows = self._conn().execute(
+            'SELECT stream, COUNT(*), MIN(seq), MAX(seq) FROM process_logs WHERE name = ? GROUP BY stream', (name,)
+        ).fetchall()
+        return {stream: {'lines': count, 'first_seq': first, 'last_seq': last} for stream, count, first, last in rows}
+
+
+# Shared store used by the process manager and the device registry.
+state_store = StateStore()
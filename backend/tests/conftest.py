@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# The backend modules read their configuration at import time, so set it up
+# before any test imports them: a throwaway runtime directory and no
+# background loops.
+os.environ.setdefault('MAGDROID_RUNTIME_DIR', tempfile.mkdtemp(prefix='magdroid-tests-'))
+os.environ.setdefault('RECONCILE_INTERVAL', '0')
+os.environ.setdefault('HEALTH_MONITOR_ENABLED', '0')
+os.environ.setdefault('MDNS_REFRESH_INTERVAL', '86400')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from device_scheduler import BULK, HEALTH, INTERACTIVE, DeviceScheduler
+
+
+@pytest.fixture
+def scheduler():
+    # 8 workers: bulk may use 4, health and bulk together 6, interactive all 8.
+    return DeviceScheduler(workers=8, reserved_interactive=2, reserved_health=2)
+
+
+def saturate(scheduler, priority, count, release):
+    started = []
+    for i in range(count):
+        scheduler.submit(f'{priority}-{i}', lambda i=i: (started.append(i), release.wait(10)), priority)
+    return started
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_interactive_starts_while_bulk_and_health_saturate(scheduler):
+    release = threading.Event()
+    try:
+        saturate(scheduler, BULK, 20, release)
+        saturate(scheduler, HEALTH, 20, release)
+        running = lambda: scheduler.status()['running']
+        wait_until(lambda: running()['health'] + running()['bulk'] == 6)
+        # Neither class may take the workers held back for interactive tasks.
+        time.sleep(0.1)
+        assert running()['health'] + running()['bulk'] == 6
+        assert running()['bulk'] <= 4
+
+        start = time.monotonic()
+        assert scheduler.submit('phone', lambda: 'clicked', INTERACTIVE).result(timeout=1) == 'clicked'
+        assert time.monotonic() - start < 0.5
+    finally:
+        release.set()
+
+
+def test_health_starts_while_bulk_saturates(scheduler):
+    release = threading.Event()
+    try:
+        saturate(scheduler, BULK, 20, release)
+        wait_until(lambda: scheduler.status()['running']['bulk'] == 4)
+        assert scheduler.submit('probe', lambda: 'ok', HEALTH).result(timeout=1) == 'ok'
+    finally:
+        release.set()
+
+
+def test_one_task_per_device_in_priority_order(scheduler):
+    release = threading.Event()
+    order = []
+    try:
+        first = scheduler.submit('phone', lambda: release.wait(10), BULK)
+        wait_until(lambda: scheduler.status()['busy_devices'] == 1)
+        futures = [
+            scheduler.submit('phone', lambda: order.append('bulk'), BULK),
+            scheduler.submit('phone', lambda: order.append('health'), HEALTH),
+            scheduler.submit('phone', lambda: order.append('interactive'), INTERACTIVE)
+        ]
+        release.set()
+        first.result(timeout=5)
+        for future in futures:
+            future.result(timeout=5)
+        assert order == ['interactive', 'health', 'bulk']
+    finally:
+        release.set()
+
+
+def test_nested_call_on_another_device_holds_it(scheduler):
+    active, overlaps = [], []
+
+    def connect():
+        if active:
+            overlaps.append(True)
+        active.append(True)
+        time.sleep(0.05)
+        active.pop()
+
+    # A pool of two workers must not deadlock when every task nests a call.
+    small = DeviceScheduler(workers=2, reserved_interactive=0, reserved_health=0)
+    futures = [small.submit(f'usb{i}', lambda: small.run('10.0.0.5:5555', connect), BULK) for i in range(4)]
+    futures.append(small.submit('10.0.0.5:5555', connect, HEALTH))
+    for future in futures:
+        future.result(timeout=5)
+    assert not overlaps
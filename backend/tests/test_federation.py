@@ -0,0 +1,142 @@
+"""
+Federation across several local backend instances on different ports.
+
+Two "racks" serve overlapping emulated fleets (benchmarks.fleet), and a
+third instance aggregates them through PEERS.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+import requests
+
+from benchmarks.fleet import FLEET_RANGE, FleetServer, device_addresses
+from benchmarks.run import BACKEND_DIR, SERVE, free_port
+from federation import Peer
+
+
+class Instance:
+    """One backend in a child process, with its own runtime directory and fake ADB server."""
+
+    def __init__(self, devices, **env):
+        self.port = free_port()
+        self.fleet = FleetServer(devices).start()
+        self.env = {
+            **os.environ,
+            'MAGDROID_RUNTIME_DIR': tempfile.mkdtemp(prefix='magdroid-federation-'),
+            'ADB_SERVER_PORT': str(self.fleet.port),
+            'ADB_USE_SUBPROCESS': '0',
+            'DEVICES_RANGE': FLEET_RANGE,
+            'RECONCILE_INTERVAL': '0',
+            'HEALTH_MONITOR_ENABLED': '0',
+            'MDNS_REFRESH_INTERVAL': '86400',
+            'PROPERTY_WAIT': '0',
+            'PROCESS_LOG_ECHO': '0',
+            **env
+        }
+        self.process = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', SERVE, str(self.port)],
+            cwd=BACKEND_DIR, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(f"{self.url}/health", timeout=1)
+                return self
+            except requests.RequestException:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    self.stop()
+                    raise RuntimeError(f"backend on port {self.port} did not start")
+                time.sleep(0.1)
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.fleet.shutdown()
+        self.fleet.server_close()
+
+
+@pytest.fixture
+def cluster():
+    racks = {'rack1': Instance(3), 'rack2': Instance(5)}
+    peers = ','.join(f"{name}={rack.url}|2" for name, rack in racks.items())
+    aggregator = Instance(0, PEERS=peers, FEDERATION_CACHE_TTL='0', PEER_BACKOFF='60')
+    started = []
+    try:
+        for instance in (*racks.values(), aggregator):
+            started.append(instance.start())
+        yield racks, aggregator
+    finally:
+        for instance in started:
+            instance.stop()
+
+
+def get(instance, path):
+    response = requests.get(instance.url + path, timeout=10)
+    return response.status_code, response.json()
+
+
+def test_devices_are_merged_and_tagged_by_host(cluster):
+    racks, aggregator = cluster
+    status, body = get(aggregator, '/federation/devices?state=device')
+
+    assert status == 200
+    assert body['degraded'] == []
+    assert {name: host['count'] for name, host in body['hosts'].items()} == {'rack1': 3, 'rack2': 5}
+    assert sorted((d['host'], d['serial']) for d in body['devices']) == sorted(
+        [('rack1', a) for a in device_addresses(3)] + [('rack2', a) for a in device_addresses(5)]
+    )
+    # Both fleets start at the same address, so the first three are reported twice.
+    assert body['duplicates'] == {a: ['rack1', 'rack2'] for a in device_addresses(3)}
+
+
+def test_failed_peer_degrades_to_stale_data(cluster):
+    racks, aggregator = cluster
+    get(aggregator, '/federation/devices')
+    racks['rack2'].stop()
+
+    status, body = get(aggregator, '/federation/devices')
+    assert status == 200
+    assert body['degraded'] == ['rack2']
+    assert body['hosts']['rack1']['ok'] and not body['hosts']['rack1']['stale']
+    assert body['hosts']['rack2']['stale'] and body['hosts']['rack2']['error']
+    assert {d['serial'] for d in body['devices'] if d['host'] == 'rack2'} == set(device_addresses(5))
+    assert all(d['stale'] for d in body['devices'] if d['host'] == 'rack2')
+
+    # The dead peer is now skipped instead of costing a timeout per request.
+    _, body = get(aggregator, '/federation/devices')
+    assert body['hosts']['rack2']['error'].startswith('skipped after 1 failure(s)')
+    _, peers = get(aggregator, '/federation/peers')
+    rack2 = next(p for p in peers['peers'] if p['name'] == 'rack2')
+    assert rack2['failures'] == 1 and rack2['backing_off']
+
+
+def test_unchanged_listing_is_revalidated_with_its_etag(cluster):
+    racks, _ = cluster
+    peer = Peer('rack1', racks['rack1'].url, 2)
+    statuses = []
+    peer.session.hooks['response'].append(lambda response, **kwargs: statuses.append(response.status_code))
+
+    first = peer.get('/devices')
+    # A recovered peer answering 304 is healthy again.
+    peer.failures = 3
+    second = peer.get('/devices')
+
+    assert statuses == [200, 304]
+    assert first['ok'] and second['ok'] and not second['stale']
+    assert second['data'] == first['data']
+    assert peer.failures == 0 and peer.last_ok is not None
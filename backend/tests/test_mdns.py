@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+import mdns
+from adb_client import AdbClient
+from benchmarks.fleet import device_addresses
+from benchmarks.run import STUB_BIN
+from mdns import MdnsCache, parse_mdns_output
+from state_store import StateStore
+
+
+class Clock:
+    """Stands in for the time module inside mdns.py."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(mdns, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def stub_adb(monkeypatch):
+    """The benchmarks' stub `adb` on PATH, advertising BENCH_ADB_MDNS services."""
+    monkeypatch.setenv('PATH', STUB_BIN + os.pathsep + os.environ.get('PATH', ''))
+    monkeypatch.setenv('BENCH_ADB_DEVICES', '3')
+    return AdbClient(use_subprocess=True, query_cache_ttl=0)
+
+
+@pytest.fixture
+def cache(stub_adb, clock, tmp_path):
+    return MdnsCache(adb=stub_adb, store=StateStore(str(tmp_path / 'state.db')), ttl=30, refresh_interval=5)
+
+
+def test_parse_skips_header_and_lines_without_an_address():
+    output = (
+        "List of discovered mdns services\n"
+        "adb-A1\t_adb._tcp.\t192.168.1.41:5555\n"
+        "adb-B2\t_adb-tls-connect._tcp.\t192.168.1.42:37123\n"
+        "adb-C3\t_adb._tcp.\tnot-an-address\n"
+        "\n"
+    )
+    assert parse_mdns_output(output) == [
+        {'name': 'adb-A1', 'service': '_adb._tcp', 'ip': '192.168.1.41', 'port': 5555,
+         'address': '192.168.1.41:5555'},
+        {'name': 'adb-B2', 'service': '_adb-tls-connect._tcp', 'ip': '192.168.1.42', 'port': 37123,
+         'address': '192.168.1.42:37123'}
+    ]
+
+
+def test_services_from_the_stub_adb(cache, clock):
+    entries = cache.services()
+
+    assert [(e['name'], e['service'], e['ip'], e['port'], e['address']) for e in entries] == [
+        (f"adb-bench{i:05d}", '_adb._tcp', address.rpartition(':')[0], 5555, address)
+        for i, address in enumerate(device_addresses(3))
+    ]
+    assert all(e['first_seen'] == e['last_seen'] == clock.now for e in entries)
+    assert all(e['expires_at'] == clock.now + 30 for e in entries)
+
+
+def test_services_expire_after_the_ttl(cache, clock, monkeypatch):
+    cache.refresh()
+    first_seen = clock.now
+
+    # Two devices stop advertising; they are kept through short gaps...
+    monkeypatch.setenv('BENCH_ADB_MDNS', '1')
+    clock.sleep(20)
+    cache.refresh()
+    entries = {e['name']: e for e in cache.services()}
+    assert sorted(entries) == ['adb-bench00000', 'adb-bench00001', 'adb-bench00002']
+    assert entries['adb-bench00000']['first_seen'] == first_seen
+    assert entries['adb-bench00000']['last_seen'] == clock.now
+    assert entries['adb-bench00001']['expires_at'] == first_seen + 30
+
+    # ...and dropped once the TTL has passed since they were last seen.
+    clock.sleep(15)
+    cache.refresh()
+    assert [e['name'] for e in cache.services()] == ['adb-bench00000']
+
+
+def test_stale_cache_is_refreshed_inline(cache, clock, monkeypatch):
+    assert len(cache.services()) == 3
+
+    monkeypatch.setenv('BENCH_ADB_MDNS', '2')
+    clock.sleep(5)
+    assert len(cache.services()) == 3
+    # Older than twice the refresh interval: the next read asks adb again.
+    clock.sleep(6)
+    assert len(cache.services()) == 3
+    clock.sleep(30)
+    assert len(cache.services()) == 2
@@ -0,0 +1,95 @@
+"""Two ProcessManagers on one state store stand in for two gunicorn workers."""
+import sys
+import time
+
+import pytest
+
+from process_manager import ProcessManager
+from state_store import StateStore
+
+
+@pytest.fixture
+def workers(tmp_path):
+    store = StateStore(str(tmp_path / 'state.db'))
+    owner, other = ProcessManager(store=store), ProcessManager(store=store)
+    yield owner, other
+    for name in list(owner.processes):
+        owner.stop_process(name)
+
+
+def script(source):
+    return [sys.executable, '-u', '-c', source]
+
+
+def line_count(manager, name):
+    logs = manager.get_logs(name)
+    return len(logs['lines']) if logs else 0
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_logs_are_served_by_any_worker(workers):
+    owner, other = workers
+    owner.start_process('talker', script(
+        "import sys, time\n"
+        "for i in range(5): print(f'out {i}'); print(f'err {i}', file=sys.stderr)\n"
+        "time.sleep(30)\n"
+    ), capture_output=True)
+    wait_for(lambda: line_count(owner, 'talker') == 10)
+
+    local, shared = owner.get_logs('talker'), other.get_logs('talker')
+    assert shared['lines'] == local['lines']
+    assert shared['next'] == local['next'] == local['lines'][-1]['seq']
+    assert sorted(l['line'] for l in shared['lines']) == sorted([f'out {i}' for i in range(5)] +
+                                                                [f'err {i}' for i in range(5)])
+    assert shared['buffers']['stderr']['lines'] == 5
+
+    assert [l['line'] for l in other.get_logs('talker', stream='stdout', tail=2)['lines']] == ['out 3', 'out 4']
+    page = other.get_logs('talker', since=local['lines'][3]['seq'], limit=4)
+    assert [l['seq'] for l in page['lines']] == [l['seq'] for l in local['lines'][4:8]]
+    assert page['next'] == local['lines'][7]['seq']
+    assert other.get_logs('unknown') is None
+
+
+def test_readiness_is_seen_by_other_workers(workers):
+    owner, other = workers
+    owner.start_process('slow', script("import time; time.sleep(0.3); print('listening'); time.sleep(30)"),
+                        capture_output=True, ready_pattern='listening')
+    start = time.monotonic()
+    assert other.wait_until_ready('slow', timeout=10)
+    assert time.monotonic() - start >= 0.2
+    assert owner.get_process_info('slow')['time_to_ready'] is not None
+
+
+def test_restart_is_skipped_when_another_worker_started_it(workers):
+    owner, other = workers
+    owner.start_process('crasher', script("raise SystemExit(1)"), restart_policy='on-failure')
+    old_info = owner.processes['crasher']
+    old_info['process'].wait()
+    # The restart timer is still backing off when another worker starts it again.
+    wait_for(lambda: not owner.store.get_process('crasher'))
+    assert other.start_process('crasher', script("import time; time.sleep(30)"))
+
+    owner._restart('crasher', old_info, 1)
+    assert owner.processes['crasher'] is old_info
+    assert owner.store.get_process('crasher')['pid'] == other.processes['crasher']['process'].pid
+    other.stop_process('crasher')
+
+
+def test_sequence_continues_across_workers(workers):
+    owner, other = workers
+    owner.start_process('once', script("print('first run')"), capture_output=True)
+    wait_for(lambda: line_count(owner, 'once') == 1)
+    owner.processes['once']['process'].wait()
+    wait_for(lambda: not owner.is_process_running('once'))
+
+    other.start_process('once', script("print('second run')"), capture_output=True)
+    wait_for(lambda: line_count(owner, 'once') == 2)
+    lines = other.get_logs('once')['lines']
+    assert [l['line'] for l in lines] == ['first run', 'second run']
+    assert lines[1]['seq'] > lines[0]['seq']
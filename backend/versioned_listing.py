@@ -0,0 +1,121 @@
+import hashlib
+import json
+
+import config
+from state_store import state_store
+
+
+def digest(value):
+    """Stable content hash of any JSON-serialisable value."""
+    return hashlib.sha1(json.dumps(value, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class VersionedListing:
+    """
+    A keyed listing (devices, mDNS services, ...) with a version cursor.
+
+    Every call to update() compares the current items with the last recorded
+    ones; if anything changed the version goes up by one and each added or
+    changed item, and each removed key, is stamped with the new version. That
+    lets clients poll with ?since=<version> and receive only what changed.
+
+    Versions live in the shared state store, so every worker process hands out
+    the same versions and ETags. Removed keys are remembered for
+    `tombstones` versions; a cursor older than that gets a full listing.
+    """
+
+    def __init__(self, name, store=None, tombstones=None):
+        self.name = name
+        self.store = store or state_store
+        self.tombstones = tombstones or config.LISTING_TOMBSTONE_VERSIONS
+        # (digest, version) last written or confirmed by this worker.
+        self._last = None
+        self.store.execute(
+            'CREATE TABLE IF NOT EXISTS listing_meta ('
+            'listing TEXT PRIMARY KEY, version INTEGER, digest TEXT, horizon INTEGER)'
+        )
+        self.store.execute(
+            'CREATE TABLE IF NOT EXISTS listing_items ('
+            'listing TEXT, key TEXT, digest TEXT, version INTEGER, removed INTEGER, item TEXT, '
+            'PRIMARY KEY (listing, key))'
+        )
+        self.store.execute('CREATE INDEX IF NOT EXISTS listing_items_version ON listing_items (listing, version)')
+
+    def _meta(self, conn=None):
+        row = (conn or self.store).execute(
+            'SELECT version, digest, horizon FROM listing_meta WHERE listing = ?', (self.name,)
+        ).fetchone()
+        return row or (0, None, 0)
+
+    def update(self, items):
+        """
+        Record the current items (a dict of key -> JSON-serialisable item).
+
+        Returns:
+            tuple: (version, content digest) after the update.
+        """
+        item_digests = {key: digest(item) for key, item in items.items()}
+        content = digest(sorted(item_digests.items()))
+
+        # Fast path: nothing changed since this worker last looked.
+        if self._last and self._last[0] == content:
+            version, current, _ = self._meta()
+            if current == content:
+                self._last = (content, version)
+                return version, content
+
+        with self.store.transaction() as conn:
+            version, current, horizon = self._meta(conn)
+            if current != content:
+                version += 1
+                stored = dict(conn.execute(
+                    'SELECT key, digest FROM listing_items WHERE listing = ? AND removed = 0', (self.name,)
+                ).fetchall())
+                for key, item_digest in item_digests.items():
+                    if stored.get(key) != item_digest:
+                        conn.execute(
+                            'INSERT OR REPLACE INTO listing_items (listing, key, digest, version, removed, item) '
+                            'VALUES (?, ?, ?, ?, 0, ?)',
+                            (self.name, key, item_digest, version, json.dumps(items[key]))
+                        )
+                for key in stored.keys() - item_digests.keys():
+                    conn.execute(
+                        'UPDATE listing_items SET removed = 1, digest = NULL, item = NULL, version = ? '
+                        'WHERE listing = ? AND key = ?',
+                        (version, self.name, key)
+                    )
+                # Forget old tombstones; cursors from before them need a full listing.
+                cutoff = version - self.tombstones
+                if cutoff > horizon:
+                    conn.execute(
+                        'DELETE FROM listing_items WHERE listing = ? AND removed = 1 AND version <= ?',
+                        (self.name, cutoff)
+                    )
+                    horizon = cutoff
+                conn.execute(
+                    'INSERT OR REPLACE INTO listing_meta (listing, version, digest, horizon) VALUES (?, ?, ?, ?)',
+                    (self.name, version, content, horizon)
+                )
+        self._last = (content, version)
+        return version, content
+
+    def changes(self, since):
+        """
+        Items changed after version `since`.
+
+        Returns:
+            dict: 'version', 'full' (True if the cursor was too old and
+                  'changed' holds every item), 'changed' (list of items) and
+                  'removed' (list of keys).
+        """
+        version, _, horizon = self._meta()
+        if since >= version:
+            return {'version': version, 'full': False, 'changed': [], 'removed': []}
+        full = since < horizon
+        rows = self.store.execute(
+            'SELECT key, item, removed FROM listing_items WHERE listing = ? AND version > ? ORDER BY key',
+            (self.name, -1 if full else since)
+        ).fetchall()
+        changed = [json.loads(item) for _, item, removed in rows if not removed]
+        removed = [] if full else [key for key, _, is_removed in rows if is_removed]
+        return {'version': version, 'full': full, 'changed': changed, 'removed': removed}
@@ -13,11 +13,34 @@ const Index = () => {
   const [publicUrl, setPublicUrl] = useState("");
   const [notification, setNotification] = useState({ message: "", type: "" as "success" | "error" | "info" | "" });
 
+  // Long operations run as backend jobs: ask for the job id (async=1) and poll it,
+  // so no backend worker is held for the whole operation.
+  const waitForJob = async (jobId: string, buttonId: string) => {
+    let offset = 0;
+    let output = "";
+    while (true) {
+      const response = await fetch(`${import.meta.env.VITE_BACKEND_API_URL}/jobs/${jobId}?since=${offset}`);
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      const { job } = await response.json();
+      if (job.lines?.length) {
+        output += job.lines.join("\n") + "\n";
+        setLog(`[${new Date().toLocaleTimeString()}] ${buttonId}: RUNNING\n\n${output}`);
+      }
+      offset = job.offset ?? offset;
+      if (job.status === "succeeded" || job.status === "failed") {
+        return job.result ?? { status: "error", output: job.error || "", details: job.error || "Job failed" };
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  };
+
   const handleApiCall = async (endpoint: string, buttonId: string, body: object | null = null) => {
     setLoading((prev) => ({ ...prev, [buttonId]: true }));
     setLog(`[${new Date().toLocaleTimeString()}] Starting ${buttonId}...`);
 
-    const apiUrl = `${import.meta.env.VITE_BACKEND_API_URL}${endpoint}`;
+    const apiUrl = `${import.meta.env.VITE_BACKEND_API_URL}${endpoint}${endpoint.includes("?") ? "&" : "?"}async=1`;
     console.log(`Fetching: ${apiUrl}`, body);
 
     try {
@@ -33,7 +56,10 @@ const Index = () => {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      const data = await response.json();
+      let data = await response.json();
+      if (response.status === 202 && data.job_id) {
+        data = await waitForJob(data.job_id, buttonId);
+      }
 
       // Format log output based on response structure
       const timestamp = new Date().toLocaleTimeString();